@@ -21,13 +21,42 @@
 # Imports
 import sys
 import os
+import argparse
+import json
 import logging
+from logging.handlers import RotatingFileHandler
 import time
 import xml.etree.ElementTree as ET
 import re
+import bisect
+import heapq
+import itertools
+import math
 import random
+import threading
+import queue
+import asyncio
+import contextlib
+import atexit
+import sqlite3
+import mmap
+import struct
+import hashlib
+import gzip
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from urllib3.exceptions import NewConnectionError
 import yaml
+try:
+    import aiohttp # Optional, used by the asyncio runtime
+except ImportError:
+    aiohttp = None
 
 # Global Constants
 VERSION = "0.0.2"
@@ -36,7 +65,98 @@ REQUESTS_HEADER = {"User-Agent": USERAGENT}
 PWD = os.getcwd()
 RECRUITMENT_TELEGRAM_RATELIMIT = 180 # 3 minutes
 NONRECRUITMENT_TELEGRAM_RATELIMIT = 30 # 30 seconds
-REQ_TIMEOUT = 10
+API_RATELIMIT_REQUESTS = 45 # The API allows 50 requests per 30 seconds, keep some headroom
+API_RATELIMIT_PERIOD = 30
+LOG_FILE = "headlessNSPythonRecruiter.log"
+LOG_CAPACITY = 1000 # Messages kept in memory per level for the menu
+LOG_MAX_BYTES = 10485760 # 10 MiB, the log file is rotated past this
+LOG_BACKUPS = 5 # Rotated log files kept
+STREAM_CHUNK_SIZE = 8192 # Bytes of a happenings response parsed at a time
+API_URL = "https://www.nationstates.net/cgi-bin/api.cgi" # Base URL, configurable to go through a cache, mirror or stand-in
+API_TRANSPORT = "auto" # aiohttp for the asyncio runtime when it is installed, requests otherwise
+API_FIXTURE_FILE = "api_fixture.json" # Recorded responses of the fixture transport
+API_TIMEOUTS = { # Seconds per endpoint
+    "default": 10,
+    "happenings": 10,
+    "tgcanrecruit": 5,
+    "tgcancampaign": 5,
+    "sendTG": 15,
+}
+API_POOL_SIZE = 10 # Connections kept alive to the API
+API_RETRIES = 3 # Retries of requests that failed to connect
+API_BACKOFF = 0.5 # Seconds, doubled on every retry
+RETRY_BASE_DELAY = 5 # Seconds before retrying a failed happenings request, doubled on every failure
+RETRY_MAX_DELAY = 600 # 10 minutes, the longest wait between retries
+IDLE_DELAY = 30 # Seconds to wait for candidates pushed from the stream when no feed is polled
+STREAM_URL = "https://www.nationstates.net/api" # Server-sent events of the happenings, empty disables push discovery
+STREAM_TIMEOUT = 120 # Seconds without an event before the stream is assumed dead and reconnected
+STREAM_RECONNECT_DELAY = 1 # Seconds before reconnecting a dropped stream, doubled while it keeps failing
+STREAM_MAX_RECONNECT_DELAY = 120 # 2 minutes, the longest wait between reconnects while the feeds are polled instead
+TELEGRAM_MAX_ATTEMPTS = 5 # Attempts to send a telegram that keeps getting rate limited
+NONEXISTENT_PATTERN = r"no such nation|unknown nation|nation not found" # sendTG answers about a recipient that does not exist
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = None # /metrics is off unless given a port, 0 picks a free one and logs it
+METRICS_SNAPSHOT_FILE = "metrics.json"
+METRICS_SNAPSHOT_INTERVAL = 60 # Seconds between JSON snapshots, 0 disables them
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 180) # Seconds
+STATUS_INTERVAL = 60 # Seconds between status reports of the asyncio runtime
+COMPACT_INTERVAL = 3600 # Seconds between compacting the sent history and eligibility cache when they need it
+PREFETCH_SIZE = 2 # Vetted targets kept ready for sending
+PREFETCH_MAX_AGE = 300 # 5 minutes, older prefetched targets are dropped
+PREFETCH_RETRY_DELAY = 30 # Seconds the prefetcher waits after a failed discovery
+SEND_RETRY_DELAY = 30 # Seconds a sending lane waits after an unexpected error
+CANDIDATE_MAX_AGE = 3600 # 1 hour, older candidates have likely been recruited by someone else and are dropped
+CANDIDATE_HALF_LIFE = 600 # 10 minutes, the age at which a candidate is assumed half as likely to join
+POLL_BUDGET = 4 # Happenings requests per minute shared by the polled feeds
+POLL_MIN_INTERVAL = 10 # Seconds, the shortest wait between polls of a feed however busy it is
+POLL_MAX_INTERVAL = 300 # 5 minutes, the longest wait between polls of a feed however quiet it is
+POLL_RATE_HALF_LIFE = 1800 # 30 minutes, the age at which an event counts half towards the estimated rate of its source
+HISTORY_FILE = "sent_history.log"
+HISTORY_INDEX_FILE = "sent_history.idx" # Sorted index of the history, so startup only replays the log written after it
+HISTORY_INDEX_MIN_TAIL = 1000 # Nations added since the index was written before a checkpoint rewrites it
+SKIPPED_TTL = 600 # 10 minutes, candidates that failed the checks are not looked at again for this long
+CHECKPOINT_FILE = "checkpoint.json"
+CHECKPOINT_INTERVAL = 30 # Seconds between checkpoints, besides the one after every telegram
+INDIVIDUAL_NATIONS_FILE = "individual_nations.txt" # One nation per line, messaged once each besides those listed in config.yml
+BLOCKED_NATIONS_FILE = "blocked_nations.txt" # One nation per line, never messaged besides those listed in config.yml
+RECIPIENTS_RELOAD_INTERVAL = 10 # Seconds between checks whether config.yml or the nation files changed
+RECIPIENTS_LISTED = 20 # Longer recipient lists are summarised on the confirmation screen
+NATION_DUMP_URL = "https://www.nationstates.net/pages/nations.xml.gz" # Daily dump of every nation
+NATION_DUMP_FILE = "nations.xml.gz"
+NATION_INDEX_FILE = "nations.idx" # Sorted index of the dump, looked up through a memory map
+NATION_INDEX_RUN = 65536 # Nations sorted in memory at a time while indexing, the runs are merged from disk
+NATION_INDEX_RELOAD_INTERVAL = 60 # Seconds between checks whether the index was rebuilt or the dump is newer
+NATION_MAX_AGE_DAYS = 0 # Skip nations founded longer ago than this as of the dump, 0 keeps them all
+NATION_MAX_INACTIVE_DAYS = 0 # Skip nations that had not logged in for this long as of the dump, 0 keeps them all
+ELIGIBILITY_FILE = "eligibility_cache.log"
+ELIGIBILITY_WORKERS = 8 # Concurrent eligibility checks
+ELIGIBILITY_TTL = 600 # 10 minutes, recruitable nations are checked again after this
+ELIGIBILITY_NEGATIVE_TTL = 604800 # 7 days, nations that cannot be recruited are skipped this long
+SHARED_CACHE_FILE = "" # SQLite cache shared by the recruiters of this host, empty disables it
+SHARED_CACHE_HAPPENINGS_TTL = 15 # Seconds a fetched happenings page is served to every recruiter before it is fetched again
+SHARED_CACHE_LEASE_TTL = 30 # Seconds a recruiter may hold a fetch before another one takes over
+SHARED_CACHE_POLL = 0.25 # Seconds between looks at the cache while another recruiter fetches
+SHARED_CACHE_MAX_AGE = 86400 # 1 day, older happenings are dropped from the cache
+LEDGER_FILE = "ledger.sqlite" # Every candidate, skip and send attempt, see "python3 app.py ledger-stats"
+LEDGER_BATCH = 200 # Entries written per transaction
+LEDGER_FLUSH_INTERVAL = 5 # Seconds entries wait at most before they are written
+LEDGER_SOURCES = 4096 # Recent candidates whose source is remembered for their skips and sends
+
+# Built in candidate sources, name -> happenings filter, pattern capturing the nation, and the ratio weighting it
+TARGET_SOURCES = {
+    "founding": {"filter": "founding", "pattern": r"@@(.+?)@@ was founded", "ratio": "found"},
+    "refounding": {"filter": "founding", "pattern": r"@@(.+?)@@ was refounded", "ratio": "refound"},
+    "ejected": {"filter": "eject", "pattern": r"@@(.+?)@@ was ejected", "ratio": "ejected"},
+}
+
+# Nation name filters, rule -> patterns; a rule matches when any of its patterns is found in the name
+ROMAN_NUMERAL_PATTERN = r"(?:\b|_)(?=[MDCLXVI])M{0,4}(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})(?<=[MDCLXVI])(?:\b|_)"
+NAME_FILTERS = {
+    "bad_name": ["moderator", "reichs", "pedo", r"\btos\b"], # Likely to get No Such Nation errors and waste 180 seconds
+    "puppet": ["puppet", "bot", "farm", "card", "founder", "throwaway"], # Likely to get ignored
+    "number": ["[0-9]"],
+    "roman_numeral": [ROMAN_NUMERAL_PATTERN],
+}
 
 # Color Codes
 RED = "\033[31m"
@@ -56,7 +176,80 @@ logger = None
 telegram = None
 tg_target = 0
 tg_amt = 0
-tg_sent_history = [] # List of nations that have been sent telegram, will not be sent telegram until program restarts
+tg_sent_history = None # SentHistory of nations that have been sent telegram, persisted across restarts
+stats_lock = threading.Lock() # Guards tg_target and tg_amt, which several lanes update
+tg_claimed = set() # Nations prefetched for a telegram that has not been sent yet
+tg_skipped = None # RecentSkips of candidates that failed the checks, kept in memory only
+checkpoint = None
+candidate_queue = None
+scheduler = None
+api_client = None
+async_client = None
+metrics = None
+eligibility = None
+shared_cache = None
+ledger = None
+name_filter = None
+nation_index = None
+nation_index_lock = threading.Lock() # Held while the dump is indexed, so only one build writes the temporary index
+nation_index_attempted = None # (modification time in ns, size) of the dump indexed last, so a broken dump is not indexed over and over
+recipients = None
+
+# Clock
+class Clock():
+
+    """Source of time for the recruiter, replaced by a VirtualClock to simulate rate limits"""
+
+    def time(self):
+
+        """Wall clock time in seconds"""
+
+        return time.time()
+
+    def monotonic(self):
+
+        """Monotonic time in seconds"""
+
+        return time.monotonic()
+
+    def sleep(self, seconds):
+
+        """Sleep for the given seconds"""
+
+        time.sleep(seconds)
+
+
+class VirtualClock(Clock):
+
+    """Clock whose sleeps return at once and move simulated time forward instead"""
+
+    def __init__(self, start=None):
+
+        """Initialize VirtualClock, starting at the current time unless given"""
+
+        self.now = time.time() if start is None else start
+        self.lock = threading.Lock()
+
+    def time(self):
+
+        """Simulated wall clock time in seconds"""
+
+        return self.now
+
+    def monotonic(self):
+
+        """Simulated monotonic time in seconds"""
+
+        return self.now
+
+    def sleep(self, seconds):
+
+        """Advance simulated time by the sleep"""
+
+        with self.lock:
+            self.now += max(seconds, 0)
+
+clock = Clock()
 
 # GNU GPL v3.0 Boilerplates
 class GNU_GPL_v3_class():
@@ -143,12 +336,87 @@ def load_config():
         default_config = {
             "clientkey": "YOUR_CLIENT_KEY_HERE",
             "clientname": "YOUR_CLIENT_NAME_HERE",
+            "runtime": "threads", # or "asyncio" to run discovery and sending as tasks of one event loop
+            "metrics":{
+                "host": METRICS_HOST,
+                "port": METRICS_PORT,
+                "snapshot_file": METRICS_SNAPSHOT_FILE,
+                "snapshot_interval": METRICS_SNAPSHOT_INTERVAL,
+            },
+            "lanes": [], # Extra client keys and weighted telegrams, e.g. {"clientkey": ..., "telegrams": [{"file": "recruitment.yml", "weight": 1}]}
+            "api":{
+                "base_url": API_URL,
+                "transport": API_TRANSPORT, # "requests", "async" for aiohttp, or "fixture" to replay recorded responses
+                "fixture": API_FIXTURE_FILE,
+                "timeouts": dict(API_TIMEOUTS),
+                "pool_size": API_POOL_SIZE,
+                "retries": API_RETRIES,
+                "backoff": API_BACKOFF,
+            },
             "recruiting":{
                 "flag_FoundingRefounding": False,
                 "flag_Ejected": False,
                 "individual_nations": [],
                 "blocked_nations": [],
+                "recipients":{
+                    "individual_file": INDIVIDUAL_NATIONS_FILE, # Bulk lists, see "python3 app.py import-nations"
+                    "blocked_file": BLOCKED_NATIONS_FILE,
+                    "reload_interval": RECIPIENTS_RELOAD_INTERVAL,
+                },
                 "optimization": False,
+                "history":{
+                    "file": HISTORY_FILE,
+                    "index": HISTORY_INDEX_FILE, # Empty to always load the whole log
+                    "max_age_days": 0, # 0 keeps nations forever
+                },
+                "checkpoint":{
+                    "file": CHECKPOINT_FILE, # Empty disables checkpoints
+                    "interval": CHECKPOINT_INTERVAL,
+                },
+                "nation_index":{
+                    "file": NATION_INDEX_FILE, # Empty disables the index, see "python3 app.py index-nations"
+                    "dump": NATION_DUMP_FILE, # Indexed again in the background whenever a newer dump is found here
+                    "skip_regions": [], # Regions whose nations look like puppets, e.g. puppet storage regions
+                    "max_age_days": NATION_MAX_AGE_DAYS, # Skip nations founded longer ago than this as of the dump, 0 keeps them all
+                    "max_inactive_days": NATION_MAX_INACTIVE_DAYS, # Skip nations that had not logged in for this long as of the dump, 0 keeps them all
+                },
+                "eligibility":{
+                    "file": ELIGIBILITY_FILE,
+                    "workers": ELIGIBILITY_WORKERS,
+                    "ttl": ELIGIBILITY_TTL,
+                    "negative_ttl": ELIGIBILITY_NEGATIVE_TTL,
+                },
+                "shared_cache":{
+                    "file": SHARED_CACHE_FILE, # e.g. "/var/tmp/recruiter_cache.sqlite" in the config of every recruiter on the host
+                    "happenings_ttl": SHARED_CACHE_HAPPENINGS_TTL,
+                    "lease_ttl": SHARED_CACHE_LEASE_TTL,
+                },
+                "ledger":{
+                    "file": LEDGER_FILE, # Empty disables the ledger
+                    "batch": LEDGER_BATCH,
+                    "flush_interval": LEDGER_FLUSH_INTERVAL,
+                },
+                "prefetch":{
+                    "size": PREFETCH_SIZE,
+                    "max_age": PREFETCH_MAX_AGE,
+                },
+                "freshness":{
+                    "max_age": CANDIDATE_MAX_AGE,
+                    "half_life": CANDIDATE_HALF_LIFE,
+                    "weights": {}, # Source weights by name, e.g. {"ejected": 0.5}, overriding the ratio and the sources
+                },
+                "polling":{
+                    "budget": POLL_BUDGET, # Spent on the busiest feeds, each polled about every budget / sqrt(rate) minutes
+                    "min_interval": POLL_MIN_INTERVAL,
+                    "max_interval": POLL_MAX_INTERVAL,
+                    "rate_half_life": POLL_RATE_HALF_LIFE,
+                },
+                "stream":{
+                    "url": STREAM_URL, # Empty to only poll the happenings
+                    "timeout": STREAM_TIMEOUT,
+                },
+                "filters": NAME_FILTERS, # Name patterns per rule, nations matching any are skipped; {} turns the filter off
+                "sources": [], # Extra candidate sources, e.g. {"name": "movers", "filter": "move", "pattern": "@@(.+?)@@ relocated", "weight": 0.5}
                 "ratio":{
                     "found": 0.8,
                     "refound": 0.2,
@@ -171,13 +439,15 @@ class Logger():
 
     """Logger class to log messages to log file and display them to the user"""
 
-    def __init__(self):
+    def __init__(self, capacity=LOG_CAPACITY):
 
         """Initialize Logger"""
 
-        self.storage = []
+        self.capacity = capacity
+        self.storage = {} # level -> ring buffer of its most recent Logs
+        self.sequence = itertools.count()
         logging.basicConfig(
-            filename='headlessNSPythonRecruiter.log',
+            handlers=[RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")],
             level=logging.DEBUG,
             format='%(asctime)s %(levelname)s %(message)s')
         logging.debug("headlessNSPythonRecruiter v" + VERSION + " by Clarissa Au")
@@ -188,12 +458,12 @@ class Logger():
 
         """Display logs to user"""
 
-        for log in reversed(self.storage):
-            if log.level >= level:
-                print(log.message)
-                amount -= 1
-            if amount <= 0:
-                break
+        # Each ring is newest first when reversed, so merging them yields the newest logs overall first
+        rings = [reversed(ring) for ring_level, ring in list(self.storage.items()) if ring_level >= level]
+        newest = heapq.merge(*rings, key=lambda log: log.sequence, reverse=True)
+        for log in itertools.islice(newest, max(amount, 0)):
+            print(log.message)
+            amount -= 1
         while amount >= 0:
             print("")
             amount -= 1
@@ -202,596 +472,4184 @@ class Logger():
 
         """Log message to log file and display to user"""
 
-        self.storage.append(Log(level, message))
+        ring = self.storage.get(level)
+        if ring is None:
+            ring = self.storage.setdefault(level, deque(maxlen=self.capacity))
+        ring.append(Log(next(self.sequence), level, message))
 
 
 class Log():
 
     """Log class to store log messages"""
 
-    def __init__(self, level, message):
+    __slots__ = ("sequence", "level", "message")
+
+    def __init__(self, sequence, level, message):
 
         """Initialize a Log"""
 
+        self.sequence = sequence
         self.message = message
         self.level = level
         logging.log(level, message)
 
 
-# Display main menu
-def display():
+# Sent History Index
+class HistoryIndex():
 
-    """Display main menu"""
+    """Memory mapped index of the sent history as of a position in its log, sorted for binary search.
+    Records hold an 8 byte hash of the nation and the time it was added, so lookups never load the whole history."""
 
-    global choice
-    print("---------------------------------------------------------")
-    print("headlessNSPythonRecruiter v" + VERSION + " by Clarissa Au")
-    print("This program is licensed under GNU GPL v3.0 License")
-    print("---------------------------------------------------------")
-    logger.display(logging.INFO, 5)
-    print("---------------------------------------------------------")
-    print(f"Hello, {config['clientname']}!")
-    print("")
-    print("Configure [T]elegram")
-    print("[S]elect Recepients")
-    print("[R]ecruit")
-    print("[Q]uit")
-    print("")
-    choice = input("> ")
+    MAGIC = b"NSH1"
+    HEADER = struct.Struct("<4sQQQQ8s") # magic, records, log inode, log offset, dead log lines, hash of the log before the offset
+    RECORD = struct.Struct("<8sd") # nation hash, timestamp
 
-# Configure Telegram - Menu
-def configure_telegram_menu():
+    def __init__(self, path):
 
-    """Configure Telegram Menu"""
+        """Initialize HistoryIndex from an index file"""
 
-    while True:
-        print("---------------------------------------------------------")
-        print("Configure Telegram - Menu")
-        print("[S]elect Existing Telegram")
-        print("[C]reate New Telegram")
-        print("[D]elete Current Telegram")
-        print("[B]ack")
-        print("")
-        choice = input("> ")
-        match choice:
-            case "S":
-                select_telegram()
-                break
-            case "C":
-                create_telegram()
-                break
-            case "D":
-                delete_telegram()
-                break
-            case "B":
-                main()
-                break
-            case _:
-                print("Invalid choice. Please try again.")
+        self.path = path
+        with open(path, 'rb') as index_file:
+            self.map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.records, self.inode, self.offset, self.dead, self.boundary = self.HEADER.unpack_from(self.map, 0)
+        if magic != self.MAGIC or len(self.map) != self.HEADER.size + self.records * self.RECORD.size:
+            self.map.close()
+            raise ValueError(f"{path} is not a sent history index")
 
-# Configure Telegram - Select
-def select_telegram():
+    @staticmethod
+    def key(nation):
 
-    """Select Telegram Menu"""
+        """Hash of a nation, the sort key of the index"""
 
-    global telegram
-    print("---------------------------------------------------------")
-    print("Configure Telegram - Select")
-    print("Select a Telegram to use.")
-    print("")
-    telegram_folder = os.path.join(PWD, "telegrams")
-    if not os.path.exists(telegram_folder):
-        os.makedirs(telegram_folder)
-    for i in range(0,len(os.listdir(telegram_folder))):
-        print(f"{i}. {os.listdir(telegram_folder)[i]}")
-    choice = input("> ")
-    try:
-        with open(
-            os.path.join(
-                telegram_folder, os.listdir(telegram_folder)[int(choice)]), 'r', encoding="utf-8"
-            ) as telegram_file:
-            telegram = yaml.safe_load(telegram_file)
-            print(f"Telegram {os.listdir(telegram_folder)[int(choice)]} selected.")
-            logger.log(logging.INFO, f"Telegram {os.listdir(telegram_folder)[int(choice)]} selected.")
-    except FileNotFoundError:
-        print("File not found. Please try again.")
-        logger.log(logging.DEBUG, "File not found.")
-    except ValueError:
-        print("Invalid choice. Please try again.")
-        logger.log(logging.DEBUG, "Invalid choice.")
-    except IndexError:
-        print("No such Telegram exists. Please try again.")
-        logger.log(logging.DEBUG, "Invalid choice.")
-    except Exception as e:
-        print(f"Somehow an error has occured({e}). Please try again.")
-        logger.log(logging.DEBUG, e)
-    finally:
-        configure_telegram_menu()
+        return hashlib.blake2b(nation.encode("utf-8"), digest_size=8).digest()
 
-# Configure Telegram - Create
-def create_telegram():
+    @staticmethod
+    def boundary_of(log_file, offset):
 
-    """Create Telegram Menu"""
+        """Hash of the log bytes just before an offset, to tell whether a log still matches its index"""
 
-    global telegram
-    print("---------------------------------------------------------")
-    print("Configure Telegram - Create")
-    print("Create a new Telegram.")
-    print("")
-    telegram_folder = os.path.join(PWD, "telegrams")
-    if not os.path.exists(telegram_folder):
-        os.makedirs(telegram_folder)
-    print("Enter the Telegram's name.")
-    name = input("> ")
-    print("Enter the Telegram's TGID.")
-    tgid = input("> ")
-    print("Enter the Telegram's secret key.")
-    tgsecretkey = input("> ")
-    print("Enter the Type of the Telegram. [R]ecruitment/[N]on-Recruitment")
-    print(RED + "Warning: If you're recruiting, you must enter R." + RESET)
-    print("Failure to do so will result in Site API Ban.")
-    isrecruitment = input("> ")
-    print("Confirmation:")
-    print(f"Name: {name}")
-    print(f"TGID: {tgid}")
-    print(f"Secret Key: {tgsecretkey}")
-    if isrecruitment == "R":
-        isrecruitment = "Recruitment"
-        print("Type: Recruitment")
-    else:
-        isrecruitment = "Non-Recruitment"
-        print("Type: Non-Recruitment")
-    print("")
-    print("Is this correct? [Y/N]")
-    choice = input("> ")
-    if choice == "Y":
-        telegram = {
-            "name": name,
-            "tgid": tgid,
-            "tgsecretkey": tgsecretkey,
-            "type": isrecruitment
-        }
-        with open(os.path.join(telegram_folder, name + ".yml"), 'w', encoding="utf-8") as telegram_file:
-            yaml.dump(telegram, telegram_file)
-        print(f"Telegram {name} created.")
-        logger.log(logging.INFO, f"Telegram {name} created.")
-        configure_telegram_menu()
-        return
-    print("Telegram discarded.")
-    logger.log(logging.INFO, "Telegram discarded.")
-    configure_telegram_menu()
-    return
+        log_file.seek(max(0, offset - 64))
+        return hashlib.blake2b(log_file.read(min(offset, 64)), digest_size=8).digest()
 
-# Configure Telegram - Delete
-def delete_telegram():
+    def get(self, nation):
 
-    """Delete Telegram Menu"""
+        """Time a nation was added, None if it is not in the index"""
 
-    print("---------------------------------------------------------")
-    print("Configure Telegram - Delete")
-    print("Delete a Telegram.")
-    print("")
-    telegram_folder = os.path.join(PWD, "telegrams")
-    if not os.path.exists(telegram_folder):
-        os.makedirs(telegram_folder)
-    for i in range(0,len(os.listdir(telegram_folder))):
-        print(f"{i}. {os.listdir(telegram_folder)[i]}")
-    choice = input("> ")
-    try:
-        name = os.listdir(telegram_folder)[int(choice)]
-        os.remove(os.path.join(telegram_folder, name))
-        print(f"Telegram {name} deleted.")
-        logger.log(logging.INFO, f"Telegram {name} deleted.")
-    except FileNotFoundError:
-        print("File not found. Please try again.")
-        logger.log(logging.DEBUG, "File not found.")
-    except ValueError:
-        print("Invalid choice. Please try again.")
-        logger.log(logging.DEBUG, "Invalid choice.")
-    except IndexError:
-        print("No such Telegram exists. Please try again.")
-        logger.log(logging.DEBUG, "Invalid choice.")
-    except Exception as e:
-        print(f"Somehow an error has occured({e}). Please try again.")
-        logger.log(logging.DEBUG, e)
-    finally:
-        configure_telegram_menu()
-    return
+        key = self.key(nation)
+        low, high = 0, self.records
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.HEADER.size + middle * self.RECORD.size
+            record_key = self.map[offset:offset + 8]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                return self.RECORD.unpack_from(self.map, offset)[1]
+        return None
 
-# Select Recepients - Menu
-def select_recepients_menu():
+    def items(self):
 
-    """Select Recepients Menu"""
+        """(hash, timestamp) of every record, in hash order"""
 
-    while True:
-        print("---------------------------------------------------------")
-        print("Select Recepients - Menu")
-        print("[A]dd Recepients")
-        print("[R]emove Recepients")
-        print("[B]ack")
-        print("")
-        choice = input("> ")
-        match choice:
-            case "A":
-                add_recepients()
-                break
-            case "R":
-                remove_recepients()
-                break
-            case "B":
-                main()
-                return
-            case _:
-                print("Invalid choice. Please try again.")
+        for offset in range(self.HEADER.size, len(self.map), self.RECORD.size):
+            yield self.RECORD.unpack_from(self.map, offset)
 
-# Select Recepients - Add
-def add_recepients():
+    @classmethod
+    def write(cls, path, items, inode, offset, dead, boundary):
 
-    """Add Recepients Menu"""
+        """Write an index of (hash, timestamp) items in hash order, atomically replacing the old one"""
 
-    print("---------------------------------------------------------")
-    print("Select Recepients - Add")
-    print("Toggle a group of recepient.")
-    print("If the group runs out, the program will automatically add more of the same group.")
-    print("")
-    print("[F]ounding/Refounding")
-    print("[E]jected")
-    print("[I]ndividual Nation - Note: They will be messaged one time only.")
-    print("[B]ack")
-    print("")
-    choice = input("> ")
-    with open("config.yml", 'r', encoding="utf-8") as ymlfile:
-        config = yaml.safe_load(ymlfile)
-    match choice:
-        case "F":
-            if not config["recruiting"]["flag_FoundingRefounding"]:
-                config["recruiting"]["flag_FoundingRefounding"] = True
-                logger.log(logging.INFO, "Founding/Refounding nations will be messaged.")
-                print(GREEN + "Founding/Refounding nations will be messaged." + RESET)
-            else:
-                config["recruiting"]["flag_FoundingRefounding"] = False
-                logger.log(logging.INFO, "Founding/Refounding nations will not be messaged.")
-                print(YELLOW + "Founding/Refounding nations will not be messaged." + RESET)
-        case "E":
-            if not config["recruiting"]["flag_Ejected"]:
-                config["recruiting"]["flag_Ejected"] = True
-                logger.log(logging.INFO, "Ejected nations will be messaged.")
-                print(GREEN + "Ejected nations will be messaged." + RESET)
-            else:
-                config["recruiting"]["flag_Ejected"] = False
-                logger.log(logging.INFO, "Ejected nations will not be messaged.")
-                print(YELLOW + "Ejected nations will not be messaged." + RESET)
-        case "I":
-            print("Enter the nation name.")
-            nation = input("> ")
-            try:
-                config["recruiting"]["blocked_nations"].remove(nation)
-            except ValueError:
-                pass
-            config["recruiting"]["individual_nations"].append(nation)
-            logger.log(logging.INFO, f"{nation} will be messaged.")
-            print(CYAN + f"{nation} will be messaged." + RESET)
+        temp_path = path + ".tmp"
+        records = 0
+        with open(temp_path, 'wb') as index_file:
+            index_file.write(cls.HEADER.pack(cls.MAGIC, 0, inode, offset, dead, boundary))
+            for key, timestamp in items:
+                index_file.write(cls.RECORD.pack(key, timestamp))
+                records += 1
+            index_file.seek(0)
+            index_file.write(cls.HEADER.pack(cls.MAGIC, records, inode, offset, dead, boundary))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temp_path, path)
+
+# Merge sent history records
+def merge_history(*streams, cutoff=0):
+
+    """Merge streams of (hash, timestamp) in hash order, keeping the latest time of each nation and dropping expired ones"""
+
+    last_key = None
+    last_timestamp = None
+    for key, timestamp in heapq.merge(*streams):
+        if key != last_key and last_key is not None and last_timestamp >= cutoff:
+            yield last_key, last_timestamp
+        last_key, last_timestamp = key, timestamp
+    if last_key is not None and last_timestamp >= cutoff:
+        yield last_key, last_timestamp
+
+# Sent History
+class SentHistory():
+
+    """Set of nations that have been sent telegram, backed by an append-only log file.
+    With an index, only the nations added after it are held in memory and read at startup."""
+
+    def __init__(self, path=HISTORY_FILE, max_age_days=0, index_path=None):
+
+        """Initialize SentHistory and load the log file"""
+
+        self.path = path
+        self.index_path = index_path or None
+        self.max_age = max_age_days * 86400 if max_age_days else None
+        self.entries = {} # nation -> timestamp it was added, for the nations added after the index
+        self.index = None
+        self.dead = 0 # Lines in the log file that are superseded or expired
+        self.lock = threading.Lock()
+        self.index_lock = threading.Lock() # Serializes rewrites of the index
+        self.load()
+        self.file = open(self.path, 'a', encoding="utf-8")
+        if self.dead > len(self):
+            self.compact()
+
+    def load(self):
+
+        """Load the log file written after the index into memory, skipping expired entries"""
+
+        if not os.path.exists(self.path):
+            return
+        cutoff = clock.time() - self.max_age if self.max_age else 0
+        with open(self.path, 'rb') as history_file:
+            history_file.seek(self.open_index(history_file))
+            for timestamp, nation in self.read(history_file):
+                if timestamp is None:
+                    self.dead += 1
+                    continue
+                if timestamp < cutoff or nation in self.entries or (self.index is not None and self.index.get(nation) is not None):
+                    self.dead += 1
+                if timestamp >= cutoff:
+                    self.entries[nation] = timestamp
+        logging.debug(f"Loaded {len(self.entries)} nations from {self.path}" + (f" after {self.index.records} indexed ones." if self.index else "."))
+
+    def open_index(self, history_file):
+
+        """Open the index if it still matches the log, returning the log offset it covers"""
+
+        if self.index_path is None:
+            return 0
+        try:
+            index = HistoryIndex(self.index_path)
+        except (OSError, ValueError):
+            return 0
+        stat = os.fstat(history_file.fileno())
+        if index.inode != stat.st_ino or index.offset > stat.st_size or index.boundary != HistoryIndex.boundary_of(history_file, index.offset):
+            logging.debug(f"{self.index_path} does not match {self.path}, loading the whole log.")
+            return 0
+        self.index = index
+        self.dead = index.dead
+        return index.offset
+
+    @staticmethod
+    def read(history_file):
+
+        """Yield (timestamp, nation) for the lines of a binary log file, timestamp None for damaged lines"""
+
+        for line in history_file:
+            timestamp, _, nation = line.decode("utf-8", errors="replace").rstrip("\n").partition("\t")
+            try:
+                yield float(timestamp), nation
+            except ValueError:
+                yield None, nation
+
+    def __contains__(self, nation):
+
+        """Check if a nation has been sent telegram and has not expired"""
+
+        timestamp = self.entries.get(nation)
+        if timestamp is None and self.index is not None:
+            timestamp = self.index.get(nation)
+        if timestamp is None:
+            return False
+        if self.max_age and clock.time() - timestamp > self.max_age:
+            if self.entries.pop(nation, None) is not None:
+                self.dead += 1
+            return False
+        return True
+
+    def __len__(self):
+
+        """Amount of nations in the history, counting nations sent again since the index was written twice"""
+
+        return len(self.entries) + (self.index.records if self.index is not None else 0)
+
+    def add(self, nation):
+
+        """Add a nation to the history and append it to the log file"""
+
+        timestamp = clock.time()
+        with self.lock:
+            if nation in self.entries or (self.index is not None and self.index.get(nation) is not None):
+                self.dead += 1
+            self.entries[nation] = timestamp
+            self.file.write(f"{timestamp}\t{nation}\n")
+            self.file.flush()
+
+    def checkpoint(self, force=False):
+
+        """Merge the nations added since the index into a new index, once there are enough of them"""
+
+        if self.index_path is None or (len(self.entries) < HISTORY_INDEX_MIN_TAIL and not force):
+            return
+        with self.index_lock:
+            with self.lock:
+                self.file.flush()
+                stat = os.fstat(self.file.fileno())
+                tail = dict(self.entries)
+                dead = self.dead
+            cutoff = clock.time() - self.max_age if self.max_age else 0
+            with open(self.path, 'rb') as history_file:
+                boundary = HistoryIndex.boundary_of(history_file, stat.st_size)
+            added = sorted((HistoryIndex.key(nation), timestamp) for nation, timestamp in tail.items())
+            indexed = self.index.items() if self.index is not None else ()
+            HistoryIndex.write(self.index_path, merge_history(indexed, added, cutoff=cutoff), stat.st_ino, stat.st_size, dead, boundary)
+            index = HistoryIndex(self.index_path)
+            with self.lock:
+                # The old map is closed once no lookup holds it any more
+                self.index = index
+                for nation, timestamp in tail.items():
+                    if self.entries.get(nation) == timestamp:
+                        del self.entries[nation]
+        logging.debug(f"Indexed {index.records} nations of {self.path}.")
+
+    def compact(self):
+
+        """Rewrite the log file with only the live entries"""
+
+        with self.index_lock, self.lock:
+            cutoff = clock.time() - self.max_age if self.max_age else 0
+            live = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as history_file:
+                    for timestamp, nation in self.read(history_file):
+                        if timestamp is not None and timestamp >= cutoff:
+                            live[nation] = timestamp
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding="utf-8") as history_file:
+                for nation, timestamp in live.items():
+                    history_file.write(f"{timestamp}\t{nation}\n")
+            os.replace(temp_path, self.path)
+            self.dead = 0
+            self.file.close()
+            self.file = open(self.path, 'a', encoding="utf-8")
+            self.entries = live
+            self.index = None
+        logging.debug(f"Compacted {self.path} to {len(live)} nations.")
+        self.checkpoint(force=True)
+
+    def upkeep(self):
+
+        """Compact the log file once most of it is dead"""
+
+        if self.dead > len(self):
+            self.compact()
+
+# Load the sent history configured in config.yml
+def load_history():
+
+    """Load the sent history, and start over on the candidates skipped recently"""
+
+    global tg_sent_history
+    global tg_skipped
+    history_config = config["recruiting"].get("history", {})
+    tg_sent_history = SentHistory(
+        history_config.get("file", HISTORY_FILE),
+        history_config.get("max_age_days", 0),
+        history_config.get("index", HISTORY_INDEX_FILE))
+    tg_skipped = RecentSkips()
+
+# Recently Skipped Candidates
+class RecentSkips():
+
+    """Candidates that failed the checks recently, so a nation that shows up again is not checked again right away.
+    Kept out of the sent history: a failed eligibility request must not rule a nation out for good,
+    and real "cannot recruit" answers are cached by the eligibility service already."""
+
+    def __init__(self, ttl=SKIPPED_TTL):
+
+        """Initialize RecentSkips"""
+
+        self.ttl = ttl
+        self.expiry = {} # nation -> time it may be checked again, in the order it was skipped
+        self.lock = threading.Lock()
+
+    def add(self, nation):
+
+        """Skip a nation for a while, forgetting the nations whose skip has expired"""
+
+        now = clock.time()
+        with self.lock:
+            self.expiry.pop(nation, None)
+            self.expiry[nation] = now + self.ttl
+            for skipped, expiry in list(itertools.islice(self.expiry.items(), 16)):
+                if expiry > now:
+                    break
+                del self.expiry[skipped]
+
+    def __contains__(self, nation):
+
+        """Whether a nation was skipped recently"""
+
+        expiry = self.expiry.get(nation)
+        return expiry is not None and expiry > clock.time()
+
+    def __len__(self):
+
+        """Number of nations skipped, including expired ones not forgotten yet"""
+
+        return len(self.expiry)
+
+# Checkpoint
+class Checkpoint():
+
+    """Atomic checkpoints of the runtime state, so a restart resumes mid-cooldown without redoing discovery.
+    The sent history keeps its own log and index, the checkpoint holds everything else."""
+
+    def __init__(self, path=CHECKPOINT_FILE, interval=CHECKPOINT_INTERVAL):
+
+        """Initialize Checkpoint"""
+
+        self.path = path
+        self.interval = interval
+        self.prefetcher = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def state(self):
+
+        """Collect the runtime state"""
+
+        return {
+            "saved": clock.time(),
+            "tg_target": tg_target,
+            "tg_amt": tg_amt,
+            "buckets": {name: bucket.state() for name, bucket in list(scheduler.buckets.items())},
+            "candidate_queue": candidate_queue.state() if candidate_queue is not None else None,
+            "prefetched": self.prefetcher.state() if self.prefetcher is not None else [],
+        }
+
+    def save(self):
+
+        """Write the runtime state, so that a crash leaves either the previous or the new checkpoint"""
+
+        state = self.state()
+        with self.lock:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding="utf-8") as checkpoint_file:
+                json.dump(state, checkpoint_file)
+                checkpoint_file.flush()
+                os.fsync(checkpoint_file.fileno())
+            os.replace(temp_path, self.path)
+
+    def checkpoint(self):
+
+        """Index the sent history if it grew enough and save the runtime state"""
+
+        try:
+            tg_sent_history.checkpoint()
+            self.save()
+        except Exception as e:
+            logger.log(logging.ERROR, f"Checkpoint failed: {e}")
+
+    def load(self):
+
+        """Read the last checkpoint, None if there is none"""
+
+        try:
+            with open(self.path, 'r', encoding="utf-8") as checkpoint_file:
+                return json.load(checkpoint_file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.log(logging.WARNING, f"Ignoring the unreadable checkpoint {self.path}: {e}")
+            return None
+
+    def restore(self, prefetcher):
+
+        """Resume the counters, rate limits, candidates and prefetched targets of the last checkpoint"""
+
+        global tg_target
+        global tg_amt
+        global candidate_queue
+        self.prefetcher = prefetcher
+        state = self.load()
+        if state is None:
+            return
+        elapsed = max(0, clock.time() - state["saved"])
+        with stats_lock:
+            tg_target = state["tg_target"]
+            tg_amt = state["tg_amt"]
+        for name, bucket_state in state["buckets"].items():
+            if name in scheduler.buckets:
+                scheduler.buckets[name].restore(bucket_state, elapsed)
+        if state["candidate_queue"] is not None:
+            if candidate_queue is None:
+                candidate_queue = CandidateQueue()
+            candidate_queue.restore(state["candidate_queue"])
+        prefetcher.restore(state["prefetched"])
+        logger.log(logging.INFO, f"Resumed from the checkpoint of {elapsed:.0f} seconds ago with {len(state['prefetched'])} prefetched targets.")
+
+    def start(self):
+
+        """Start checkpointing periodically in a background thread"""
+
+        self.thread = threading.Thread(target=self.run, name="Checkpoint", daemon=True)
+        self.thread.start()
+
+    def run(self):
+
+        """Checkpoint periodically"""
+
+        while True:
+            clock.sleep(self.interval)
+            self.checkpoint()
+
+# Load the checkpoint configured in config.yml
+def load_checkpoint():
+
+    """Load the checkpoint, if one is configured"""
+
+    global checkpoint
+    checkpoint_config = config["recruiting"].get("checkpoint", {})
+    path = checkpoint_config.get("file", CHECKPOINT_FILE)
+    checkpoint = Checkpoint(path, checkpoint_config.get("interval", CHECKPOINT_INTERVAL)) if path else None
+
+# Return the name of a nation as NationStates identifies it
+def canonical_nation(name):
+
+    """Canonical nation name: lowercase, with underscores for spaces, as the API and the happenings spell it"""
+
+    return name.strip().lower().replace(" ", "_")
+
+# Read nation names from a bulk list
+def read_nations(nations_file):
+
+    """Canonical nation names of a file with one or more comma separated nations per line, skipping # comments"""
+
+    for line in nations_file:
+        for name in line.split("#", 1)[0].split(","):
+            nation = canonical_nation(name)
+            if nation:
+                yield nation
+
+# Recipient List
+class RecipientList():
+
+    """Ordered set of canonical nation names listed in config.yml and in a file of one nation per line.
+    The file takes bulk lists of tens of thousands of nations; additions are appended to it instead of rewriting config.yml."""
+
+    def __init__(self, path, configured=()):
+
+        """Initialize RecipientList"""
+
+        self.path = path
+        self.configured = {} # canonical nation -> None, listed in config.yml
+        self.listed = {} # canonical nation -> None, listed in the file
+        self.nations = {} # Both, in the order they were listed
+        self.mtime = None
+        self.lock = threading.Lock()
+        self.configure(configured)
+        self.load()
+
+    def __contains__(self, nation):
+
+        """Check whether a canonical nation is listed"""
+
+        return nation in self.nations
+
+    def __len__(self):
+
+        """Number of nations listed"""
+
+        return len(self.nations)
+
+    def __iter__(self):
+
+        """Nations in the order they were listed"""
+
+        return iter(list(self.nations))
+
+    def merge(self):
+
+        """Combine the nations of config.yml and of the file"""
+
+        self.nations = dict(self.configured)
+        self.nations.update(self.listed)
+
+    def configure(self, nations):
+
+        """Replace the nations listed in config.yml"""
+
+        with self.lock:
+            self.configured = dict.fromkeys(canonical_nation(nation) for nation in nations or ())
+            self.merge()
+
+    def modified(self):
+
+        """Modification time of the file, None if it does not exist"""
+
+        try:
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except FileNotFoundError:
+            return None
+
+    def load(self):
+
+        """Read the file again"""
+
+        mtime = self.modified()
+        listed = {}
+        if mtime is not None:
+            with open(self.path, 'r', encoding="utf-8") as nations_file:
+                listed = dict.fromkeys(read_nations(nations_file))
+        with self.lock:
+            self.listed = listed
+            self.mtime = mtime
+            self.merge()
+
+    def changed(self):
+
+        """Check whether the file was modified since it was read"""
+
+        return self.modified() != self.mtime
+
+    def add(self, nations):
+
+        """Append the nations not yet listed to the file, returning how many were added"""
+
+        with self.lock:
+            added = [nation for nation in dict.fromkeys(canonical_nation(nation) for nation in nations) if nation and nation not in self.nations]
+            if added:
+                with open(self.path, 'a', encoding="utf-8") as nations_file:
+                    nations_file.write("".join(nation + "\n" for nation in added))
+                self.listed.update(dict.fromkeys(added))
+                self.nations.update(dict.fromkeys(added))
+                self.mtime = self.modified()
+        return len(added)
+
+    def remove(self, nation):
+
+        """Remove a nation from the file, returning True if it is also listed in config.yml and has to be removed there"""
+
+        nation = canonical_nation(nation)
+        with self.lock:
+            if nation in self.listed:
+                del self.listed[nation]
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w', encoding="utf-8") as nations_file:
+                    nations_file.write("".join(listed + "\n" for listed in self.listed))
+                os.replace(temp_path, self.path)
+                self.mtime = self.modified()
+            configured = nation in self.configured
+            self.configured.pop(nation, None)
+            self.merge()
+            return configured
+
+# Recipients
+class Recipients():
+
+    """The individual nations to message once and the blocked nations never to message.
+    Watches config.yml and the nation files, reloading the lists when one of them changes."""
+
+    def __init__(self, individual_file=INDIVIDUAL_NATIONS_FILE, blocked_file=BLOCKED_NATIONS_FILE, interval=RECIPIENTS_RELOAD_INTERVAL):
+
+        """Initialize Recipients from the lists in config.yml and the nation files"""
+
+        self.individual = RecipientList(individual_file, config["recruiting"].get("individual_nations"))
+        self.blocked = RecipientList(blocked_file, config["recruiting"].get("blocked_nations"))
+        self.interval = interval
+        self.config_mtime = self.config_modified()
+        self.checked = clock.monotonic()
+        self.lock = threading.Lock()
+        self.pending = deque() # Individual nations which may still be messaged, in the order they were listed
+        self.refill()
+
+    def config_modified(self):
+
+        """Modification time of config.yml, None if it does not exist"""
+
+        try:
+            return os.stat("config.yml").st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def refill(self):
+
+        """Queue the individual nations again after the lists changed"""
+
+        with self.lock:
+            self.pending = deque(nation for nation in self.individual if nation not in self.blocked and nation not in tg_sent_history)
+
+    def watch(self):
+
+        """Reload the lists whose files changed, checking at most once per interval"""
+
+        now = clock.monotonic()
+        if now - self.checked < self.interval:
+            return
+        self.checked = now
+        reloaded = False
+        config_mtime = self.config_modified()
+        if config_mtime != self.config_mtime:
+            self.config_mtime = config_mtime
+            try:
+                with open("config.yml", 'r', encoding="utf-8") as ymlfile:
+                    recruiting = yaml.safe_load(ymlfile)["recruiting"]
+                config["recruiting"]["individual_nations"] = recruiting.get("individual_nations", [])
+                config["recruiting"]["blocked_nations"] = recruiting.get("blocked_nations", [])
+                self.individual.configure(config["recruiting"]["individual_nations"])
+                self.blocked.configure(config["recruiting"]["blocked_nations"])
+                reloaded = True
+            except (OSError, yaml.YAMLError, KeyError, TypeError) as e:
+                logger.log(logging.ERROR, f"Keeping the previous recipients, config.yml could not be reloaded: {e}")
+        for nations in (self.individual, self.blocked):
+            if nations.changed():
+                try:
+                    nations.load()
+                    reloaded = True
+                except (OSError, UnicodeDecodeError) as e:
+                    logger.log(logging.ERROR, f"Keeping the previous recipients, {nations.path} could not be reloaded: {e}")
+        if reloaded:
+            self.refill()
+            logger.log(logging.INFO, f"Recipients reloaded: {len(self.individual)} individual and {len(self.blocked)} blocked nations.")
+
+    def next_individual(self):
+
+        """First individual nation still to be messaged, or None"""
+
+        self.watch()
+        with self.lock:
+            # Nations at the front which have been messaged or blocked since are done for good
+            while self.pending and (self.pending[0] in tg_sent_history or self.pending[0] in self.blocked):
+                self.pending.popleft()
+            # Only the few prefetched and recently failed nations are passed over, so this stops within a few nations
+            for nation in self.pending:
+                if nation not in tg_claimed and nation not in tg_sent_history and nation not in tg_skipped and nation not in self.blocked:
+                    return nation
+        return None
+
+    def add(self, nation):
+
+        """Message a nation, unblocking it"""
+
+        unconfigure = self.blocked.remove(nation)
+        self.individual.add([nation])
+        self.refill()
+        return unconfigure
+
+    def block(self, nation):
+
+        """Never message a nation"""
+
+        unconfigure = self.individual.remove(nation)
+        self.blocked.add([nation])
+        self.refill()
+        return unconfigure
+
+# Load the recipients configured in config.yml
+def load_recipients():
+
+    """Load the individual and blocked nations"""
+
+    global recipients
+    recipients_config = config["recruiting"].get("recipients", {})
+    recipients = Recipients(
+        recipients_config.get("individual_file", INDIVIDUAL_NATIONS_FILE),
+        recipients_config.get("blocked_file", BLOCKED_NATIONS_FILE),
+        recipients_config.get("reload_interval", RECIPIENTS_RELOAD_INTERVAL))
+
+
+# Rate Limiting
+class SlidingWindow():
+
+    """Sliding window log allowing at most `capacity` requests in any `period` seconds, the way the API counts them.
+    Requests are given slots in order, each at least a period after the request `capacity` places before it,
+    so a burst is never followed by more requests within the same window."""
+
+    def __init__(self, capacity, period):
+
+        """Initialize SlidingWindow, starting with no requests in the window"""
+
+        self.capacity = capacity
+        self.period = period
+        self.slots = deque() # Monotonic times of the requests made or reserved, in order
+        self.blocked_until = 0 # Set from the rate limit headers of the API
+        self.lock = threading.Lock()
+
+    def expire(self, now):
+
+        """Forget the requests that left the window"""
+
+        while self.slots and self.slots[0] <= now - self.period:
+            self.slots.popleft()
+
+    def next_slot(self, now):
+
+        """Earliest time the next request may be made"""
+
+        slot = max(now, self.blocked_until, self.slots[-1] if self.slots else now)
+        if len(self.slots) >= self.capacity:
+            slot = max(slot, self.slots[-self.capacity] + self.period)
+        return slot
+
+    def reserve(self):
+
+        """Reserve the next slot, returning the monotonic time the caller may make its request"""
+
+        with self.lock:
+            now = clock.monotonic()
+            self.expire(now)
+            slot = self.next_slot(now)
+            self.slots.append(slot)
+            return slot
+
+    def recheck(self, slot):
+
+        """Move a reserved slot past a block that began while its request waited, returning the slot to wait for"""
+
+        with self.lock:
+            if self.blocked_until <= slot:
+                return slot
+            now = clock.monotonic()
+            with contextlib.suppress(ValueError):
+                self.slots.remove(slot)
+            self.expire(now)
+            slot = self.next_slot(now)
+            self.slots.append(slot)
+            return slot
+
+    def acquire(self):
+
+        """Take a slot, sleeping as long as the budget requires"""
+
+        slot = self.reserve()
+        waited = 0
+        while True:
+            wait = slot - clock.monotonic()
+            if wait <= 0:
+                return waited
+            clock.sleep(wait)
+            waited += wait
+            slot = self.recheck(slot)
+
+    async def acquire_async(self):
+
+        """Take a slot without blocking the event loop"""
+
+        slot = self.reserve()
+        waited = 0
+        while True:
+            wait = slot - clock.monotonic()
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+            slot = self.recheck(slot)
+
+    def ready_in(self):
+
+        """Seconds until a request may be made, without reserving it"""
+
+        with self.lock:
+            now = clock.monotonic()
+            self.expire(now)
+            return self.next_slot(now) - now
+
+    def wait_ready(self):
+
+        """Sleep until a request may be made without reserving it"""
+
+        wait = self.ready_in()
+        if wait > 0:
+            clock.sleep(wait)
+        return wait
+
+    def set_period(self, period):
+
+        """Change the period, keeping the requests made so far"""
+
+        with self.lock:
+            self.period = period
+
+    def state(self):
+
+        """Requests in the window and remaining block, relative to now so they survive a restart"""
+
+        with self.lock:
+            now = clock.monotonic()
+            self.expire(now)
+            return {"slots": [slot - now for slot in self.slots], "blocked_for": max(0, self.blocked_until - now)}
+
+    def restore(self, state, elapsed):
+
+        """Resume from a saved state, elapsed seconds after it was saved"""
+
+        with self.lock:
+            now = clock.monotonic()
+            # Checkpoints of the token buckets saved the tokens left, count the spent ones as made when it was saved
+            offsets = state.get("slots", [0] * int(self.capacity - state.get("tokens", self.capacity)))
+            self.slots = deque(now - elapsed + offset for offset in offsets)
+            self.expire(now)
+            self.blocked_until = now + max(0, state["blocked_for"] - elapsed)
+
+    def refund(self):
+
+        """Give back the slot of the latest request made, which the API did not count"""
+
+        with self.lock:
+            now = clock.monotonic()
+            for index in range(len(self.slots) - 1, -1, -1):
+                if self.slots[index] <= now:
+                    del self.slots[index]
+                    return
+
+    def observe(self, remaining=None, reset=None, retry_after=None):
+
+        """Correct the window from the rate limit headers of a response"""
+
+        with self.lock:
+            now = clock.monotonic()
+            self.expire(now)
+            if remaining is not None:
+                # The API counted requests this window did not, from other recruiters or programs on the address
+                for _ in range(max(0, self.capacity - len(self.slots) - int(remaining))):
+                    self.slots.append(max(now, self.slots[-1]) if self.slots else now)
+                if remaining <= 0 and reset is not None:
+                    self.blocked_until = max(self.blocked_until, now + reset)
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class RateLimitScheduler():
+
+    """Routes every API request through the sliding window of its rate limit"""
+
+    def __init__(self):
+
+        """Initialize RateLimitScheduler"""
+
+        self.buckets = {
+            "api": SlidingWindow(API_RATELIMIT_REQUESTS, API_RATELIMIT_PERIOD),
+        }
+
+    def add_bucket(self, bucket, capacity, period):
+
+        """Add a bucket unless it already exists"""
+
+        if bucket not in self.buckets:
+            self.buckets[bucket] = SlidingWindow(capacity, period)
+        return self.buckets[bucket]
+
+    def buckets_for(self, bucket):
+
+        """Windows a request of a bucket has to take a slot in"""
+
+        if bucket == "api":
+            return [self.buckets["api"]]
+        return [self.buckets[bucket], self.buckets["api"]] # Telegrams count against the general limit as well
+
+    def acquire(self, bucket):
+
+        """Wait for the budget of a bucket"""
+
+        for window in self.buckets_for(bucket):
+            waited = window.acquire()
+            if waited > 0:
+                logging.debug(f"Waited {waited:.2f} seconds for the {bucket} rate limit.")
+                metrics.inc("recruiter_ratelimit_wait_seconds_total", waited, bucket=bucket_kind(bucket))
+
+    async def acquire_async(self, bucket):
+
+        """Wait for the budget of a bucket without blocking the event loop"""
+
+        for window in self.buckets_for(bucket):
+            waited = await window.acquire_async()
+            if waited > 0:
+                logging.debug(f"Waited {waited:.2f} seconds for the {bucket} rate limit.")
+                metrics.inc("recruiter_ratelimit_wait_seconds_total", waited, bucket=bucket_kind(bucket))
+
+    def observe(self, bucket, request):
+
+        """Correct the buckets from the rate limit headers of a response"""
+
+        metrics.inc("recruiter_api_responses_total", bucket=bucket_kind(bucket), status=str(request.status_code))
+        remaining = header_number(request.headers, "RateLimit-Remaining")
+        reset = header_number(request.headers, "RateLimit-Reset")
+        retry_after = header_number(request.headers, "Retry-After")
+        if retry_after is None:
+            retry_after = header_number(request.headers, "X-Retry-After")
+        self.buckets["api"].observe(remaining, reset)
+        if request.status_code == 429:
+            # The request was refused, so only the Retry-After wait applies to the next attempt
+            self.buckets[bucket].refund()
+            self.buckets[bucket].observe(retry_after=retry_after if retry_after is not None else API_RATELIMIT_PERIOD)
+
+    def refund(self, bucket):
+
+        """Give back the slot of a request that did not use up the budget of its bucket, the general limit still counts it"""
+
+        if bucket != "api":
+            self.buckets[bucket].refund()
+
+    def wait_ready(self, bucket):
+
+        """Sleep until a bucket has budget for another request"""
+
+        return self.buckets[bucket].wait_ready()
+
+    async def wait_ready_async(self, bucket):
+
+        """Wait until a bucket has budget for another request without blocking the event loop"""
+
+        wait = self.buckets[bucket].ready_in()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+# Transport over requests
+class RequestsTransport():
+
+    """Transport over one pooled requests session, run off the event loop for the asyncio runtime"""
+
+    def __init__(self, pool_size=API_POOL_SIZE, retries=API_RETRIES, backoff=API_BACKOFF):
+
+        """Initialize RequestsTransport"""
+
+        self.session = requests.Session()
+        self.session.headers.update(REQUESTS_HEADER)
+        # Only retry failed connections: a request that reached the API may have been counted or sent
+        retry = Retry(total=retries, connect=retries, read=0, status=0, other=0, backoff_factor=backoff)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, timeout, stream=False):
+
+        """Send a GET request. With stream set, the body is left unread for the caller to iterate."""
+
+        return self.session.get(url, timeout=timeout, stream=stream)
+
+    async def get_async(self, url, timeout):
+
+        """Send a GET request without blocking the event loop"""
+
+        request = await asyncio.to_thread(self.session.get, url, timeout=timeout)
+        return BufferedResponse(request.status_code, request.headers, request.content)
+
+    def close(self):
+
+        """Close the pooled connections"""
+
+        self.session.close()
+
+    async def close_async(self):
+
+        """Close the connections of the asyncio runtime"""
+
+# Transport over aiohttp
+class AiohttpTransport(RequestsTransport):
+
+    """Transport using aiohttp for the asyncio runtime and the pooled requests session otherwise"""
+
+    def __init__(self, pool_size=API_POOL_SIZE, retries=API_RETRIES, backoff=API_BACKOFF):
+
+        """Initialize AiohttpTransport"""
+
+        super().__init__(pool_size, retries, backoff)
+        self.pool_size = pool_size
+        self.client_session = None # Created on first use, it has to belong to the running event loop
+
+    async def get_async(self, url, timeout):
+
+        """Send a GET request on the aiohttp session"""
+
+        if self.client_session is None:
+            self.client_session = aiohttp.ClientSession(
+                headers=REQUESTS_HEADER,
+                connector=aiohttp.TCPConnector(limit=self.pool_size))
+        async with self.client_session.get(url, timeout=aiohttp.ClientTimeout(total=timeout)) as request:
+            return BufferedResponse(request.status, request.headers, await request.read())
+
+    async def close_async(self):
+
+        """Close the aiohttp session"""
+
+        if self.client_session is not None:
+            await self.client_session.close()
+            self.client_session = None
+
+# Transport replaying recorded responses
+class FixtureTransport():
+
+    """Transport answering from a fixture file of recorded responses instead of the network.
+    Each response is matched by its exact query string or else by its endpoint, e.g. "happenings" or "sendTG".
+    Responses of one match are served in order and the last one is repeated."""
+
+    def __init__(self, path):
+
+        """Initialize FixtureTransport"""
+
+        self.path = path
+        self.responses = {} # query or endpoint -> deque of recorded responses
+        self.lock = threading.Lock()
+        with open(path, 'r', encoding="utf-8") as fixture_file:
+            for response in json.load(fixture_file)["responses"]:
+                self.responses.setdefault(response["match"], deque()).append(response)
+
+    def get(self, url, timeout, stream=False):
+
+        """Answer a GET request from the fixture, 404 when nothing matches"""
+
+        query = url.partition("?")[2]
+        with self.lock:
+            recorded = self.responses.get(query) or self.responses.get(api_endpoint(query))
+            if not recorded:
+                return BufferedResponse(404, {}, b"")
+            response = recorded.popleft() if len(recorded) > 1 else recorded[0]
+        return BufferedResponse(response.get("status", 200), response.get("headers", {}), response.get("body", "").encode("utf-8"))
+
+    async def get_async(self, url, timeout):
+
+        """Answer a GET request from the fixture"""
+
+        return self.get(url, timeout)
+
+    def close(self):
+
+        """Nothing to close"""
+
+    async def close_async(self):
+
+        """Nothing to close"""
+
+# API Client
+class APIClient():
+
+    """Client for the NationStates API, sending every request through one transport"""
+
+    def __init__(self, scheduler, transport, base_url=API_URL, timeouts=None):
+
+        """Initialize APIClient"""
+
+        self.scheduler = scheduler
+        self.transport = transport
+        self.base_url = base_url
+        self.timeouts = dict(API_TIMEOUTS, **(timeouts or {}))
+
+    def url(self, query):
+
+        """URL of a query string"""
+
+        return f"{self.base_url}?{query}"
+
+    def timeout(self, query):
+
+        """Timeout of a query string, by its endpoint"""
+
+        return self.timeouts.get(api_endpoint(query), self.timeouts["default"])
+
+    def get(self, bucket, query, stream=False):
+
+        """Send a GET request with the given query string within the budget of a rate limit bucket.
+        With stream set, the body is left unread for the caller to iterate."""
+
+        self.scheduler.acquire(bucket)
+        request = self.transport.get(self.url(query), self.timeout(query), stream=stream)
+        self.scheduler.observe(bucket, request)
+        return request
+
+    def close(self):
+
+        """Close the transport"""
+
+        self.transport.close()
+
+# Async API Client
+class AsyncAPIClient():
+
+    """Client for the NationStates API for the asyncio runtime, sharing the transport and settings of an APIClient"""
+
+    def __init__(self, scheduler, client):
+
+        """Initialize AsyncAPIClient"""
+
+        self.scheduler = scheduler
+        self.client = client
+
+    async def get(self, bucket, query):
+
+        """Send a GET request with the given query string within the budget of a rate limit bucket"""
+
+        await self.scheduler.acquire_async(bucket)
+        response = await self.client.transport.get_async(self.client.url(query), self.client.timeout(query))
+        self.scheduler.observe(bucket, response)
+        return response
+
+    async def close(self):
+
+        """Close the connections of the asyncio runtime"""
+
+        await self.client.transport.close_async()
+
+
+class BufferedResponse():
+
+    """Response read into memory, shaped like the parts of requests.Response the bot reads"""
+
+    def __init__(self, status_code, headers, content):
+
+        """Initialize BufferedResponse"""
+
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    @property
+    def text(self):
+
+        """Body decoded as text"""
+
+        return self.content.decode("utf-8", errors="replace")
+
+    def iter_content(self, chunk_size=STREAM_CHUNK_SIZE):
+
+        """Body in chunks, like a streamed response"""
+
+        for offset in range(0, len(self.content), chunk_size):
+            yield self.content[offset:offset + chunk_size]
+
+    def close(self):
+
+        """Nothing to release, the body is already read"""
+
+    def __enter__(self):
+
+        """Use the response as a context manager, like a streamed one"""
+
+        return self
+
+    def __exit__(self, *exc_info):
+
+        """Close the response"""
+
+        self.close()
+
+# Endpoint of an API query string, the q of API shards or the a of actions
+def api_endpoint(query):
+
+    """Endpoint name of a query string"""
+
+    for parameter in re.split("[&;]", query):
+        key, _, value = parameter.partition("=")
+        if key in ("q", "a"):
+            return value.split("+", 1)[0]
+    return "default"
+
+# Return the kind of a rate limit bucket, without the client key of telegram buckets
+def bucket_kind(bucket):
+
+    """Bucket name as a metrics label"""
+
+    return bucket.split(":", 1)[0]
+
+# Metrics
+class Metrics():
+
+    """Counters, latency histograms and gauges of the recruitment pipeline"""
+
+    def __init__(self):
+
+        """Initialize Metrics"""
+
+        self.counters = {} # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> [bucket counts..., count, sum]
+        self.gauges = {} # (name, labels) -> function returning the current value
+        self.lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+
+        """Add to a counter"""
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+
+        """Record a latency in a histogram"""
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [0] * (len(LATENCY_BUCKETS) + 2))
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    def gauge(self, name, function, **labels):
+
+        """Register a gauge read from a function whenever metrics are exported"""
+
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = function
+
+    def snapshot(self):
+
+        """Current values as a JSON serialisable dict"""
+
+        with self.lock:
+            counters = list(self.counters.items())
+            histograms = [(key, list(histogram)) for key, histogram in self.histograms.items()]
+            gauges = list(self.gauges.items())
+        result = {"timestamp": time.time(), "counters": [], "histograms": [], "gauges": []}
+        for (name, labels), value in counters:
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        for (name, labels), histogram in histograms:
+            result["histograms"].append({
+                "name": name,
+                "labels": dict(labels),
+                "buckets": dict(zip([str(bound) for bound in LATENCY_BUCKETS], histogram[:-2])),
+                "count": histogram[-2],
+                "sum": histogram[-1],
+            })
+        for (name, labels), function in gauges:
+            try:
+                value = function()
+            except Exception:
+                continue
+            result["gauges"].append({"name": name, "labels": dict(labels), "value": value})
+        return result
+
+    def render(self):
+
+        """Current values in the Prometheus text format"""
+
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        def declare(name, kind):
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+        for counter in snapshot["counters"]:
+            declare(counter["name"], "counter")
+            lines.append(f"{counter['name']}{prometheus_labels(counter['labels'])} {counter['value']}")
+        for gauge in snapshot["gauges"]:
+            declare(gauge["name"], "gauge")
+            lines.append(f"{gauge['name']}{prometheus_labels(gauge['labels'])} {gauge['value']}")
+        for histogram in snapshot["histograms"]:
+            name = histogram["name"]
+            labels = histogram["labels"]
+            declare(name, "histogram")
+            for bound, count in histogram["buckets"].items():
+                lines.append(f"{name}_bucket{prometheus_labels(labels, le=bound)} {count}")
+            lines.append(f"{name}_bucket{prometheus_labels(labels, le='+Inf')} {histogram['count']}")
+            lines.append(f"{name}_count{prometheus_labels(labels)} {histogram['count']}")
+            lines.append(f"{name}_sum{prometheus_labels(labels)} {histogram['sum']}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path):
+
+        """Atomically write a JSON snapshot"""
+
+        temp_path = path + ".tmp"
+        with open(temp_path, 'w', encoding="utf-8") as snapshot_file:
+            json.dump(self.snapshot(), snapshot_file)
+        os.replace(temp_path, path)
+
+
+# Format labels for the Prometheus text format
+def prometheus_labels(labels, **extra):
+
+    """Labels in braces, with values escaped, or an empty string without labels"""
+
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in labels.values())
+    return "{" + ",".join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + "}"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    """Serves the metrics in the Prometheus text format at /metrics"""
+
+    def do_GET(self):
+
+        """Answer a scrape"""
+
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        """Keep scrapes out of the console"""
+
+        logging.debug("Metrics request: " + format % args)
+
+# Start exporting metrics as configured in config.yml
+def start_metrics():
+
+    """Start the /metrics endpoint and the periodic JSON snapshot, returning the endpoint's server if it serves"""
+
+    metrics_config = config.get("metrics") or {}
+    metrics.gauge("recruiter_targets_found", lambda: tg_target)
+    metrics.gauge("recruiter_telegrams_sent", lambda: tg_amt)
+    port = metrics_config.get("port", METRICS_PORT)
+    server = None
+    if port is not None:
+        try:
+            server = ThreadingHTTPServer((metrics_config.get("host", METRICS_HOST), port), MetricsHandler)
+        except OSError as e:
+            print(RED + f"Unable to serve metrics on port {port}: {e}" + RESET)
+            logger.log(logging.ERROR, f"Unable to serve metrics on port {port}: {e}")
+        else:
+            threading.Thread(target=server.serve_forever, name="Metrics", daemon=True).start()
+            print(f"Serving metrics at http://{server.server_address[0]}:{server.server_address[1]}/metrics")
+            logger.log(logging.INFO, f"Serving metrics on port {server.server_address[1]}.")
+    interval = metrics_config.get("snapshot_interval", METRICS_SNAPSHOT_INTERVAL)
+    if interval:
+        path = metrics_config.get("snapshot_file", METRICS_SNAPSHOT_FILE)
+        def write_snapshots():
+            while True:
+                time.sleep(interval)
+                try:
+                    metrics.write_snapshot(path)
+                except OSError as e:
+                    logging.debug(f"Unable to write metrics snapshot: {e}")
+        threading.Thread(target=write_snapshots, name="MetricsSnapshot", daemon=True).start()
+    return server
+
+# Read a numeric header, None if it is missing or malformed
+def header_number(headers, name):
+
+    """Read a numeric header"""
+
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+# Display main menu
+def display():
+
+    """Display main menu"""
+
+    global choice
+    print("---------------------------------------------------------")
+    print("headlessNSPythonRecruiter v" + VERSION + " by Clarissa Au")
+    print("This program is licensed under GNU GPL v3.0 License")
+    print("---------------------------------------------------------")
+    logger.display(logging.INFO, 5)
+    print("---------------------------------------------------------")
+    print(f"Hello, {config['clientname']}!")
+    print("")
+    print("Configure [T]elegram")
+    print("[S]elect Recepients")
+    print("[R]ecruit")
+    print("[Q]uit")
+    print("")
+    choice = input("> ")
+
+# Configure Telegram - Menu
+def configure_telegram_menu():
+
+    """Configure Telegram Menu"""
+
+    while True:
+        print("---------------------------------------------------------")
+        print("Configure Telegram - Menu")
+        print("[S]elect Existing Telegram")
+        print("[C]reate New Telegram")
+        print("[D]elete Current Telegram")
+        print("[B]ack")
+        print("")
+        choice = input("> ")
+        match choice:
+            case "S":
+                select_telegram()
+                break
+            case "C":
+                create_telegram()
+                break
+            case "D":
+                delete_telegram()
+                break
+            case "B":
+                main()
+                break
+            case _:
+                print("Invalid choice. Please try again.")
+
+# Configure Telegram - Select
+def select_telegram():
+
+    """Select Telegram Menu"""
+
+    global telegram
+    print("---------------------------------------------------------")
+    print("Configure Telegram - Select")
+    print("Select a Telegram to use.")
+    print("")
+    telegram_folder = os.path.join(PWD, "telegrams")
+    if not os.path.exists(telegram_folder):
+        os.makedirs(telegram_folder)
+    for i in range(0,len(os.listdir(telegram_folder))):
+        print(f"{i}. {os.listdir(telegram_folder)[i]}")
+    choice = input("> ")
+    try:
+        with open(
+            os.path.join(
+                telegram_folder, os.listdir(telegram_folder)[int(choice)]), 'r', encoding="utf-8"
+            ) as telegram_file:
+            telegram = yaml.safe_load(telegram_file)
+            print(f"Telegram {os.listdir(telegram_folder)[int(choice)]} selected.")
+            logger.log(logging.INFO, f"Telegram {os.listdir(telegram_folder)[int(choice)]} selected.")
+    except FileNotFoundError:
+        print("File not found. Please try again.")
+        logger.log(logging.DEBUG, "File not found.")
+    except ValueError:
+        print("Invalid choice. Please try again.")
+        logger.log(logging.DEBUG, "Invalid choice.")
+    except IndexError:
+        print("No such Telegram exists. Please try again.")
+        logger.log(logging.DEBUG, "Invalid choice.")
+    except Exception as e:
+        print(f"Somehow an error has occured({e}). Please try again.")
+        logger.log(logging.DEBUG, e)
+    finally:
+        configure_telegram_menu()
+
+# Configure Telegram - Create
+def create_telegram():
+
+    """Create Telegram Menu"""
+
+    global telegram
+    print("---------------------------------------------------------")
+    print("Configure Telegram - Create")
+    print("Create a new Telegram.")
+    print("")
+    telegram_folder = os.path.join(PWD, "telegrams")
+    if not os.path.exists(telegram_folder):
+        os.makedirs(telegram_folder)
+    print("Enter the Telegram's name.")
+    name = input("> ")
+    print("Enter the Telegram's TGID.")
+    tgid = input("> ")
+    print("Enter the Telegram's secret key.")
+    tgsecretkey = input("> ")
+    print("Enter the Type of the Telegram. [R]ecruitment/[N]on-Recruitment")
+    print(RED + "Warning: If you're recruiting, you must enter R." + RESET)
+    print("Failure to do so will result in Site API Ban.")
+    isrecruitment = input("> ")
+    print("Confirmation:")
+    print(f"Name: {name}")
+    print(f"TGID: {tgid}")
+    print(f"Secret Key: {tgsecretkey}")
+    if isrecruitment == "R":
+        isrecruitment = "Recruitment"
+        print("Type: Recruitment")
+    else:
+        isrecruitment = "Non-Recruitment"
+        print("Type: Non-Recruitment")
+    print("")
+    print("Is this correct? [Y/N]")
+    choice = input("> ")
+    if choice == "Y":
+        telegram = {
+            "name": name,
+            "tgid": tgid,
+            "tgsecretkey": tgsecretkey,
+            "type": isrecruitment
+        }
+        with open(os.path.join(telegram_folder, name + ".yml"), 'w', encoding="utf-8") as telegram_file:
+            yaml.dump(telegram, telegram_file)
+        print(f"Telegram {name} created.")
+        logger.log(logging.INFO, f"Telegram {name} created.")
+        configure_telegram_menu()
+        return
+    print("Telegram discarded.")
+    logger.log(logging.INFO, "Telegram discarded.")
+    configure_telegram_menu()
+    return
+
+# Configure Telegram - Delete
+def delete_telegram():
+
+    """Delete Telegram Menu"""
+
+    print("---------------------------------------------------------")
+    print("Configure Telegram - Delete")
+    print("Delete a Telegram.")
+    print("")
+    telegram_folder = os.path.join(PWD, "telegrams")
+    if not os.path.exists(telegram_folder):
+        os.makedirs(telegram_folder)
+    for i in range(0,len(os.listdir(telegram_folder))):
+        print(f"{i}. {os.listdir(telegram_folder)[i]}")
+    choice = input("> ")
+    try:
+        name = os.listdir(telegram_folder)[int(choice)]
+        os.remove(os.path.join(telegram_folder, name))
+        print(f"Telegram {name} deleted.")
+        logger.log(logging.INFO, f"Telegram {name} deleted.")
+    except FileNotFoundError:
+        print("File not found. Please try again.")
+        logger.log(logging.DEBUG, "File not found.")
+    except ValueError:
+        print("Invalid choice. Please try again.")
+        logger.log(logging.DEBUG, "Invalid choice.")
+    except IndexError:
+        print("No such Telegram exists. Please try again.")
+        logger.log(logging.DEBUG, "Invalid choice.")
+    except Exception as e:
+        print(f"Somehow an error has occured({e}). Please try again.")
+        logger.log(logging.DEBUG, e)
+    finally:
+        configure_telegram_menu()
+    return
+
+# Select Recepients - Menu
+def select_recepients_menu():
+
+    """Select Recepients Menu"""
+
+    while True:
+        print("---------------------------------------------------------")
+        print("Select Recepients - Menu")
+        print("[A]dd Recepients")
+        print("[R]emove Recepients")
+        print("[B]ack")
+        print("")
+        choice = input("> ")
+        match choice:
+            case "A":
+                add_recepients()
+                break
+            case "R":
+                remove_recepients()
+                break
+            case "B":
+                main()
+                return
+            case _:
+                print("Invalid choice. Please try again.")
+
+# Select Recepients - Add
+def add_recepients():
+
+    """Add Recepients Menu"""
+
+    print("---------------------------------------------------------")
+    print("Select Recepients - Add")
+    print("Toggle a group of recepient.")
+    print("If the group runs out, the program will automatically add more of the same group.")
+    print("")
+    print("[F]ounding/Refounding")
+    print("[E]jected")
+    print("[I]ndividual Nation - Note: They will be messaged one time only.")
+    print("[B]ack")
+    print("")
+    choice = input("> ")
+    match choice:
+        case "F":
+            if not toggle_recruiting_flag("flag_FoundingRefounding"):
+                logger.log(logging.INFO, "Founding/Refounding nations will be messaged.")
+                print(GREEN + "Founding/Refounding nations will be messaged." + RESET)
+            else:
+                logger.log(logging.INFO, "Founding/Refounding nations will not be messaged.")
+                print(YELLOW + "Founding/Refounding nations will not be messaged." + RESET)
+        case "E":
+            if not toggle_recruiting_flag("flag_Ejected"):
+                logger.log(logging.INFO, "Ejected nations will be messaged.")
+                print(GREEN + "Ejected nations will be messaged." + RESET)
+            else:
+                logger.log(logging.INFO, "Ejected nations will not be messaged.")
+                print(YELLOW + "Ejected nations will not be messaged." + RESET)
+        case "I":
+            print("Enter the nation name.")
+            nation = input("> ")
+            # Appended to the nation file, config.yml is only rewritten to unblock a nation it lists
+            if recipients.add(nation):
+                remove_from_config_list("blocked_nations", nation)
+            logger.log(logging.INFO, f"{nation} will be messaged.")
+            print(CYAN + f"{nation} will be messaged." + RESET)
+        case "B":
+            select_recepients_menu()
+            return
+        case _:
+            print("Invalid choice. Please try again.")
+    select_recepients_menu()
+    return
+
+# Select Recepients - Remove
+def remove_recepients():
+
+    """Remove Recepients Menu"""
+
+    print("---------------------------------------------------------")
+    print("Select Recepients - Remove")
+    print("Set a receipient to not be messaged.")
+    print("")
+    print("[I]ndividual Nation")
+    print("[B]ack")
+    print("")
+    choice = input("> ")
+    match choice:
+        case "I":
+            print("Enter the nation name.")
+            nation = input("> ")
+            if recipients.block(nation):
+                remove_from_config_list("individual_nations", nation)
+            logger.log(logging.INFO, f"{nation} will not be messaged.")
+            print(YELLOW + f"{nation} will not be messaged." + RESET)
+            select_recepients_menu()
+            return
         case "B":
             select_recepients_menu()
             return
-        case _:
-            print("Invalid choice. Please try again.")
-    with open("config.yml", 'w', encoding="utf-8") as ymlfile:
-        yaml.dump(config, ymlfile)
-    select_recepients_menu()
-    return
+        case _:
+            print("Invalid choice. Please try again.")
+            select_recepients_menu()
+            return
+
+# Toggle a recruiting flag in config.yml
+def toggle_recruiting_flag(flag):
+
+    """Flip a recruiting flag and save config.yml, returning its previous value"""
+
+    previous = config["recruiting"][flag]
+    config["recruiting"][flag] = not previous
+    save_config()
+    return previous
+
+# Remove a nation from a recipient list of config.yml
+def remove_from_config_list(name, nation):
+
+    """Drop a nation from a nation list of config.yml, whatever its case or spelling of spaces"""
+
+    nation = canonical_nation(nation)
+    config["recruiting"][name] = [listed for listed in config["recruiting"][name] if canonical_nation(listed) != nation]
+    recipients.individual.configure(config["recruiting"]["individual_nations"])
+    recipients.blocked.configure(config["recruiting"]["blocked_nations"])
+    save_config()
+
+# Save config.yml
+def save_config():
+
+    """Write config.yml, noting its new modification time so the recipients are not reloaded for it"""
+
+    with open("config.yml", 'w', encoding="utf-8") as ymlfile:
+        yaml.dump(config, ymlfile)
+    recipients.config_mtime = recipients.config_modified()
+
+# Recruit
+def recruit():
+
+    """Recruiting"""
+
+    print("---------------------------------------------------------")
+    print("Recruit")
+    print("Confirmation:")
+    print(f"User: {config['clientname']}")
+    lanes = load_lanes()
+    for lane in lanes:
+        for tg, weight in zip(lane.telegrams, lane.weights):
+            print(f"Telegram: {tg['name']} ({tg['type']}, weight {weight}) on {lane.name}")
+    print("")
+    for source in load_sources():
+        if source.weight > 0:
+            print(GREEN + f"{source.name.capitalize()} nations will be messaged, weighted {source.weight}." + RESET)
+        else:
+            print(RED + f"{source.name.capitalize()} nations will not be messaged." + RESET)
+    recipients.watch()
+    for nations, color, message in ((recipients.individual, CYAN, "will be messaged."), (recipients.blocked, YELLOW, "will not be messaged.")):
+        # Bulk lists are summarised rather than printed in full
+        if len(nations) > RECIPIENTS_LISTED:
+            print(color + f"{len(nations)} nations from {nations.path} and config.yml {message}" + RESET)
+        else:
+            for nation in nations:
+                print(color + f"{nation} {message}" + RESET)
+    if config["recruiting"]["optimization"]:
+        print(GREEN + "Optimizations are enabled." + RESET)
+    else:
+        print(RED + "Optimizations are disabled." + RESET)
+    print("")
+    print("Is this correct? [Y/N]")
+    choice = input("> ")
+    if choice != "Y":
+        print("Recruitment cancelled.")
+        logger.log(logging.INFO, "Recruitment cancelled.")
+        main()
+        return
+    else:
+        print("Recruitment started.")
+        logger.log(logging.INFO, "Recruitment started.")
+    print("---------------------------------------------------------")
+    # Get people to telegram -> send them telegram -> rinse and repeat
+    recruitment_loop(lanes)
+
+def recruitment_loop(lanes=None):
+
+    """Recruitment Loop"""
+
+    if lanes is None:
+        lanes = load_lanes()
+    start_metrics()
+    if config.get("runtime") == "asyncio":
+        asyncio.run(recruitment_loop_async(lanes))
+        return
+    prefetcher = Prefetcher(len(lanes))
+    metrics.gauge("recruiter_prefetch_depth", prefetcher.buffer.qsize)
+    if checkpoint is not None:
+        checkpoint.restore(prefetcher)
+        checkpoint.start()
+    start_stream()
+    start_upkeep()
+    prefetcher.start()
+    for lane in lanes:
+        lane.start(prefetcher)
+    for lane in lanes:
+        lane.thread.join()
+
+# Recruitment Loop for the asyncio runtime
+async def recruitment_loop_async(lanes):
+
+    """Recruitment Loop running discovery, sending and upkeep as tasks of one event loop"""
+
+    global async_client
+    if async_client is None:
+        async_client = AsyncAPIClient(scheduler, api_client)
+    prefetcher = AsyncPrefetcher(len(lanes))
+    metrics.gauge("recruiter_prefetch_depth", prefetcher.buffer.qsize)
+    if checkpoint is not None:
+        checkpoint.restore(prefetcher)
+    start_stream()
+    tasks = [asyncio.create_task(prefetcher.run(), name="Prefetcher")]
+    tasks += [asyncio.create_task(lane.run_async(prefetcher), name=lane.name) for lane in lanes]
+    tasks.append(asyncio.create_task(report_status(prefetcher), name="Status"))
+    tasks.append(asyncio.create_task(upkeep_caches(), name="Upkeep"))
+    if checkpoint is not None:
+        tasks.append(asyncio.create_task(upkeep_checkpoint(), name="Checkpoint"))
+    logger.log(logging.DEBUG, f"asyncio runtime started with {len(lanes)} lanes over {type(api_client.transport).__name__}.")
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await async_client.close()
+
+# Report the progress of the asyncio runtime
+async def report_status(prefetcher):
+
+    """Periodically log the recruitment counters"""
+
+    while True:
+        await asyncio.sleep(STATUS_INTERVAL)
+        logger.log(logging.INFO, f"Status: {tg_target} targets found, {tg_amt} telegrams sent, {prefetcher.buffer.qsize()} prefetched.")
+
+# Start the upkeep of the caches while the threaded runtime runs
+def start_upkeep():
+
+    """Start compacting the caches periodically in a background thread"""
+
+    threading.Thread(target=upkeep_caches_thread, name="Upkeep", daemon=True).start()
+
+# Keep the caches compact while the threaded runtime runs
+def upkeep_caches_thread():
+
+    """Periodically compact the sent history and the eligibility cache"""
+
+    while True:
+        clock.sleep(COMPACT_INTERVAL)
+        upkeep_caches_once()
+
+# Keep the caches compact while the asyncio runtime runs
+async def upkeep_caches():
+
+    """Periodically compact the sent history and the eligibility cache off the event loop"""
+
+    while True:
+        await asyncio.sleep(COMPACT_INTERVAL)
+        await asyncio.to_thread(upkeep_caches_once)
+
+# Compact the caches that need it
+def upkeep_caches_once():
+
+    """Compact the sent history once most of its log is dead, and drop the expired eligibility answers"""
+
+    for name, cache in (("sent history", tg_sent_history), ("eligibility cache", eligibility)):
+        try:
+            if cache is not None:
+                cache.upkeep()
+        except Exception as e:
+            logger.log(logging.ERROR, f"Compacting the {name} failed: {e}")
+
+# Checkpoint periodically while the asyncio runtime runs
+async def upkeep_checkpoint():
+
+    """Periodically checkpoint the runtime state off the event loop"""
+
+    while True:
+        await asyncio.sleep(checkpoint.interval)
+        await asyncio.to_thread(checkpoint.checkpoint)
+
+# Send Lane
+class SendLane():
+
+    """Sends telegrams through one API client key, with its own telegram rate limit"""
+
+    def __init__(self, name, clientkey):
+
+        """Initialize SendLane"""
+
+        self.name = name
+        self.clientkey = clientkey
+        self.telegrams = []
+        self.weights = []
+        self.bucket = f"telegram:{clientkey}"
+        self.thread = None
+        scheduler.add_bucket(self.bucket, 1, RECRUITMENT_TELEGRAM_RATELIMIT)
+
+    def add_telegram(self, tg, weight=1):
+
+        """Add a telegram to send, picked with probability proportional to its weight"""
+
+        self.telegrams.append(tg)
+        self.weights.append(weight)
+
+    def pick_telegram(self):
+
+        """Pick the next telegram by weight, applying its rate limit to the lane"""
+
+        tg = random.choices(self.telegrams, weights=self.weights, k=1)[0]
+        scheduler.buckets[self.bucket].set_period(telegram_ratelimit(tg))
+        return tg
+
+    def start(self, prefetcher):
+
+        """Start sending in a background thread"""
+
+        self.thread = threading.Thread(target=self.run, args=(prefetcher,), name=self.name, daemon=True)
+        self.thread.start()
+        logger.log(logging.DEBUG, f"Sending {self.name} started.")
+
+    def run(self, prefetcher):
+
+        """Send to the shared prefetched targets as fast as this lane's rate limit allows"""
+
+        while True:
+            next_target = None
+            try:
+                tg = self.pick_telegram()
+                # Wait out the cooldown before taking a target, so it is as fresh as possible when sent
+                scheduler.wait_ready(self.bucket)
+                next_target = prefetcher.get()
+                kind = unvetted_kind(next_target, tg)
+                if kind is not None and not eligibility.check(next_target, kind):
+                    skip_target(next_target, tg, prefetcher)
+                    continue
+                print(f"Next target: {next_target}")
+                send_telegram(next_target, tg, self)
+                prefetcher.release(next_target)
+                if checkpoint is not None:
+                    checkpoint.checkpoint() # The cooldown has to survive a restart right after the telegram
+            except Exception as e:
+                clock.sleep(self.failed(e, next_target, prefetcher))
+
+    async def run_async(self, prefetcher):
+
+        """Send to the shared prefetched targets as fast as this lane's rate limit allows, as an asyncio task"""
+
+        while True:
+            next_target = None
+            try:
+                tg = self.pick_telegram()
+                await scheduler.wait_ready_async(self.bucket)
+                next_target = await prefetcher.get()
+                kind = unvetted_kind(next_target, tg)
+                if kind is not None and not await eligibility.check_async(next_target, kind):
+                    skip_target(next_target, tg, prefetcher)
+                    continue
+                print(f"Next target: {next_target}")
+                await send_telegram_async(next_target, tg, self)
+                prefetcher.release(next_target)
+                if checkpoint is not None:
+                    await asyncio.to_thread(checkpoint.checkpoint) # The cooldown has to survive a restart right after the telegram
+            except Exception as e:
+                await asyncio.sleep(self.failed(e, next_target, prefetcher))
+
+    def failed(self, e, target, prefetcher):
+
+        """Report an unexpected error of the lane, returning how long to wait before sending again.
+        The target it was handling is released, so the discovery may find it again."""
+
+        if target is not None:
+            prefetcher.release(target)
+        print(f"{self.name} has hit an error({e}). Waiting {SEND_RETRY_DELAY} seconds before trying again.")
+        logger.log(logging.ERROR, f"{self.name} has hit an error({e}). Waiting {SEND_RETRY_DELAY} seconds before trying again.")
+        return SEND_RETRY_DELAY
+
+# Return the eligibility check a prefetched target still needs before a lane sends it a telegram
+def unvetted_kind(target, tg):
+
+    """Eligibility check of a telegram that the target was not vetted for, None if it needs none.
+    Targets are vetted for the selected telegram, while a lane may send a telegram of the other kind."""
+
+    if not config['recruiting']['optimization'] or target in recipients.individual:
+        return None
+    kind = telegram_kind(tg)
+    return None if kind == telegram_kind() else kind
+
+# Skip a prefetched target that cannot receive the telegram its lane picked
+def skip_target(target, tg, prefetcher):
+
+    """Drop a target without sending, leaving the lane's cooldown untouched"""
+
+    prefetcher.release(target)
+    tg_skipped.add(target)
+    metrics.inc("recruiter_skipped_total", rule="ineligible")
+    record("skipped", target, telegram=tg['name'], outcome="ineligible")
+    print(f"{target} cannot receive {tg['name']}, skipping.")
+    logger.log(logging.DEBUG, f"{target} cannot receive {tg['name']}, skipping.")
+
+# Return the telegram rate limit of a telegram
+def telegram_ratelimit(tg):
+
+    """Telegram rate limit in seconds"""
+
+    if tg["type"] == "Recruitment":
+        return RECRUITMENT_TELEGRAM_RATELIMIT
+    return NONRECRUITMENT_TELEGRAM_RATELIMIT
+
+# Load the sending lanes configured in config.yml, or a single lane for the selected telegram
+def load_lanes():
+
+    """Load the sending lanes"""
+
+    global telegram
+    lanes = {}
+    for lane_config in config.get("lanes") or []:
+        if lane_config["clientkey"] not in lanes:
+            lanes[lane_config["clientkey"]] = SendLane(f"Lane {len(lanes) + 1}", lane_config["clientkey"])
+        lane = lanes[lane_config["clientkey"]]
+        for tg_config in lane_config["telegrams"]:
+            with open(os.path.join(PWD, "telegrams", tg_config["file"]), 'r', encoding="utf-8") as telegram_file:
+                lane.add_telegram(yaml.safe_load(telegram_file), tg_config.get("weight", 1))
+    if not lanes:
+        lane = SendLane("Lane 1", config["clientkey"])
+        lane.add_telegram(telegram)
+        lanes[config["clientkey"]] = lane
+    if telegram is None:
+        telegram = next(iter(lanes.values())).telegrams[0]
+    return list(lanes.values())
+
+# Prefetch Buffer
+class PrefetchBuffer():
+
+    """Bounded buffer of vetted targets and the times they were found, shared by the threaded and asyncio prefetchers.
+    Buffered targets are claimed, so the discovery does not find them again before they are sent."""
+
+    QUEUE = queue.Queue
+
+    def __init__(self, lanes=1):
+
+        """Initialize PrefetchBuffer, buffering at least one target per sending lane"""
+
+        prefetch_config = config["recruiting"].get("prefetch", {})
+        self.max_age = prefetch_config.get("max_age", PREFETCH_MAX_AGE)
+        self.buffer = self.QUEUE(maxsize=max(lanes, prefetch_config.get("size", PREFETCH_SIZE)))
+        self.buffered = {} # target -> time it was found, for checkpoints
+
+    def claim(self, target):
+
+        """Claim a target that was found, returning its buffer entry, or None if nothing was found"""
+
+        if target is None:
+            return None
+        tg_claimed.add(target)
+        found_at = clock.time()
+        self.buffered[target] = found_at
+        return target, found_at
+
+    def fresh(self, entry):
+
+        """Whether a buffer entry taken out is still fresh enough to send, releasing its target otherwise"""
+
+        target, found_at = entry
+        self.buffered.pop(target, None)
+        if clock.time() - found_at <= self.max_age:
+            return True
+        tg_claimed.discard(target)
+        logger.log(logging.DEBUG, f"{target} was prefetched too long ago, skipping.")
+        return False
+
+    def failed(self, e):
+
+        """Report a failed discovery, returning how long to wait before trying again"""
+
+        print(f"Prefetcher has hit an error({e}). Waiting {PREFETCH_RETRY_DELAY} seconds before trying again.")
+        logger.log(logging.ERROR, f"Prefetcher has hit an error({e}). Waiting {PREFETCH_RETRY_DELAY} seconds before trying again.")
+        return PREFETCH_RETRY_DELAY
+
+    def release(self, target):
+
+        """Release the claim on a target once its telegram has been handled"""
+
+        tg_claimed.discard(target)
+
+    def state(self):
+
+        """Buffered targets and when they were found, for a checkpoint"""
+
+        return list(dict(self.buffered).items())
+
+    def restore(self, targets):
+
+        """Buffer the targets of a checkpoint again, unless they have been sent telegram since"""
+
+        for target, found_at in targets:
+            if target in tg_sent_history or target in tg_claimed or self.buffer.full():
+                continue
+            tg_claimed.add(target)
+            self.buffered[target] = found_at
+            self.buffer.put_nowait((target, found_at))
+
+# Prefetcher
+class Prefetcher(PrefetchBuffer):
+
+    """Background worker keeping a bounded buffer of vetted targets ready for sending"""
+
+    def __init__(self, lanes=1):
+
+        """Initialize Prefetcher"""
+
+        super().__init__(lanes)
+        self.thread = threading.Thread(target=self.run, name="Prefetcher", daemon=True)
+
+    def start(self):
+
+        """Start the background worker"""
+
+        self.thread.start()
+        logger.log(logging.DEBUG, "Prefetcher started.")
+
+    def run(self):
+
+        """Find targets and buffer them, blocking while the buffer is full"""
+
+        while True:
+            try:
+                entry = self.claim(find_next_target())
+            except Exception as e:
+                clock.sleep(self.failed(e))
+                continue
+            if entry is not None:
+                self.buffer.put(entry)
+
+    def get(self):
+
+        """Pop the next buffered target, dropping any that went stale while waiting"""
+
+        while True:
+            entry = self.buffer.get()
+            if self.fresh(entry):
+                return entry[0]
+
+# Prefetcher for the asyncio runtime
+class AsyncPrefetcher(PrefetchBuffer):
+
+    """Task keeping a bounded buffer of vetted targets ready for the sending lanes"""
+
+    QUEUE = asyncio.Queue
+
+    async def run(self):
+
+        """Find targets and buffer them, waiting while the buffer is full"""
+
+        while True:
+            try:
+                entry = self.claim(await find_next_target_async())
+            except Exception as e:
+                await asyncio.sleep(self.failed(e))
+                continue
+            if entry is not None:
+                await self.buffer.put(entry)
+
+    async def get(self):
+
+        """Pop the next buffered target, dropping any that went stale while waiting"""
+
+        while True:
+            entry = await self.buffer.get()
+            if self.fresh(entry):
+                return entry[0]
+
+# Target Source
+class TargetSource():
+
+    """A source of candidates: the events of a happenings feed whose text matches a pattern capturing the nation"""
+
+    def __init__(self, name, filter, pattern, weight=1, view=None):
+
+        """Initialize TargetSource"""
+
+        self.name = name
+        self.weight = weight
+        self.filter = filter
+        self.view = view
+        self.pattern = re.compile(pattern)
+        # Sources reading the same happenings share one fetch of it
+        self.feed = f"filter={filter}" if view is None else f"view={view};filter={filter}"
+
+    def match(self, text):
+
+        """Nation an event text is about if this source accepts it, else None"""
+
+        match = self.pattern.search(text)
+        return None if match is None else match.group(1)
+
+# Load the candidate sources configured in config.yml
+def load_sources():
+
+    """Candidate sources: the built in ones weighted by the ratio, then the configured ones.
+    A configured source replaces a built in one of the same name."""
+
+    sources = {}
+    weights = config["recruiting"].get("freshness", {}).get("weights", {})
+    for name, source in TARGET_SOURCES.items():
+        weight = weights.get(name, config["recruiting"]["ratio"][source["ratio"]])
+        sources[name] = TargetSource(name, source["filter"], source["pattern"], weight)
+    for source in config["recruiting"].get("sources", []):
+        try:
+            weight = weights.get(source["name"], source.get("weight", 1))
+            sources[source["name"]] = TargetSource(source["name"], source["filter"], source["pattern"], weight, source.get("view"))
+        except (KeyError, re.error) as e:
+            logger.log(logging.ERROR, f"Ignoring candidate source {source}: {e}")
+    return list(sources.values())
+
+# Event Rate
+class EventRate():
+
+    """Exponentially weighted estimate of the rate of some events, from their timestamps"""
+
+    def __init__(self, half_life=POLL_RATE_HALF_LIFE):
+
+        """Initialize EventRate"""
+
+        self.tau = half_life / math.log(2)
+        self.weight = 0.0 # Events seen, each decayed by its age at the time of the latest one
+        self.latest = None # Timestamp of the latest event
+        self.since = None # Timestamp of the earliest event, the estimate covers the time since
+
+    def observe(self, timestamp):
+
+        """Count an event, which may arrive out of order"""
+
+        if self.latest is None:
+            self.latest = self.since = timestamp
+        if timestamp >= self.latest:
+            self.weight = self.weight * math.exp((self.latest - timestamp) / self.tau) + 1
+            self.latest = timestamp
+        else:
+            self.weight += math.exp((timestamp - self.latest) / self.tau)
+        self.since = min(self.since, timestamp)
+
+    def rate(self, now):
+
+        """Events per second as of now, 0 before any event"""
+
+        if self.latest is None:
+            return 0.0
+        weight = self.weight * math.exp(-max(now - self.latest, 0) / self.tau)
+        # Correct for having watched for less than the decay window, so a fresh estimate is not biased low
+        watched = 1 - math.exp(-max(now - self.since, 1) / self.tau)
+        return weight / (self.tau * watched)
+
+    def state(self):
+
+        """Estimate, for a checkpoint"""
+
+        return [self.weight, self.latest, self.since]
+
+    def restore(self, state):
+
+        """Resume the estimate of a checkpoint"""
+
+        self.weight, self.latest, self.since = state
+
+# Candidate Queue
+class CandidateQueue():
+
+    """Priority queue of candidate nations ingested once from the world happenings feeds.
+    Each feed is fetched once for all of the sources reading it.
+    Serves the freshest candidate first, weighing each source, and drops candidates past the maximum age.
+    Polls each feed as often as its estimated rate of candidates deserves within the request budget."""
+
+    def __init__(self, sources=None):
+
+        """Initialize CandidateQueue"""
+
+        freshness = config["recruiting"].get("freshness", {})
+        self.max_age = freshness.get("max_age", CANDIDATE_MAX_AGE)
+        half_life = freshness.get("half_life", CANDIDATE_HALF_LIFE)
+        polling = config["recruiting"].get("polling", {})
+        self.budget = polling.get("budget", POLL_BUDGET) / 60
+        self.min_interval = polling.get("min_interval", POLL_MIN_INTERVAL)
+        self.max_interval = polling.get("max_interval", POLL_MAX_INTERVAL)
+        sources = load_sources() if sources is None else sources
+        # Heaviest first, so an event two sources accept goes to the one with the best odds
+        self.sources = sorted((source for source in sources if source.weight > 0), key=lambda source: -source.weight)
+        self.feeds = {} # feed -> sources reading it
+        for source in self.sources:
+            self.feeds.setdefault(source.feed, []).append(source)
+        # If the odds of joining halve every half life, a source weight is worth a fixed head start in seconds,
+        # so priorities never change as candidates age and a heap keeps them in order
+        self.head_start = {source.name: half_life * math.log2(source.weight) for source in self.sources}
+        self.heap = [] # (-priority, sequence, timestamp, source name, nation)
+        self.sequence = itertools.count()
+        self.depth = {source.name: 0 for source in self.sources} # Candidates queued per source
+        self.rates = {source.name: EventRate(polling.get("rate_half_life", POLL_RATE_HALF_LIFE)) for source in self.sources}
+        self.last_event_id = {} # Highest event ID seen per feed, passed back as sinceid
+        self.due = {} # Time each feed is next due to be polled, picked whenever it is ingested
+        self.stream = None # HappeningsStream pushing the events of some feeds, which are only polled while it is down
+        self.arrived = threading.Event() # Set when the stream pushes a candidate
+        self.wakeup = None # Wakes the asyncio runtime's search while it waits
+        self.lock = threading.Lock() # The stream pushes from its own thread
+        for source in self.sources:
+            metrics.gauge("recruiter_candidate_queue_depth", lambda name=source.name: self.depth[name], source=source.name)
+            metrics.gauge("recruiter_candidate_rate_per_hour", lambda name=source.name: self.rates[name].rate(clock.time()) * 3600, source=source.name)
+        for feed in self.feeds:
+            metrics.gauge("recruiter_poll_interval_seconds", lambda feed=feed: self.intervals(self.polled_feeds()).get(feed, 0), feed=feed)
+
+    def refill(self, feed):
+
+        """Fetch the happenings newer than the last seen event and queue the candidates of its sources.
+        Returns the status code of the request and the (source name, nation) candidates added."""
+
+        if shared_cache is not None:
+            status_code, events = self.fetch_shared(feed)
+            return status_code, self.ingest(feed, events)
+        with api_client.get("api", self.query(feed), stream=True) as request:
+            if request.status_code == 200:
+                return request.status_code, self.ingest(feed, iter_happenings(request.iter_content(STREAM_CHUNK_SIZE)))
+            return request.status_code, []
+
+    async def refill_async(self, feed):
+
+        """Fetch the happenings newer than the last seen event and queue the candidates of its sources, as a coroutine.
+        Returns the status code of the request and the (source name, nation) candidates added."""
+
+        if shared_cache is not None:
+            status_code, events = await asyncio.to_thread(self.fetch_shared, feed)
+            return status_code, self.ingest(feed, events)
+        request = await async_client.get("api", self.query(feed))
+        if request.status_code == 200:
+            return request.status_code, self.ingest(feed, iter_happenings([request.content]))
+        return request.status_code, []
+
+    def fetch_shared(self, feed):
+
+        """Read the events of a feed newer than the last seen one from the shared cache.
+        Only one recruiter of the host fetches a stale feed, the others read what it stored.
+        Returns the status code of the request and the events."""
+
+        status_code = 200
+        lease = f"happenings;{feed}"
+        if not shared_cache.fresh(feed) and shared_cache.acquire(lease):
+            try:
+                with api_client.get("api", self.query(feed, shared_cache.last_event_id(feed)), stream=True) as request:
+                    status_code = request.status_code
+                    if status_code == 200:
+                        shared_cache.store_happenings(feed, iter_happenings(request.iter_content(STREAM_CHUNK_SIZE)))
+            finally:
+                shared_cache.release(lease)
+        if status_code != 200:
+            return status_code, []
+        return status_code, shared_cache.happenings(feed, self.last_event_id.get(feed, 0))
+
+    def query(self, feed, since=None):
+
+        """Happenings query of a feed, asking only for events after the last one seen"""
+
+        since = self.last_event_id.get(feed) if since is None else since
+        query = f"q=happenings;{feed};limit=50"
+        if since:
+            query += f";sinceid={since}"
+        return query
+
+    def ingest(self, feed, events):
+
+        """Queue the candidates of a polled happenings page by freshness and drop expired ones.
+        Returns the (source name, nation) candidates added."""
+
+        nations = self.enqueue([feed], events)
+        now = clock.time()
+        rate = sum(self.rates[source.name].rate(now) for source in self.feeds.get(feed, []))
+        logger.log(logging.DEBUG, f"Polled {feed}: {rate * 3600:.1f} candidates per hour, polling again in {self.due[feed] - now:.0f} seconds.")
+        return nations
+
+    def push(self, feeds, events):
+
+        """Queue the candidates of events pushed by the stream and wake up a waiting search.
+        Returns the (source name, nation) candidates added."""
+
+        nations = self.enqueue(feeds, events)
+        if nations:
+            self.arrived.set()
+            wakeup = self.wakeup
+            if wakeup is not None:
+                wakeup()
+        return nations
+
+    def enqueue(self, feeds, events):
+
+        """Queue the candidates of events of some feeds by freshness and drop expired ones.
+        Returns the (source name, nation) candidates added."""
+
+        nations = []
+        now = clock.time()
+        # Heaviest first across the feeds, as event IDs and the sources' patterns are shared by all of them
+        sources = [source for source in self.sources if source.feed in feeds]
+        with self.lock:
+            seen = max((self.last_event_id.get(feed, 0) for feed in feeds), default=0)
+            for event_id, timestamp, text in events:
+                for feed in feeds:
+                    if event_id > self.last_event_id.get(feed, 0):
+                        self.last_event_id[feed] = event_id
+                timestamp = now if timestamp is None else timestamp
+                for source in sources:
+                    nation = source.match(text)
+                    if nation is not None:
+                        # Old events still tell how busy the source is, events seen before do not count twice
+                        if not event_id or event_id > seen:
+                            self.rates[source.name].observe(timestamp)
+                        if timestamp >= now - self.max_age:
+                            nations.append((source.name, nation))
+                            heapq.heappush(self.heap, (-(timestamp + self.head_start[source.name]), next(self.sequence), timestamp, source.name, nation))
+                            self.depth[source.name] += 1
+                        break
+            intervals = self.intervals(set(self.polled_feeds()) | set(feeds))
+            for feed in feeds:
+                self.due[feed] = now + intervals[feed]
+            self.expire(now)
+        return nations
+
+    def expire(self, now):
+
+        """Drop the candidates past the maximum age, wherever they are in the heap. Called holding the lock."""
+
+        oldest = now - self.max_age
+        if all(entry[2] >= oldest for entry in self.heap):
+            return
+        self.heap = [entry for entry in self.heap if entry[2] >= oldest]
+        heapq.heapify(self.heap)
+        self.depth = dict.fromkeys(self.depth, 0)
+        for entry in self.heap:
+            self.depth[entry[3]] += 1
+
+    def state(self):
+
+        """Queued candidates and feed positions, for a checkpoint"""
+
+        with self.lock:
+            return {
+                "candidates": [[timestamp, source, nation] for _, _, timestamp, source, nation in self.heap],
+                "last_event_id": dict(self.last_event_id),
+                "due": dict(self.due),
+                "rates": {name: rate.state() for name, rate in self.rates.items()},
+            }
+
+    def restore(self, state):
+
+        """Resume from a checkpoint, requeueing the candidates of sources that still exist"""
+
+        with self.lock:
+            for timestamp, source, nation in state["candidates"]:
+                if source in self.head_start:
+                    heapq.heappush(self.heap, (-(timestamp + self.head_start[source]), next(self.sequence), timestamp, source, nation))
+                    self.depth[source] += 1
+            self.last_event_id.update(state["last_event_id"])
+            self.due.update(state.get("due", {}))
+            for name, rate in state.get("rates", {}).items():
+                if name in self.rates:
+                    self.rates[name].restore(rate)
+            self.expire(clock.time())
+
+    def last_seen(self, feeds):
+
+        """Highest event ID seen in any of the feeds, 0 if none"""
+
+        with self.lock:
+            return max((self.last_event_id.get(feed, 0) for feed in feeds), default=0)
+
+    def polled_feeds(self):
+
+        """Feeds to poll, leaving out those the stream pushes while it is connected"""
+
+        if self.stream is not None and self.stream.up:
+            return [feed for feed in self.feeds if feed not in self.stream.feeds]
+        return list(self.feeds)
+
+    def intervals(self, feeds):
+
+        """Seconds between polls of each feed, minimising the expected age of candidates within the request budget.
+        A feed polled every T seconds fetches its candidates T/2 seconds old on average, so one producing weighted
+        candidates at rate r adds r*T/2 to the age; minimising the sum subject to the sum of 1/T being the budget
+        gives T proportional to 1/sqrt(r). Feeds are not polled more often than they produce a candidate,
+        which leaves budget unspent in quiet hours, and feeds without an estimate yet get an even share."""
+
+        now = clock.time()
+        feeds = list(feeds)
+        rates = {} # feed -> (weighted rate, rate) of the feeds with an estimate
+        for feed in feeds:
+            if any(self.rates[source.name].latest is not None for source in self.feeds[feed]):
+                rates[feed] = (
+                    sum(source.weight * self.rates[source.name].rate(now) for source in self.feeds[feed]),
+                    sum(self.rates[source.name].rate(now) for source in self.feeds[feed]))
+        total = sum(math.sqrt(weighted) for weighted, _ in rates.values())
+        budget = self.budget * len(rates) / len(feeds) if feeds else 0
+        intervals = {}
+        for feed in feeds:
+            if self.budget <= 0:
+                interval = self.max_interval
+            elif feed not in rates:
+                interval = len(feeds) / self.budget
+            else:
+                weighted, rate = rates[feed]
+                interval = max(total / (budget * math.sqrt(weighted)), 1 / rate) if weighted > 0 else self.max_interval
+            intervals[feed] = min(max(interval, self.min_interval), self.max_interval)
+        return intervals
+
+    def stale_feeds(self):
+
+        """Feeds due to be polled for fresher candidates before queued ones are served"""
+
+        now = clock.time()
+        return [feed for feed in self.polled_feeds() if self.due.get(feed, -math.inf) <= now]
+
+    def idle_delay(self):
+
+        """Seconds until a feed is due to be polled, the idle delay if none is polled"""
+
+        now = clock.time()
+        return max(min((self.due.get(feed, -math.inf) - now for feed in self.polled_feeds()), default=IDLE_DELAY), 0)
+
+    def pop(self):
+
+        """Pop the candidate with the best odds of joining as (source name, nation), (None, None) if there is none"""
+
+        oldest = clock.time() - self.max_age
+        with self.lock:
+            while self.heap:
+                _, _, timestamp, source, nation = heapq.heappop(self.heap)
+                self.depth[source] -= 1
+                if timestamp >= oldest:
+                    metrics.observe("recruiter_candidate_age_seconds", clock.time() - timestamp, source=source)
+                    return source, nation
+        return None, None
+
+    def wait(self, timeout):
+
+        """Wait before searching again, returning early once the stream pushes a candidate"""
+
+        if self.stream is None:
+            clock.sleep(timeout)
+        elif self.arrived.wait(timeout):
+            self.arrived.clear()
+
+    async def wait_async(self, timeout):
+
+        """Wait before searching again, returning early once the stream pushes a candidate, as a coroutine"""
+
+        if self.stream is None:
+            await asyncio.sleep(timeout)
+            return
+        loop = asyncio.get_running_loop()
+        arrived = asyncio.Event()
+        # Registered before looking at the flag, so a candidate pushed in between is never missed
+        self.wakeup = lambda: loop.call_soon_threadsafe(arrived.set)
+        try:
+            if not self.arrived.is_set():
+                await asyncio.wait_for(arrived.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self.wakeup = None
+            self.arrived.clear()
+
+# Stream the events of a happenings response
+def iter_happenings(chunks):
+
+    """Incrementally parse happenings XML from chunks of bytes.
+    Yields (event_id, timestamp, text) tuples."""
+
+    parser = ET.XMLPullParser(events=("start", "end"))
+    happenings = None
+    chunks = iter(chunks)
+    while True:
+        chunk = next(chunks, None)
+        if chunk is None:
+            parser.close()
+        else:
+            parser.feed(chunk)
+        for kind, element in parser.read_events():
+            if kind == "start":
+                if element.tag == "HAPPENINGS":
+                    happenings = element
+                continue
+            if element.tag != "EVENT":
+                continue
+            try:
+                event_id = int(element.get("id", 0))
+            except ValueError:
+                event_id = 0
+            timestamp = element.findtext("TIMESTAMP")
+            timestamp = int(timestamp) if timestamp and timestamp.isdigit() else None
+            text = element.findtext("TEXT") or ""
+            # Release the event before handing it on, so memory stays flat however long the page is
+            if happenings is not None:
+                happenings.remove(element)
+            yield event_id, timestamp, text
+        if chunk is None:
+            return
+
+# Parse a server-sent events stream
+def iter_server_sent_events(lines):
+
+    """Incrementally parse server-sent events from the raw lines of a stream, which are always UTF-8.
+    Yields (event_id, data) tuples, the ID being the last one the stream sent, 0 if none."""
+
+    event_id = 0
+    data = []
+    for line in lines:
+        line = line.decode("utf-8", errors="replace")
+        if not line:
+            # A blank line dispatches the event
+            if data:
+                yield event_id, "\n".join(data)
+                data = []
+            continue
+        if line.startswith(":"):
+            continue # Comment, sent to keep the connection alive
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "data":
+            data.append(value)
+        elif field == "id":
+            event_id = int(value) if value.isdigit() else 0
+
+# Happenings Stream
+class HappeningsStream():
+
+    """Subscription to the server-sent events of the happenings, pushing candidates into a CandidateQueue as they happen.
+    Covers the sources reading the world feeds; reconnects resuming after the last event seen,
+    and the queue polls the feeds it covers while it is down."""
+
+    def __init__(self, candidates, url=STREAM_URL, timeout=STREAM_TIMEOUT):
+
+        """Initialize HappeningsStream"""
+
+        self.candidates = candidates
+        sources = [source for source in candidates.sources if source.view is None]
+        self.feeds = {source.feed for source in sources}
+        self.url = url.rstrip("/") + "/" + "+".join(sorted({source.filter for source in sources}))
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(REQUESTS_HEADER)
+        self.up = False
+        self.thread = None
+
+    def start(self):
+
+        """Listen in a background thread"""
+
+        self.thread = threading.Thread(target=self.run, name="HappeningsStream", daemon=True)
+        self.thread.start()
+        return self
+
+    def run(self):
+
+        """Listen to the stream, reconnecting whenever it drops"""
+
+        backoff = Backoff(STREAM_RECONNECT_DELAY, STREAM_MAX_RECONNECT_DELAY)
+        while True:
+            try:
+                self.listen(backoff)
+                reason = "it ended"
+            except Exception as e:
+                reason = e
+            if self.up:
+                logger.log(logging.WARNING, f"Happenings stream dropped ({reason}), polling until it reconnects.")
+            else:
+                logger.log(logging.DEBUG, f"Happenings stream unavailable ({reason}).")
+            self.up = False
+            clock.sleep(backoff.delay())
+
+    def listen(self, backoff):
+
+        """Connect and push the events of the stream until it drops"""
+
+        headers = {}
+        last_event_id = self.candidates.last_seen(self.feeds)
+        if last_event_id:
+            headers["Last-Event-ID"] = str(last_event_id)
+        timeout = (API_TIMEOUTS["default"], self.timeout)
+        with self.session.get(self.url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                raise requests.HTTPError(f"Happenings stream returned {response.status_code}")
+            backoff.reset()
+            metrics.inc("recruiter_stream_connects_total")
+            logger.log(logging.INFO, f"Happenings stream connected for {', '.join(sorted(self.feeds))}.")
+            # Read chunks as they arrive, the default of 512 bytes would hold events back until more follow.
+            # The lines stay bytes: without a charset in the content type, requests would decode them as ISO-8859-1
+            for event_id, data in iter_server_sent_events(response.iter_lines(chunk_size=None)):
+                self.push(event_id, data)
+
+    def push(self, event_id, data):
+
+        """Queue the candidate of one event and vet it while the search picks it up"""
+
+        try:
+            event = json.loads(data)
+            event_id = event_id or int(event.get("id", 0))
+            text = event.get("str", "")
+            timestamp = None if event.get("time") is None else int(event["time"])
+        except (ValueError, TypeError, AttributeError):
+            logger.log(logging.DEBUG, f"Ignoring unreadable happenings stream event {data}")
+            return
+        metrics.inc("recruiter_stream_events_total")
+        # Polling only stops once events arrive, so a connection that delivers nothing never starves the search
+        self.up = True
+        nations = self.candidates.push(self.feeds, [(event_id, timestamp, text)])
+        if nations:
+            # Vetted by the eligibility workers, so the reader never waits on the rate limit while events arrive
+            eligibility.submit_many(candidates_to_vet(nations))
+
+# Subscribe the candidate queue to the happenings stream configured in config.yml
+def start_stream():
+
+    """Push candidates from the server-sent events of the happenings, unless the stream is disabled"""
+
+    global candidate_queue
+    stream_config = config["recruiting"].get("stream", {})
+    url = stream_config.get("url", STREAM_URL)
+    if not url:
+        return
+    if candidate_queue is None:
+        candidate_queue = CandidateQueue()
+    if any(source.view is None for source in candidate_queue.sources):
+        candidate_queue.stream = HappeningsStream(candidate_queue, url, stream_config.get("timeout", STREAM_TIMEOUT)).start()
+
+# Find the next target which is not telegrammed to telegram
+def find_next_target():
+
+    """Probablistically find the next target which is not telegrammed to telegram"""
+
+    backoff = start_discovery()
+    while True:
+        nation = individual_target()
+        if nation is not None:
+            return nation
+        started = clock.monotonic()
+        try:
+            source, nation = next_candidate()
+        except Exception as e:
+            clock.sleep(discovery_failed(e, backoff))
+            continue
+        if discovered(source, nation, started):
+            return nation
+        candidate_queue.wait(discovery_idle(backoff))
+
+# Find the next target, as a coroutine for the asyncio runtime
+async def find_next_target_async():
+
+    """Probablistically find the next target which is not telegrammed to telegram without blocking the event loop"""
+
+    backoff = start_discovery()
+    while True:
+        nation = individual_target()
+        if nation is not None:
+            return nation
+        started = clock.monotonic()
+        try:
+            source, nation = await next_candidate_async()
+        except Exception as e:
+            await asyncio.sleep(discovery_failed(e, backoff))
+            continue
+        if discovered(source, nation, started):
+            return nation
+        await candidate_queue.wait_async(discovery_idle(backoff))
+
+# Prepare a search for the next target
+def start_discovery():
+
+    """Create the candidate queue on first use, returning the backoff of the search"""
+
+    global candidate_queue
+    if candidate_queue is None:
+        candidate_queue = CandidateQueue()
+    return Backoff()
+
+# Return the next individual nation as a target, counting it
+def individual_target():
+
+    """Next individual nation to message, None if there is none"""
+
+    nation = next_individual_nation()
+    if nation is not None:
+        record("candidate", nation, source="individual")
+        count_target()
+    return nation
+
+# Count a target found
+def count_target():
+
+    """Add a target to the statistics"""
+
+    global tg_target
+    with stats_lock:
+        tg_target += 1
+
+# Account for a search through the candidates, returning True if it found a target
+def discovered(source, nation, started):
+
+    """Observe how long the search took and count the target it found"""
+
+    metrics.observe("recruiter_discovery_seconds", clock.monotonic() - started, source=source or "none")
+    if nation is None:
+        return False
+    count_target()
+    return True
+
+# Report a failed search, returning how long to wait before the next one
+def discovery_failed(e, backoff):
+
+    """Log the error of a search and back off"""
+
+    wait_time = backoff.delay()
+    print(f"An error has occured({e}). Waiting {wait_time:.0f} seconds before trying again.")
+    logger.log(logging.ERROR, f"An error has occured({e}). Waiting {wait_time:.0f} seconds before trying again.")
+    return wait_time
+
+# Report a search that found nothing, returning how long to wait for candidates
+def discovery_idle(backoff):
+
+    """Start the backoff over and wait until a feed is due"""
+
+    backoff.reset()
+    delay = candidate_queue.idle_delay()
+    print(f"Unable to locate any new nations. You may try turning off Optimization. Waiting {delay:.0f} seconds before trying again.")
+    return delay
+
+# Return the first individual nation still to be messaged
+def next_individual_nation():
+
+    """Next individual nation which is not telegrammed to telegram, or None"""
+
+    return recipients.next_individual()
+
+# Pop candidates until one passes the checks, refreshing the feeds once
+def next_candidate():
+
+    """Return the freshest recruitable nation and its source, (None, None) if there is none.
+    Raises an exception if a feed could not be fetched."""
+
+    refilled = False
+    stale = candidate_queue.stale_feeds()
+    while True:
+        if stale and not refilled:
+            source, nation = None, None # Look for fresher candidates before serving queued ones
+        else:
+            source, nation = candidate_queue.pop()
+        if nation is None:
+            if refilled:
+                return None, None
+            refilled = True
+            for feed in stale:
+                vet_candidates(refilled_page(*candidate_queue.refill(feed)))
+            continue
+        if not admit_candidate(source, nation):
+            continue
+        if recruitment_optimizer(nation, source):
+            return source, nation
+        tg_skipped.add(nation) # No need to check this nation again for a while
+
+# Pop candidates until one passes the checks, as a coroutine for the asyncio runtime
+async def next_candidate_async():
+
+    """Return the freshest recruitable nation and its source, (None, None) if there is none.
+    Raises an exception if a feed could not be fetched."""
+
+    refilled = False
+    stale = candidate_queue.stale_feeds()
+    while True:
+        if stale and not refilled:
+            source, nation = None, None # Look for fresher candidates before serving queued ones
+        else:
+            source, nation = candidate_queue.pop()
+        if nation is None:
+            if refilled:
+                return None, None
+            refilled = True
+            for feed in stale:
+                await vet_candidates_async(refilled_page(*await candidate_queue.refill_async(feed)))
+            continue
+        if not admit_candidate(source, nation):
+            continue
+        if await recruitment_optimizer_async(nation, source):
+            return source, nation
+        tg_skipped.add(nation) # No need to check this nation again for a while
+
+# Return the candidates of a refilled happenings page
+def refilled_page(status_code, nations):
+
+    """(source name, nation) candidates of a page, raising an exception if the feed could not be fetched"""
+
+    if status_code != 200:
+        raise requests.HTTPError(f"Happenings request returned {status_code}")
+    return nations
+
+# Return True if a popped candidate may go on to the optimizer, recording why it was skipped otherwise
+def admit_candidate(source, nation):
+
+    """Check a candidate against the sent history, the prefetched and blocked nations and the recent skips"""
+
+    record("candidate", nation, source=source)
+    if nation in tg_sent_history or nation in tg_claimed:
+        rule = "already_sent"
+    elif nation in recipients.blocked:
+        rule = "blocked"
+    elif nation in tg_skipped:
+        rule = "recently_skipped"
+    else:
+        return True
+    record("skipped", nation, outcome=rule)
+    return False
+
+# Retry Backoff
+class Backoff():
+
+    """Exponential backoff with jitter, capped so waits stay bounded during long outages"""
+
+    def __init__(self, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+
+        """Initialize Backoff"""
+
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+
+    def delay(self):
+
+        """Return the next wait, between half and all of the exponential delay"""
+
+        wait = min(self.cap, self.base * 2 ** min(self.attempt, 32))
+        self.attempt += 1
+        return random.uniform(wait / 2, wait)
+
+    def reset(self):
+
+        """Start over after a success"""
+
+        self.attempt = 0
+
+# Check the eligibility of a page of candidates in one burst, so the optimizer finds them cached
+def vet_candidates(candidates):
+
+    """Check the eligibility of a page of (source name, nation) candidates concurrently"""
+
+    eligibility.check_many(candidates_to_vet(candidates))
+
+# Check the eligibility of a page of candidates, as a coroutine for the asyncio runtime
+async def vet_candidates_async(candidates):
+
+    """Check the eligibility of a page of (source name, nation) candidates concurrently"""
+
+    await eligibility.check_many_async(candidates_to_vet(candidates))
+
+# Return the candidates of a page worth an eligibility check
+def candidates_to_vet(candidates):
+
+    """Nations of (source name, nation) candidates that pass the checks which need no API request, at most one round of checks"""
+
+    if not config['recruiting']['optimization']:
+        return []
+    candidates = [
+        nation for source, nation in candidates
+        if nation not in tg_sent_history
+        and nation not in tg_skipped
+        and nation not in recipients.blocked
+        and index_rule(nation, source) is None
+    ]
+    failed = name_filter.classify_many(candidates)
+    # Pages arrive newest first and the next refresh brings fresher candidates, so one round of checks is enough
+    return [nation for nation in candidates if nation not in failed][:eligibility.workers]
+
+# Send Telegram
+def send_telegram(telegram_target, tg, lane):
+
+    """Send Telegram to a nation"""
+
+    current_target = telegram_target
+    outcome, request = "transport_error", None
+    started = clock.monotonic()
+    try:
+        for _ in range(TELEGRAM_MAX_ATTEMPTS):
+            # A refused request gave its slot back, so the next attempt only waits out Retry-After
+            started = clock.monotonic()
+            request = api_client.get(lane.bucket, sendtg_query(current_target, tg, lane))
+            outcome = telegram_attempt(current_target, tg, lane, request, started)
+            if outcome != "rate_limited":
+                break
+        else:
+            logger.log(logging.ERROR, f"Gave up on {current_target} after being rate limited {TELEGRAM_MAX_ATTEMPTS} times.")
+    except Exception as e:
+        outcome = telegram_failed(current_target, tg, lane, e, started)
+    account_telegram(current_target, tg, lane, outcome, request)
+    return outcome
+
+# Send Telegram, as a coroutine for the asyncio runtime
+async def send_telegram_async(telegram_target, tg, lane):
+
+    """Send Telegram to a nation without blocking the event loop"""
+
+    current_target = telegram_target
+    outcome, request = "transport_error", None
+    started = clock.monotonic()
+    try:
+        for _ in range(TELEGRAM_MAX_ATTEMPTS):
+            # A refused request gave its slot back, so the next attempt only waits out Retry-After
+            started = clock.monotonic()
+            request = await async_client.get(lane.bucket, sendtg_query(current_target, tg, lane))
+            outcome = telegram_attempt(current_target, tg, lane, request, started)
+            if outcome != "rate_limited":
+                break
+        else:
+            logger.log(logging.ERROR, f"Gave up on {current_target} after being rate limited {TELEGRAM_MAX_ATTEMPTS} times.")
+    except Exception as e:
+        outcome = telegram_failed(current_target, tg, lane, e, started)
+    account_telegram(current_target, tg, lane, outcome, request)
+    return outcome
+
+# Return the query of a sendTG request
+def sendtg_query(target, tg, lane):
+
+    """Query sending a telegram to a target through a lane"""
+
+    return f"a=sendTG&client={lane.clientkey}&tgid={tg['tgid']}&key={tg['tgsecretkey']}&to={target}"
+
+# Account for one attempt at sending a telegram, returning its outcome
+def telegram_attempt(target, tg, lane, request, started):
+
+    """Observe and record the response of a sendTG request"""
+
+    metrics.observe("recruiter_send_seconds", clock.monotonic() - started, lane=lane.name)
+    metrics.inc("recruiter_telegrams_total", lane=lane.name, telegram=tg['name'], status=str(request.status_code))
+    outcome = telegram_outcome(request)
+    record("send", target, telegram=tg['name'], lane=lane.name, outcome=outcome, status=request.status_code, latency=clock.monotonic() - started)
+    print(f"Sent telegram {tg['name']} to {target}, got {request.status_code} ({outcome}).")
+    if outcome == "rate_limited":
+        print("We are being rate limited, waiting before trying again.")
+    return outcome
+
+# Account for an attempt at sending a telegram that got no response, returning its outcome
+def telegram_failed(target, tg, lane, e, started):
+
+    """Log and record the error of a sendTG request"""
+
+    outcome = "connect_error" if connect_failed(e) else "transport_error"
+    print(f"Tried to send telegram to {target}, but got error: {e}")
+    logger.log(logging.ERROR, f"Tried to send telegram to {target}, but got error: {e}")
+    record("send", target, telegram=tg['name'], lane=lane.name, outcome=outcome, latency=clock.monotonic() - started)
+    return outcome
+
+# Check whether an error means a request never reached the API
+def connect_failed(e):
+
+    """True when the connection itself failed, so the request was certainly not sent.
+    Read timeouts and dropped connections are ambiguous: the API may have queued the telegram before the answer was lost."""
+
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    if isinstance(e, requests.ConnectionError):
+        reason = getattr(e.args[0], "reason", e.args[0]) if e.args else None
+        return isinstance(reason, NewConnectionError)
+    return aiohttp is not None and isinstance(e, aiohttp.ClientConnectorError)
+
+# Classify the response of a sendTG request
+def telegram_outcome(request):
+
+    """Outcome of a sendTG request: queued, rejected, nonexistent, rate_limited or transport_error.
+    A request that got no response at all is a connect_error or transport_error, see telegram_failed."""
+
+    if request.status_code == 429:
+        return "rate_limited"
+    if request.status_code >= 500:
+        return "transport_error"
+    if request.status_code == 404 or re.search(NONEXISTENT_PATTERN, request.text, re.IGNORECASE):
+        return "nonexistent"
+    if request.status_code == 200 and "queued" in request.text.lower():
+        return "queued"
+    return "rejected"
+
+# Account for the outcome of a telegram
+def account_telegram(target, tg, lane, outcome, request):
+
+    """Count a telegram, giving its cooldown back only when it was certainly not sent, and cache the recipients that cannot receive it.
+    Only nations that were or may have been sent the telegram join the sent history, the others are skipped for a while."""
+
+    global tg_amt
+    metrics.inc("recruiter_telegram_outcomes_total", lane=lane.name, telegram=tg['name'], outcome=outcome)
+    if outcome in ("queued", "transport_error"):
+        tg_sent_history.add(target)
+    else:
+        tg_skipped.add(target)
+    if outcome == "queued":
+        logger.log(logging.INFO, f"Sent telegram {tg['name']} to {target}.")
+        with stats_lock:
+            tg_amt += 1
+        return
+    answer = "no response" if request is None else f"{request.status_code} {request.text.strip()[:100]}"
+    if outcome == "rate_limited":
+        return # Every refused attempt gave its slot back already
+    if outcome == "rejected" and request.status_code in (401, 403):
+        # The client key, telegram ID or secret key is wrong, not the recipient; keep the cooldown so the lane does not burn through targets
+        logger.log(logging.ERROR, f"Telegram {tg['name']} was refused on {lane.name} ({answer}), check its client key, tgid and secret key.")
+        return
+    if outcome == "transport_error":
+        # A read timeout or server error may still have queued the telegram, and a second one inside the cooldown would be refused
+        logger.log(logging.WARNING, f"Telegram {tg['name']} to {target} may not have been sent ({answer}), keeping the cooldown.")
+        return
+    scheduler.refund(lane.bucket)
+    logger.log(logging.WARNING, f"Telegram {tg['name']} to {target} was not sent: {outcome} ({answer}). Moving on to the next target.")
+    if outcome == "nonexistent":
+        for kind in ("recruit", "campaign"):
+            eligibility.store(target, kind, False)
+    elif outcome == "rejected":
+        eligibility.store(target, telegram_kind(tg), False)
+
+# Cleanse the nation given filters - if they fail the filters they will not be recruited
+# True means go on to recruit, False means do not recruit and try another
+def recruitment_optimizer(nation, source=None):
+
+    """Optimize Recruitment"""
+
+    screened = screen_candidate(nation, source)
+    if screened is not None:
+        return screened
+    if cannotRecruit(nation):
+        skip_ineligible(nation)
+        return False
+    return True
+
+# Optimize Recruitment, as a coroutine for the asyncio runtime
+async def recruitment_optimizer_async(nation, source=None):
+
+    """Optimize Recruitment without blocking the event loop"""
+
+    screened = screen_candidate(nation, source)
+    if screened is not None:
+        return screened
+    if not await eligibility.check_async(nation):
+        skip_ineligible(nation)
+        return False
+    return True
+
+# Screen a nation with the optimizer checks that need no API request
+def screen_candidate(nation, source=None):
+
+    """True to recruit the nation found by a source, False to skip it, None if its eligibility has to be checked"""
+
+    if not config['recruiting']['optimization']:
+        return True
+    if nation is None:
+        print(f"One does not simply recruit from None, skipping.")
+        logger.log(logging.DEBUG, f"One does not simply recruit from None, skipping.")
+        return False
+    if failsNameFilter(nation):
+        return False
+    if failsIndexFilter(nation, source):
+        return False
+    return None
+
+# Log a nation that cannot be recruited
+def skip_ineligible(nation):
+
+    """Count and record a nation the eligibility check ruled out"""
+
+    metrics.inc("recruiter_skipped_total", rule="ineligible")
+    record("skipped", nation, outcome="ineligible")
+    print(f"{nation} cannot be recruited, skipping.")
+    logger.log(logging.DEBUG, f"{nation} cannot be recruited, skipping.")
+
+# Return True if a nation name fails the name filter, logging the rule it failed
+def failsNameFilter(nation):
+
+    """Check a nation name against the name filter"""
+
+    failed = name_filter.classify(nation)
+    if failed is None:
+        return False
+    rule, matched = failed
+    metrics.inc("recruiter_skipped_total", rule=rule)
+    record("skipped", nation, outcome=rule)
+    print(f"{nation} matched the {rule} filter ({matched}), skipping.")
+    logger.log(logging.DEBUG, f"{nation} matched the {rule} filter ({matched}), skipping.")
+    return True
+
+# Name Filter
+class NameFilter():
+
+    """Classifies nation names against the configured filter rules in a single regex pass"""
+
+    def __init__(self, rules):
+
+        """Initialize NameFilter, compiling all rules into one alternation.
+        Rules without patterns are left out, and without any rule every name passes."""
+
+        for rule, patterns in rules.items():
+            self.check_rule(rule, patterns)
+        self.rules = [rule for rule, patterns in rules.items() if patterns]
+        self.pattern = re.compile(
+            "|".join(f"(?P<rule{i}>{'|'.join(rules[rule])})" for i, rule in enumerate(self.rules)),
+            flags=re.IGNORECASE) if self.rules else None
+
+    @staticmethod
+    def check_rule(rule, patterns):
+
+        """Raise ValueError unless a rule is a list of valid patterns"""
+
+        if not isinstance(patterns, list) or not all(isinstance(pattern, str) and pattern for pattern in patterns):
+            raise ValueError(f"the {rule} filter has to be a list of patterns, e.g. [\"puppet\", \"farm\"]")
+        for pattern in patterns:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ValueError(f"the {rule} filter pattern {pattern!r} is not a valid regex: {e}") from e
+
+    def rule_of(self, match):
+
+        """Name of the rule a match belongs to"""
+
+        return self.rules[int(match.lastgroup[len("rule"):])]
+
+    def classify(self, nation):
+
+        """Return the (rule, matched text) a nation name fails, or None if it passes"""
+
+        if self.pattern is None:
+            return None
+        match = self.pattern.search(nation)
+        if match is None:
+            return None
+        return self.rule_of(match), match.group()
+
+    def classify_many(self, nations):
+
+        """Classify a page of nation names in one pass.
+        Returns a dict of each failing nation to its (rule, matched text)."""
+
+        if self.pattern is None:
+            return {}
+        nations = list(nations)
+        starts = []
+        position = 0
+        for nation in nations:
+            starts.append(position)
+            position += len(nation) + 1
+        results = {}
+        for match in self.pattern.finditer("\n".join(nations)):
+            nation = nations[bisect.bisect_right(starts, match.start()) - 1]
+            if nation not in results:
+                results[nation] = (self.rule_of(match), match.group())
+        return results
+
+# Load the name filter configured in config.yml
+def load_name_filter():
+
+    """Load the name filter, leaving out the rules that are not lists of patterns"""
+
+    global name_filter
+    rules = config["recruiting"].get("filters", NAME_FILTERS)
+    if rules is None:
+        rules = {} # An empty filters key turns the filter off
+    if not isinstance(rules, dict):
+        print(RED + "Ignoring recruiting.filters, it has to map rule names to lists of patterns. Using the built in filters." + RESET)
+        logger.log(logging.ERROR, "Ignoring recruiting.filters, it has to map rule names to lists of patterns. Using the built in filters.")
+        rules = NAME_FILTERS
+    valid = {}
+    for rule, patterns in rules.items():
+        try:
+            NameFilter.check_rule(rule, patterns)
+        except ValueError as e:
+            print(RED + f"Ignoring a name filter in config.yml: {e}." + RESET)
+            logger.log(logging.ERROR, f"Ignoring a name filter in config.yml: {e}.")
+            continue
+        valid[rule] = patterns
+    name_filter = NameFilter(valid)
+
+# Nation Index
+class NationIndex():
+
+    """Memory mapped index of the nations of a daily dump, sorted for binary search.
+    Records hold an 8 byte hash of the canonical name and the facts of the nation, followed by the region names.
+    Reopens itself once the index file has been rebuilt, and starts a rebuild once the dump it was built from is replaced."""
+
+    MAGIC = b"NSX1"
+    HEADER = struct.Struct("<4sQQqQ") # magic, records, offset of the region names, dump modification time in ns, dump size
+    RECORD = struct.Struct("<8sqqII") # nation hash, founded, last login, region number, flags
+    WA_MEMBER = 1 # Flag of World Assembly members and delegates
+
+    def __init__(self, path, dump_path=None):
+
+        """Initialize NationIndex from an index file"""
+
+        self.path = path
+        self.dump_path = dump_path
+        self.view = self.open()
+        self.checked = clock.monotonic()
+
+    def open(self):
+
+        """Map the index file, returning its inode, map, records, region names and the dump it was built from"""
+
+        with open(self.path, 'rb') as index_file:
+            inode = os.fstat(index_file.fileno()).st_ino
+            index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, records, regions_offset, dump_mtime, dump_size = self.HEADER.unpack_from(index_map, 0)
+        if magic != self.MAGIC or regions_offset != self.HEADER.size + records * self.RECORD.size:
+            index_map.close()
+            raise ValueError(f"{self.path} is not a nation index")
+        regions = index_map[regions_offset:].decode("utf-8").split("\n")
+        return inode, index_map, records, regions, (dump_mtime, dump_size)
+
+    def reopen(self, force=False):
+
+        """Switch to a rebuilt index file and rebuild it from a newer dump, checking at most once per interval"""
+
+        now = clock.monotonic()
+        if not force and now - self.checked < NATION_INDEX_RELOAD_INTERVAL:
+            return
+        self.checked = now
+        try:
+            if os.stat(self.path).st_ino != self.view[0]:
+                # Swapped in one assignment, lookups in flight finish on the old map
+                self.view = self.open()
+                logging.debug(f"Reopened the rebuilt {self.path} with {self.view[2]} nations.")
+        except (OSError, ValueError) as e:
+            logging.debug(f"Keeping the previous nation index, {self.path} could not be reopened: {e}")
+        if self.dump_path and not self.built_from(self.dump_path):
+            start_nation_index_rebuild(self.dump_path, self.path)
+
+    def __len__(self):
+
+        """Number of nations indexed"""
+
+        return self.view[2]
+
+    def get(self, nation):
+
+        """Facts about a canonical nation as of the dump, None if it was not in the dump"""
+
+        self.reopen()
+        _, index_map, records, regions, _ = self.view
+        key = HistoryIndex.key(nation)
+        low, high = 0, records
+        while low < high:
+            middle = (low + high) // 2
+            offset = self.HEADER.size + middle * self.RECORD.size
+            record_key = index_map[offset:offset + 8]
+            if record_key < key:
+                low = middle + 1
+            elif record_key > key:
+                high = middle
+            else:
+                _, founded, last_login, region, flags = self.RECORD.unpack_from(index_map, offset)
+                return {
+                    "founded": founded or None,
+                    "last_login": last_login or None,
+                    "region": regions[region] if region < len(regions) else None,
+                    "wa": bool(flags & self.WA_MEMBER),
+                }
+        return None
+
+    @property
+    def dumped(self):
+
+        """Modification time of the dump the index was built from, None if unknown"""
+
+        dump_mtime = self.view[4][0]
+        return dump_mtime / 1e9 if dump_mtime else None
+
+    def built_from(self, dump_path):
+
+        """Whether the index was built from the dump as it is now"""
+
+        try:
+            stat = os.stat(dump_path)
+        except FileNotFoundError:
+            return True # Nothing newer to index
+        return self.view[4] == (stat.st_mtime_ns, stat.st_size)
+
+    @classmethod
+    def build(cls, dump_path, path, run_size=NATION_INDEX_RUN):
+
+        """Index a gzipped nations dump in constant memory, atomically replacing the old index.
+        Sorted runs of records are spilled to disk and merged, only the region names are held in memory.
+        Returns the number of nations indexed."""
+
+        stat = os.stat(dump_path)
+        regions = {} # canonical region -> number
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as run_dir:
+            runs = []
+            run = []
+            for nation in iter_nation_dump(dump_path):
+                region = regions.setdefault(nation["region"], len(regions))
+                flags = cls.WA_MEMBER if nation["wa"] else 0
+                run.append(cls.RECORD.pack(HistoryIndex.key(nation["name"]), nation["founded"], nation["last_login"], region, flags))
+                if len(run) >= run_size:
+                    runs.append(cls.spill(run_dir, len(runs), run))
+                    run = []
+            run.sort()
+            temp_path = path + ".tmp"
+            records = 0
+            last_key = None
+            with open(temp_path, 'wb') as index_file:
+                index_file.write(cls.HEADER.pack(cls.MAGIC, 0, 0, 0, 0))
+                for record in heapq.merge(*(cls.read_run(run_path) for run_path in runs), run):
+                    if record[:8] == last_key:
+                        continue # A hash collision, the first nation wins
+                    last_key = record[:8]
+                    index_file.write(record)
+                    records += 1
+                index_file.write("\n".join(regions).encode("utf-8"))
+                index_file.seek(0)
+                index_file.write(cls.HEADER.pack(cls.MAGIC, records, cls.HEADER.size + records * cls.RECORD.size, stat.st_mtime_ns, stat.st_size))
+                index_file.flush()
+                os.fsync(index_file.fileno())
+            os.replace(temp_path, path)
+        return records
+
+    @staticmethod
+    def spill(run_dir, number, run):
+
+        """Write a run of records in sorted order, returning its path"""
+
+        run.sort()
+        run_path = os.path.join(run_dir, f"run{number}")
+        with open(run_path, 'wb') as run_file:
+            run_file.write(b"".join(run))
+        return run_path
+
+    @classmethod
+    def read_run(cls, run_path):
+
+        """Records of a run, read a block at a time"""
+
+        with open(run_path, 'rb') as run_file:
+            while True:
+                block = run_file.read(cls.RECORD.size * 4096)
+                if not block:
+                    return
+                for offset in range(0, len(block), cls.RECORD.size):
+                    yield block[offset:offset + cls.RECORD.size]
+
+# Stream the nations of a dump
+def iter_nation_dump(dump_path):
+
+    """Incrementally parse a gzipped nations dump, releasing each nation once read.
+    Yields the canonical name and region, the founding and last login times, and World Assembly membership."""
+
+    def number(element, tag):
+        text = element.findtext(tag)
+        return int(text) if text and text.isdigit() else 0
+
+    with gzip.open(dump_path, 'rb') as dump_file:
+        root = None
+        for event, element in ET.iterparse(dump_file, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            if element.tag != "NATION":
+                continue
+            name = element.findtext("NAME")
+            if name:
+                yield {
+                    "name": canonical_nation(name),
+                    "region": canonical_nation(element.findtext("REGION") or ""),
+                    # Older dumps only have the first login, which is close to the founding
+                    "founded": number(element, "FOUNDEDTIME") or number(element, "FIRSTLOGIN"),
+                    "last_login": number(element, "LASTLOGIN"),
+                    "wa": (element.findtext("UNSTATUS") or "").startswith("WA "),
+                }
+            root.clear() # Keeps memory flat however many nations the dump holds
+
+# Download the nations dump
+def download_nation_dump(path):
+
+    """Stream the daily nations dump to a file, replacing it atomically"""
+
+    temp_path = path + ".tmp"
+    with requests.get(NATION_DUMP_URL, headers=REQUESTS_HEADER, stream=True, timeout=API_TIMEOUTS["default"]) as response:
+        response.raise_for_status()
+        with open(temp_path, 'wb') as dump_file:
+            for chunk in response.iter_content(1048576):
+                dump_file.write(chunk)
+    os.replace(temp_path, path)
+
+# Rebuild the nation index from the dump
+def rebuild_nation_index(dump_path, path):
+
+    """Index the dump and switch to the new index"""
+
+    global nation_index
+    try:
+        started = clock.monotonic()
+        records = NationIndex.build(dump_path, path)
+        logger.log(logging.INFO, f"Indexed {records} nations of {dump_path} in {clock.monotonic() - started:.0f} seconds.")
+        if nation_index is None:
+            nation_index = NationIndex(path, dump_path)
+        else:
+            nation_index.reopen(force=True)
+    except (OSError, ValueError, EOFError, ET.ParseError) as e:
+        logger.log(logging.ERROR, f"Could not index {dump_path}: {e}")
+    finally:
+        nation_index_lock.release()
 
-# Select Recepients - Remove
-def remove_recepients():
+# Start rebuilding the nation index in the background
+def start_nation_index_rebuild(dump_path, path):
 
-    """Remove Recepients Menu"""
+    """Index the dump in a background thread unless it is being or was already indexed as it is now"""
 
-    print("---------------------------------------------------------")
-    print("Select Recepients - Remove")
-    print("Set a receipient to not be messaged.")
-    print("")
-    print("[I]ndividual Nation")
-    print("[B]ack")
-    print("")
-    choice = input("> ")
-    match choice:
-        case "I":
-            print("Enter the nation name.")
-            nation = input("> ")
-            try:
-                config["recruiting"]["individual_nations"].remove(nation)
-            except ValueError:
-                pass
-            config["recruiting"]["blocked_nations"].append(nation)
-            logger.log(logging.INFO, f"{nation} will not be messaged.")
-            print(YELLOW + f"{nation} will not be messaged." + RESET)
-            with open("config.yml", 'w', encoding="utf-8") as ymlfile:
-                yaml.dump(config, ymlfile)
-            select_recepients_menu()
-            return
-        case "B":
-            select_recepients_menu()
-            return
-        case _:
-            print("Invalid choice. Please try again.")
-            select_recepients_menu()
-            return
+    global nation_index_attempted
+    try:
+        stat = os.stat(dump_path)
+    except FileNotFoundError:
+        return
+    if (stat.st_mtime_ns, stat.st_size) == nation_index_attempted or not nation_index_lock.acquire(blocking=False):
+        return
+    nation_index_attempted = (stat.st_mtime_ns, stat.st_size)
+    # The lock is released by the thread once the build is done
+    threading.Thread(target=rebuild_nation_index, args=(dump_path, path), name="NationIndex", daemon=True).start()
 
-# Recruit
-def recruit():
+# Load the nation index configured in config.yml
+def load_nation_index():
 
-    """Recruiting"""
+    """Open the nation index, indexing the dump again in the background if the dump is newer"""
 
-    print("---------------------------------------------------------")
-    print("Recruit")
-    print("Confirmation:")
-    print(f"User: {config['clientname']}")
-    print(f"Telegram: {telegram['name']}")
-    print(f"Type: {telegram['type']}")
-    print("")
-    if config["recruiting"]["ratio"]["found"] > 0:
-        print(GREEN + f"Founding nations will be messaged with {config['recruiting']['ratio']['found']*100}% probability." + RESET)
-    else:
-        print(RED + "Founding nations will not be messaged." + RESET)
-    if config["recruiting"]["ratio"]["refound"] > 0:
-        print(GREEN + f"Refounding nations will be messaged with {config['recruiting']['ratio']['refound']*100}% probability." + RESET)
-    else:
-        print(RED + "Refounding nations will not be messaged." + RESET)
-    if config["recruiting"]["ratio"]["ejected"] > 0:
-        print(GREEN + f"Ejected nations will be messaged with {config['recruiting']['ratio']['ejected']*100}% probability." + RESET)
-    else:
-        print(RED + "Ejected nations will not be messaged." + RESET)
-    for nation in config["recruiting"]["individual_nations"]:
-        print(CYAN + f"{nation} will be messaged." + RESET)
-    for nation in config["recruiting"]["blocked_nations"]:
-        print(YELLOW + f"{nation} will not be messaged." + RESET)
-    if config["recruiting"]["optimization"]:
-        print(GREEN + "Optimizations are enabled." + RESET)
-    else:
-        print(RED + "Optimizations are disabled." + RESET)
-    print("")
-    print("Is this correct? [Y/N]")
-    choice = input("> ")
-    if choice != "Y":
-        print("Recruitment cancelled.")
-        logger.log(logging.INFO, "Recruitment cancelled.")
-        main()
+    global nation_index
+    index_config = config["recruiting"].get("nation_index", {})
+    path = index_config.get("file", NATION_INDEX_FILE)
+    dump_path = index_config.get("dump", NATION_DUMP_FILE)
+    nation_index = None
+    if not path:
         return
-    else:
-        print("Recruitment started.")
-        logger.log(logging.INFO, "Recruitment started.")
-    print("---------------------------------------------------------")
-    # Get people to telegram -> send them telegram -> rinse and repeat
-    recruitment_loop()
+    try:
+        nation_index = NationIndex(path, dump_path)
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        logger.log(logging.WARNING, f"Ignoring the nation index {path}: {e}")
+    if nation_index is None or not nation_index.built_from(dump_path):
+        start_nation_index_rebuild(dump_path, path)
 
-def recruitment_loop():
+# Return the rule an indexed nation fails, None if it passes or is not in the index
+def index_rule(nation, source=None):
 
-    """Recruitment Loop"""
+    """Check a nation found by a source against the facts of the nation index.
+    Ages are measured as of the dump, so an old dump does not make every nation look inactive.
+    The dump describes the previous life of a refounded nation, so only its region is checked."""
 
-    while True:
-        next_target = find_next_target()
-        print(f"Next target: {next_target}")
-        send_telegram(next_target)
+    if nation_index is None:
+        return None
+    index_config = config["recruiting"].get("nation_index", {})
+    skip_regions = index_config.get("skip_regions") or []
+    max_age = index_config.get("max_age_days", NATION_MAX_AGE_DAYS) * 86400
+    max_inactive = index_config.get("max_inactive_days", NATION_MAX_INACTIVE_DAYS) * 86400
+    if not (skip_regions or max_age or max_inactive):
+        return None
+    facts = nation_index.get(nation)
+    if facts is None:
+        return None # Founded after the dump, nothing is known yet
+    if facts["region"] in {canonical_nation(region) for region in skip_regions}:
+        return "puppet_region"
+    dumped = nation_index.dumped
+    if dumped is None or TARGET_SOURCES.get(source, {}).get("ratio") == "refound":
+        return None
+    if max_age and facts["founded"] and dumped - facts["founded"] > max_age:
+        return "founded_long_ago"
+    if max_inactive and facts["last_login"] and dumped - facts["last_login"] > max_inactive:
+        return "inactive"
+    return None
 
-# Find the next target which is not telegrammed to telegram
-def find_next_target():
+# Return True if a nation fails the nation index rules, logging the rule it failed
+def failsIndexFilter(nation, source=None):
 
-    """Probablistically find the next target which is not telegrammed to telegram"""
+    """Check a nation found by a source against the nation index"""
 
-    global tg_target
-    for nation in config["recruiting"]["individual_nations"]:
-        if nation not in tg_sent_history:
-            if nation not in config["recruiting"]["blocked_nations"]:
-                tg_target += 1
-                return nation
-    options = ['founding', 'refounding', 'ejected']
-    weight = [config["recruiting"]["ratio"]["found"], config["recruiting"]["ratio"]["refound"], config["recruiting"]["ratio"]["ejected"]]
-    selected = random.choices(options, weights=weight, k=1)[0]
-
-    if selected == "founding":
-        time.sleep(0.1) # To prevent API spamming
-        try:
-            request = requests.get("https://www.nationstates.net/cgi-bin/api.cgi?q=happenings;filter=founding;limit=50", headers=REQUESTS_HEADER, timeout=REQ_TIMEOUT)
-        except Exception as e:
-            print(f"An error has occured({e}). Waiting 30 seconds before trying again.")
-            logger.log(logging.ERROR, f"An error has occured({e}). Waiting 30 seconds before trying again.")
-            time.sleep(30)
-            return find_next_target()
-        if request.status_code == 200:
-            world = ET.fromstring(request.text)
-            happenings = world.find("HAPPENINGS")
-            for event in happenings:
-                text = event.find("TEXT").text
-                nation = re.search(r"@@(.*)@@", text).group(1)
-                action = re.search(r"@@ was (founded|refounded) in %%", text).group(1)
-                if nation not in tg_sent_history and action == "founded":
-                    if nation not in config["recruiting"]["blocked_nations"]:
-                        if recruitment_optimizer(nation):
-                            tg_target += 1
-                            return nation
-                        else:
-                            tg_sent_history.append(nation) #no need to check this nation again
-            time.sleep(30)
-            print("Unable to locate any new founding nations. You may try turning off Optimization. Waiting 30 seconds before trying again.")
-            return find_next_target()
-        elif request.status_code == 524:
-            time.sleep(30)
-            print("Unable to locate any new founding nations. You may try turning off Optimization. Waiting 30 seconds before trying again.")
-            return find_next_target()
-    elif selected == "refounding":
-        time.sleep(0.1)
+    rule = index_rule(nation, source)
+    if rule is None:
+        return False
+    reason = {
+        "puppet_region": "lives in a region of puppets",
+        "founded_long_ago": "was founded too long ago",
+        "inactive": "had not logged in for too long",
+    }[rule]
+    metrics.inc("recruiter_skipped_total", rule=rule)
+    record("skipped", nation, outcome=rule)
+    print(f"{nation} {reason}, skipping.")
+    logger.log(logging.DEBUG, f"{nation} {reason}, skipping.")
+    return True
+
+# Return True if a nation cannot be recruited
+def cannotRecruit(nation):
+
+    """Check if a nation cannot be recruited"""
+
+    return not eligibility.check(nation)
+
+# Eligibility
+class EligibilityService():
+
+    """Checks whether nations can receive the current telegram, caching the answers"""
+
+    def __init__(self, path=ELIGIBILITY_FILE, workers=ELIGIBILITY_WORKERS, ttl=ELIGIBILITY_TTL, negative_ttl=ELIGIBILITY_NEGATIVE_TTL):
+
+        """Initialize EligibilityService and load the persisted negative answers"""
+
+        self.path = path
+        self.workers = workers
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.cache = {} # (nation, kind) -> (eligible, expiry timestamp)
+        self.inflight = {} # (nation, kind) -> future of a check submitted in the background
+        self.logged = 0 # Lines in the log file, most of which expire within the negative TTL
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Eligibility")
+        self.lock = threading.Lock()
+        self.load()
+        self.file = open(self.path, 'a', encoding="utf-8")
+        if self.logged > 2 * len(self.cache):
+            self.compact()
+
+    def load(self):
+
+        """Load the negative answers that have not expired yet"""
+
+        if not os.path.exists(self.path):
+            return
+        now = clock.time()
+        with open(self.path, 'r', encoding="utf-8") as cache_file:
+            for line in cache_file:
+                self.logged += 1
+                expiry, _, rest = line.rstrip("\n").partition("\t")
+                kind, _, nation = rest.partition("\t")
+                try:
+                    expiry = float(expiry)
+                except ValueError:
+                    continue
+                if expiry > now:
+                    self.cache[(nation, kind)] = (False, expiry)
+        logging.debug(f"Loaded {len(self.cache)} ineligible nations from {self.path}.")
+
+    def cached(self, nation, kind):
+
+        """Return the cached answer for a nation, None if there is none"""
+
+        entry = self.cache.get((nation, kind))
+        if entry is None and shared_cache is not None:
+            entry = shared_cache.eligibility(nation, kind)
+            if entry is not None:
+                self.cache[(nation, kind)] = entry
+        if entry is None:
+            return None
+        eligible, expiry = entry
+        if expiry < clock.time():
+            self.cache.pop((nation, kind), None)
+            return None
+        return eligible
+
+    def store(self, nation, kind, eligible):
+
+        """Cache an answer, persisting negative ones"""
+
+        expiry = clock.time() + (self.ttl if eligible else self.negative_ttl)
+        self.cache[(nation, kind)] = (eligible, expiry)
+        if shared_cache is not None:
+            shared_cache.store_eligibility(nation, kind, eligible, expiry)
+        if not eligible:
+            with self.lock:
+                self.file.write(f"{expiry}\t{kind}\t{nation}\n")
+                self.file.flush()
+                self.logged += 1
+
+    def upkeep(self):
+
+        """Drop the expired answers, and compact the log file once most of it has expired"""
+
+        now = clock.time()
+        for key, (_, expiry) in list(self.cache.items()):
+            if expiry < now:
+                self.cache.pop(key, None)
+        if self.logged > 2 * sum(not eligible for eligible, _ in list(self.cache.values())):
+            self.compact()
+
+    def compact(self):
+
+        """Rewrite the log file with only the negative answers that have not expired"""
+
+        with self.lock:
+            now = clock.time()
+            live = [(nation, kind, expiry) for (nation, kind), (eligible, expiry) in list(self.cache.items()) if not eligible and expiry >= now]
+            temp_path = self.path + ".tmp"
+            with open(temp_path, 'w', encoding="utf-8") as cache_file:
+                for nation, kind, expiry in live:
+                    cache_file.write(f"{expiry}\t{kind}\t{nation}\n")
+            os.replace(temp_path, self.path)
+            self.file.close()
+            self.file = open(self.path, 'a', encoding="utf-8")
+            self.logged = len(live)
+        logging.debug(f"Compacted {self.path} to {len(live)} ineligible nations.")
+
+    def fetch(self, nation, kind):
+
+        """Ask the API whether a nation can receive the telegram, unless another recruiter of the host is asking already"""
+
+        if shared_cache is not None:
+            eligible = self.shared_answer(nation, kind)
+            if eligible is not None:
+                return eligible
         try:
-            request = requests.get("https://www.nationstates.net/cgi-bin/api.cgi?q=happenings;filter=founding;limit=50", headers=REQUESTS_HEADER, timeout=REQ_TIMEOUT)
+            request = api_client.get("api", f"nation={nation}&q=tgcan{kind}")
+            return self.parse(nation, kind, request)
         except Exception as e:
-            print(f"An error has occured({e}). Waiting 30 seconds before trying again.")
-            logger.log(logging.ERROR, f"An error has occured({e}). Waiting 30 seconds before trying again.")
-            time.sleep(30)
-            return find_next_target()
-        if request.status_code == 200:
-            world = ET.fromstring(request.text)
-            happenings = world.find("HAPPENINGS")
-            for event in happenings:
-                text = event.find("TEXT").text
-                nation = re.search(r"@@(.*)@@", text).group(1)
-                action = re.search(r"@@ was (founded|refounded) in %%", text).group(1)
-                if nation not in tg_sent_history and action == "refounded":
-                    if nation not in config["recruiting"]["blocked_nations"]:
-                        if recruitment_optimizer(nation):
-                            tg_target += 1
-                            return nation
-                        else:
-                            tg_sent_history.append(nation) #no need to check this nation again
-            time.sleep(30)
-            print("Unable to locate any new refounding nations. You may try turning off Optimization. Waiting 30 seconds before trying again.")
-            return find_next_target()
-        elif request.status_code == 524:
-            time.sleep(30)
-            print("Unable to locate any new refounding nations. You may try turning off Optimization. Waiting 30 seconds before trying again.")
-            return find_next_target()
-    elif selected == "ejected":
-        time.sleep(0.1) # To prevent API spamming
+            logging.debug(f"Eligibility check of {nation} failed: {e}")
+            return False
+        finally:
+            self.release_shared(nation, kind) # Only once the answer is in the cache
+
+    async def fetch_async(self, nation, kind):
+
+        """Ask the API whether a nation can receive the telegram, as a coroutine"""
+
+        if shared_cache is not None:
+            eligible = await asyncio.to_thread(self.shared_answer, nation, kind)
+            if eligible is not None:
+                return eligible
         try:
-            request = requests.get("https://www.nationstates.net/cgi-bin/api.cgi?q=happenings;filter=eject;limit=50", headers=REQUESTS_HEADER, timeout=REQ_TIMEOUT)
+            request = await async_client.get("api", f"nation={nation}&q=tgcan{kind}")
+            return self.parse(nation, kind, request)
         except Exception as e:
-            print(f"An error has occured({e}). Waiting 30 seconds before trying again.")
-            logger.log(logging.ERROR, f"An error has occured({e}). Waiting 30 seconds before trying again.")
-            time.sleep(30)
-            return find_next_target()
-        if request.status_code == 200:
-            world = ET.fromstring(request.text)
-            happenings = world.find("HAPPENINGS")
-            for event in happenings:
-                text = event.find("TEXT").text
-                nation = re.search(r"@@(.+?)@@", text).group(1)
-                if nation not in tg_sent_history:
-                    if nation not in config["recruiting"]["blocked_nations"]:
-                        if recruitment_optimizer(nation):
-                            tg_target += 1
-                            return nation
-                        else:
-                            tg_sent_history.append(nation) #no need to check this nation again
-            time.sleep(30)
-            print("Unable to locate any new ejected nations. You may try turning off Optimization. Waiting 30 seconds before trying again.")
-            return find_next_target()
-        elif request.status_code == 524:
-            time.sleep(30)
-            print("Unable to locate any new ejected nations. You may try turning off Optimization. Waiting 30 seconds before trying again.")
-            return find_next_target()
-    return None
+            logging.debug(f"Eligibility check of {nation} failed: {e}")
+            return False
+        finally:
+            self.release_shared(nation, kind) # Only once the answer is in the cache
 
+    def shared_answer(self, nation, kind):
 
-# Send Telegram
-def send_telegram(telegram_target):
+        """Wait while another recruiter of the host fetches the answer for a nation.
+        Returns its answer, or None once this recruiter holds the lease and has to fetch the answer itself."""
 
-    """Send Telegram to a nation"""
+        while not shared_cache.acquire(f"tgcan{kind}:{nation}"):
+            clock.sleep(SHARED_CACHE_POLL)
+            eligible = self.cached(nation, kind)
+            if eligible is not None:
+                return eligible
+        return None
 
-    global tg_amt
-    current_target = telegram_target
-    try:
-        request = requests.get(
-            f"https://www.nationstates.net/cgi-bin/api.cgi?a=sendTG&client={config['clientkey']}&tgid={telegram['tgid']}&key={telegram['tgsecretkey']}&to={current_target}", 
-            headers=REQUESTS_HEADER,
-            timeout=REQ_TIMEOUT)
-        print(f"Sent telegram to {current_target}, got {request.status_code}.")
-        if request.status_code == 429:
-            wait_time = int(request.headers["Retry-After"])
-            print(f"We are being rate limited, waiting {wait_time} seconds before trying again.")
-            time.sleep(wait_time)
-            return send_telegram(current_target)
-        logger.log(logging.INFO, f"Sent telegram to {current_target}, got {request.status_code}.")
-        tg_amt += 1
-    except Exception as e:
-        print(f"Tried to send telegram to {current_target}, but got error: {e}")
-        logger.log(logging.ERROR, f"Tried to send telegram to {current_target}, but got error: {e}")
-    finally:
-        tg_sent_history.append(current_target)
-        if telegram["type"] == "Recruitment":
-            time.sleep(RECRUITMENT_TELEGRAM_RATELIMIT)
-        else:
-            time.sleep(NONRECRUITMENT_TELEGRAM_RATELIMIT)
-    return True
+    def release_shared(self, nation, kind):
 
-# Cleanse the nation given filters - if they fail the filters they will not be recruited
-# True means go on to recruit, False means do not recruit and try another
-def recruitment_optimizer(nation):
+        """Let other recruiters of the host fetch the answer for a nation again"""
 
-    """Optimize Recruitment"""
+        if shared_cache is not None:
+            shared_cache.release(f"tgcan{kind}:{nation}")
 
-    if not config['recruiting']['optimization']:
-        return True
-    else:
-        if isBadName(nation):
-            print(f"{nation} is a bad name, skipping.")
-            logger.log(logging.DEBUG, f"{nation} is a bad name, skipping.")
-            return False
-        if isPuppet(nation):
-            print(f"{nation} is probably a puppet, skipping.")
-            logger.log(logging.DEBUG, f"{nation} is probably a puppet, skipping.")
+    def parse(self, nation, kind, request):
+
+        """Read and cache the answer of an eligibility request"""
+
+        if request.status_code == 404:
+            self.store(nation, kind, False) # No such nation
             return False
-        if cannotRecruit(nation):
-            print(f"{nation} cannot be recruited, skipping.")
-            logger.log(logging.DEBUG, f"{nation} cannot be recruited, skipping.")
+        if request.status_code != 200:
             return False
-        if nation is None:
-            print(f"One does not simply recruit from None, skipping.")
-            logger.log(logging.DEBUG, f"One does not simply recruit from None, skipping.")
-            time.sleep(30)
+        try:
+            eligible = ET.fromstring(request.text).find(f"TGCAN{kind.upper()}").text == "1"
+        except (ET.ParseError, AttributeError):
             return False
-        return True
+        self.store(nation, kind, eligible)
+        return eligible
 
-# Return true if a nation name contains bad words - likely to get No Such Nation errors and waste 180 seconds
-def isBadName(nation):
+    def check(self, nation, kind=None):
 
-    """Check if a nation name contains bad words"""
+        """Check whether a nation can receive the telegram"""
 
-    if re.search(r"(moderator|reichs|pedo|\btos\b)", nation, flags=re.IGNORECASE):
-        return True
-    else:
-        return False
+        kind = kind or telegram_kind()
+        eligible = self.cached(nation, kind)
+        if eligible is None:
+            future = self.inflight.get((nation, kind))
+            eligible = future.result() if future is not None else self.fetch(nation, kind)
+        return eligible
 
-# Return True if a nation name likely means it is a puppet - likely to get ignored
-def isPuppet(nation):
+    def submit_many(self, nations, kind=None):
 
-    """Check if a nation name likely means it is a puppet"""
+        """Start checking a batch of nations on the workers without waiting for the answers"""
 
-    if re.search(r"(puppet|bot|farm|card|founder|throwaway)", nation, flags=re.IGNORECASE):
-        return True
-    if re.search(r"[0-9]+", nation):
-        return True
-    match = re.finditer(r"(\b|_)M{0,4}(CM|CD|D?C{0,3})(XC|XL|L?X{0,3})(IX|IV|V?I{0,3})(\b|_)", nation, flags=re.IGNORECASE)
-    for m in match:
-        if m.group() != "" and m.group() != "_":
-            return True #bodging roman numeral checker, as it likes to match empty strings
-    return False
+        kind = kind or telegram_kind()
+        with self.lock:
+            for nation in nations:
+                if (nation, kind) in self.inflight or self.cached(nation, kind) is not None:
+                    continue
+                future = self.executor.submit(self.fetch, nation, kind)
+                # Registered before the callback, which runs at once if the check is done already
+                self.inflight[(nation, kind)] = future
+                future.add_done_callback(lambda future, key=(nation, kind): self.settled(key, future))
 
-# Return True if a nation cannot be recruited
-def cannotRecruit(nation):
+    def settled(self, key, future):
 
-    """Check if a nation cannot be recruited"""
+        """Forget a background check once it is done, unless a newer one took its place"""
 
-    try:
-        request = requests.get(f"https://www.nationstates.net/cgi-bin/api.cgi?nation={nation}&q=tgcanrecruit", headers=REQUESTS_HEADER, timeout=REQ_TIMEOUT)
-        if request.status_code == 200:
-            nation = ET.fromstring(request.text)
-            canrecruit = nation.find("TGCANRECRUIT").text
-            if canrecruit == "1":
-                return False
+        if self.inflight.get(key) is future:
+            self.inflight.pop(key, None)
+
+    def check_many(self, nations, kind=None):
+
+        """Check a batch of nations concurrently within the rate limit budget.
+        Returns a dict of nation to eligibility."""
+
+        kind = kind or telegram_kind()
+        results = {}
+        pending = {}
+        for nation in nations:
+            eligible = self.cached(nation, kind)
+            if eligible is None:
+                pending[nation] = self.executor.submit(self.fetch, nation, kind)
             else:
-                return True
-        else:
-            return True
-    except:
-        return True
+                results[nation] = eligible
+        for nation, future in pending.items():
+            results[nation] = future.result()
+        return results
+
+    async def check_async(self, nation, kind=None):
+
+        """Check whether a nation can receive the telegram, as a coroutine"""
+
+        kind = kind or telegram_kind()
+        eligible = self.cached(nation, kind)
+        if eligible is None:
+            future = self.inflight.get((nation, kind))
+            eligible = await asyncio.wrap_future(future) if future is not None else await self.fetch_async(nation, kind)
+        return eligible
+
+    async def check_many_async(self, nations, kind=None):
+
+        """Check a batch of nations concurrently within the rate limit budget, as a coroutine.
+        Returns a dict of nation to eligibility."""
+
+        kind = kind or telegram_kind()
+        results = {}
+        pending = []
+        for nation in nations:
+            eligible = self.cached(nation, kind)
+            if eligible is None:
+                pending.append(nation)
+            else:
+                results[nation] = eligible
+        answers = await asyncio.gather(*(self.fetch_async(nation, kind) for nation in pending))
+        results.update(zip(pending, answers))
+        return results
+
+# Shared Cache
+class SharedCache():
+
+    """SQLite cache in WAL mode shared by the recruiters of one host.
+    Holds recent happenings and eligibility answers, and leases so that one recruiter fetches what all of them need."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS events (feed TEXT, event_id INTEGER, timestamp INTEGER, text TEXT, PRIMARY KEY (feed, event_id));
+        CREATE TABLE IF NOT EXISTS feeds (feed TEXT PRIMARY KEY, fetched REAL);
+        CREATE TABLE IF NOT EXISTS eligibility (nation TEXT, kind TEXT, eligible INTEGER, expiry REAL, PRIMARY KEY (nation, kind));
+        CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expiry REAL);
+    """
+
+    def __init__(self, path, happenings_ttl=SHARED_CACHE_HAPPENINGS_TTL, lease_ttl=SHARED_CACHE_LEASE_TTL):
+
+        """Initialize SharedCache, creating the database if needed"""
+
+        self.path = path
+        self.happenings_ttl = happenings_ttl
+        self.lease_ttl = lease_ttl
+        self.owner = str(os.getpid())
+        self.local = threading.local() # One connection per thread, sqlite3 connections cannot be shared
+        with self.connection() as connection:
+            connection.executescript(self.SCHEMA)
+
+    def connection(self):
+
+        """Connection of the current thread"""
+
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.lease_ttl) # Wait for another writer at most as long as a lease lasts
+            connection.execute("PRAGMA journal_mode=WAL") # Readers never wait for the writer
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def acquire(self, name):
+
+        """Take a lease unless another recruiter holds it. Returns whether this recruiter holds it now."""
+
+        now = clock.time()
+        with self.connection() as connection:
+            cursor = connection.execute(
+                "INSERT INTO leases (name, owner, expiry) VALUES (?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expiry = excluded.expiry "
+                "WHERE leases.expiry < ? OR leases.owner = excluded.owner",
+                (name, self.owner, now + self.lease_ttl, now))
+            return cursor.rowcount == 1
+
+    def release(self, name):
+
+        """Give up a lease"""
+
+        with self.connection() as connection:
+            connection.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+
+    def fresh(self, feed):
+
+        """Whether a feed was fetched recently enough to be served from the cache"""
+
+        row = self.connection().execute("SELECT fetched FROM feeds WHERE feed = ?", (feed,)).fetchone()
+        return row is not None and row[0] > clock.time() - self.happenings_ttl
+
+    def last_event_id(self, feed):
+
+        """Highest event ID of a feed in the cache, 0 if there is none"""
+
+        row = self.connection().execute("SELECT MAX(event_id) FROM events WHERE feed = ?", (feed,)).fetchone()
+        return row[0] or 0
+
+    def store_happenings(self, feed, events):
+
+        """Store a fetched happenings page and drop expired entries"""
+
+        now = clock.time()
+        with self.connection() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO events (feed, event_id, timestamp, text) VALUES (?, ?, ?, ?)",
+                ((feed, *event) for event in events))
+            connection.execute("INSERT OR REPLACE INTO feeds (feed, fetched) VALUES (?, ?)", (feed, now))
+            connection.execute("DELETE FROM events WHERE timestamp < ?", (now - SHARED_CACHE_MAX_AGE,))
+            connection.execute("DELETE FROM eligibility WHERE expiry < ?", (now,))
+
+    def happenings(self, feed, since):
+
+        """Newest events of a feed after an event ID, like a happenings page"""
+
+        return self.connection().execute(
+            "SELECT event_id, timestamp, text FROM events WHERE feed = ? AND event_id > ? ORDER BY event_id DESC LIMIT 50",
+            (feed, since)).fetchall()
+
+    def eligibility(self, nation, kind):
+
+        """Cached answer for a nation as (eligible, expiry), None if there is none"""
+
+        row = self.connection().execute(
+            "SELECT eligible, expiry FROM eligibility WHERE nation = ? AND kind = ? AND expiry > ?",
+            (nation, kind, clock.time())).fetchone()
+        return None if row is None else (bool(row[0]), row[1])
+
+    def store_eligibility(self, nation, kind, eligible, expiry):
+
+        """Store an eligibility answer"""
+
+        with self.connection() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO eligibility (nation, kind, eligible, expiry) VALUES (?, ?, ?, ?)",
+                (nation, kind, int(eligible), expiry))
+
+# Load the shared cache configured in config.yml
+def load_shared_cache():
+
+    """Load the shared cache, if one is configured"""
+
+    global shared_cache
+    shared_cache_config = config["recruiting"].get("shared_cache", {})
+    path = shared_cache_config.get("file", SHARED_CACHE_FILE)
+    if not path:
+        shared_cache = None
+        return
+    shared_cache = SharedCache(
+        path,
+        shared_cache_config.get("happenings_ttl", SHARED_CACHE_HAPPENINGS_TTL),
+        shared_cache_config.get("lease_ttl", SHARED_CACHE_LEASE_TTL))
+    logger.log(logging.DEBUG, f"Sharing happenings and eligibility through {path}.")
+
+# Ledger
+class Ledger():
+
+    """Append-only SQLite ledger of the candidates considered, the reasons they were skipped and every send attempt.
+    Entries are buffered and written a batch at a time, so recording never waits on the disk."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS ledger (time REAL NOT NULL, kind TEXT NOT NULL, nation TEXT, source TEXT, telegram TEXT, lane TEXT, outcome TEXT, status INTEGER, latency REAL);
+        CREATE INDEX IF NOT EXISTS ledger_time ON ledger (time);
+    """
+    GROUPS = ("source", "telegram", "lane", "outcome") # Columns the statistics can be grouped by
+
+    def __init__(self, path=LEDGER_FILE, batch=LEDGER_BATCH, flush_interval=LEDGER_FLUSH_INTERVAL):
+
+        """Initialize Ledger, creating the database if needed"""
+
+        self.path = path
+        self.batch = batch
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.sources = {} # nation -> source it was found through, so skips and sends are attributed to it
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.connection = sqlite3.connect(path, check_same_thread=False) # Only used under the lock
+        self.connection.execute("PRAGMA journal_mode=WAL") # ledger-stats reads while the recruiter writes
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.executescript(self.SCHEMA)
+        self.thread = None
+
+    def start(self):
+
+        """Flush the buffered entries every interval, and once more when the program exits"""
+
+        self.thread = threading.Thread(target=self.run, name="Ledger", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+        return self
+
+    def run(self):
+
+        """Flush until stopped"""
+
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+
+    def record(self, kind, nation, source=None, telegram=None, lane=None, outcome=None, status=None, latency=None):
+
+        """Buffer an entry, writing the buffer once a batch is full"""
+
+        with self.lock:
+            if kind == "candidate":
+                self.sources[nation] = source
+                if len(self.sources) > LEDGER_SOURCES:
+                    del self.sources[next(iter(self.sources))]
+            elif source is None:
+                source = self.sources.get(nation)
+            self.pending.append((clock.time(), kind, nation, source, telegram, lane, outcome, status, latency))
+            full = len(self.pending) >= self.batch
+        if full:
+            self.flush()
+
+    def flush(self):
+
+        """Write the buffered entries in one transaction"""
+
+        with self.lock:
+            if not self.pending:
+                return
+            entries, self.pending = self.pending, []
+            try:
+                with self.connection:
+                    self.connection.executemany(
+                        "INSERT INTO ledger (time, kind, nation, source, telegram, lane, outcome, status, latency) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        entries)
+            except sqlite3.Error as e:
+                logger.log(logging.ERROR, f"Could not write {len(entries)} entries to the ledger {self.path}: {e}")
+
+    def stats(self, since, by="source", hourly=False):
+
+        """Candidates considered, skipped and sent per group since a time, per hour if hourly.
+        Aggregated by SQLite over the time index, so only the result rows are held in memory."""
+
+        if by not in self.GROUPS:
+            raise ValueError(f"Cannot group the ledger by {by}")
+        self.flush()
+        hour = "CAST(time / 3600 AS INTEGER) * 3600" if hourly else "NULL"
+        return self.connection.execute(
+            f"SELECT {hour}, COALESCE({by}, '-'), SUM(kind = 'candidate'), SUM(kind = 'skipped'), SUM(kind = 'send'), "
+            f"SUM(kind = 'send' AND outcome = 'queued'), AVG(CASE WHEN kind = 'send' THEN latency END) "
+            f"FROM ledger WHERE time >= ? GROUP BY 1, 2 ORDER BY 1, 2",
+            (since,))
+
+    def skips(self, since):
+
+        """Nations skipped per rule since a time, most common first"""
+
+        self.flush()
+        return self.connection.execute(
+            "SELECT outcome, COUNT(*) FROM ledger WHERE kind = 'skipped' AND time >= ? GROUP BY outcome ORDER BY 2 DESC",
+            (since,))
+
+    def first(self, since):
+
+        """Time of the first entry since a time, None if there is none"""
+
+        return self.connection.execute("SELECT MIN(time) FROM ledger WHERE time >= ?", (since,)).fetchone()[0]
+
+# Load the ledger configured in config.yml
+def load_ledger():
+
+    """Load the ledger, unless it is disabled"""
+
+    global ledger
+    ledger_config = config["recruiting"].get("ledger", {})
+    path = ledger_config.get("file", LEDGER_FILE)
+    if not path:
+        ledger = None
+        return
+    ledger = Ledger(
+        path,
+        ledger_config.get("batch", LEDGER_BATCH),
+        ledger_config.get("flush_interval", LEDGER_FLUSH_INTERVAL)).start()
+
+# Record an entry in the ledger, if there is one
+def record(kind, nation, **fields):
+
+    """Record a candidate considered, a skipped nation or a send attempt"""
+
+    if ledger is not None:
+        ledger.record(kind, nation, **fields)
+
+# Print aggregates of the ledger
+def ledger_stats(days, by, hourly):
+
+    """Print what the ledger recorded over the last days, grouped by a column"""
+
+    now = clock.time()
+    since = now - days * 86400
+    first = ledger.first(since)
+    if first is None:
+        print(f"The ledger {ledger.path} has no entries in the last {days:g} days.")
+        return
+    hours = max(now - first, 3600) / 3600
+    print(f"{'hour' if hourly else '':<18}{by:<24}{'considered':>12}{'skipped':>9}{'attempts':>10}{'sent':>7}{'sent/h':>8}{'sent %':>8}{'latency s':>11}")
+    for hour, group, considered, skipped, attempts, sent, latency in ledger.stats(since, by, hourly):
+        label = time.strftime("%Y-%m-%d %H:00", time.localtime(hour)) if hourly else ""
+        rate = sent if hourly else sent / hours
+        conversion = f"{100 * sent / considered:.1f}" if considered else "-"
+        latency = "-" if latency is None else f"{latency:.2f}"
+        print(f"{label:<18}{group:<24}{considered:>12}{skipped:>9}{attempts:>10}{sent:>7}{rate:>8.2f}{conversion:>8}{latency:>11}")
+    print("")
+    print(f"{'skipped by':<24}{'nations':>9}")
+    for rule, count in ledger.skips(since):
+        print(f"{rule or '-':<24}{count:>9}")
+
+# Return which eligibility check applies to the current telegram
+def telegram_kind(tg=None):
+
+    """Eligibility check of a telegram, by default the current one, recruit or campaign"""
+
+    tg = tg or telegram
+    if tg is None or tg["type"] == "Recruitment":
+        return "recruit"
+    return "campaign"
+
+# Load the eligibility service configured in config.yml
+def load_eligibility():
+
+    """Load the eligibility service"""
+
+    global eligibility
+    eligibility_config = config["recruiting"].get("eligibility", {})
+    eligibility = EligibilityService(
+        eligibility_config.get("file", ELIGIBILITY_FILE),
+        eligibility_config.get("workers", ELIGIBILITY_WORKERS),
+        eligibility_config.get("ttl", ELIGIBILITY_TTL),
+        eligibility_config.get("negative_ttl", ELIGIBILITY_NEGATIVE_TTL))
+
+# Load the transport configured in config.yml
+def load_transport(api_config):
+
+    """Create the transport of the API client"""
+
+    transport = api_config.get("transport", API_TRANSPORT)
+    pool_size = api_config.get("pool_size", API_POOL_SIZE)
+    retries = api_config.get("retries", API_RETRIES)
+    backoff = api_config.get("backoff", API_BACKOFF)
+    match transport:
+        case "fixture":
+            return FixtureTransport(api_config.get("fixture", API_FIXTURE_FILE))
+        case "async" | "auto" if aiohttp is not None:
+            return AiohttpTransport(pool_size, retries, backoff)
+        case "async":
+            logger.log(logging.WARNING, "aiohttp is not installed, falling back to the requests transport.")
+        case "requests" | "auto":
+            pass
+        case _:
+            logger.log(logging.WARNING, f"Unknown API transport {transport}, falling back to the requests transport.")
+    return RequestsTransport(pool_size, retries, backoff)
+
+# Load the API client configured in config.yml
+def load_api_client():
+
+    """Load the API client"""
+
+    global api_client
+    global async_client
+    api_config = config.get("api", {})
+    api_client = APIClient(
+        scheduler,
+        load_transport(api_config),
+        api_config.get("base_url", API_URL),
+        api_config.get("timeouts", {}))
+    async_client = None
 
 def main():
 
     """Main Logic Loop"""
 
     global logger
+    global scheduler
+    global metrics
     global GNU_GPL_v3
     GNU_GPL_v3 = GNU_GPL_v3_class()
     logger = Logger()
+    if metrics is None:
+        metrics = Metrics()
     load_config()
+    load_name_filter()
+    if tg_sent_history is None:
+        load_history()
+    if recipients is None:
+        load_recipients()
+    if nation_index is None:
+        load_nation_index()
+    if eligibility is None:
+        load_eligibility()
+    if shared_cache is None:
+        load_shared_cache()
+    if ledger is None:
+        load_ledger()
+    if checkpoint is None:
+        load_checkpoint()
+    if scheduler is None:
+        scheduler = RateLimitScheduler()
+    if api_client is None:
+        load_api_client()
     quickstarts = quickstart()
     if not quickstarts:
         logger.log(logging.INFO, "Python Process online.")
@@ -818,5 +4676,66 @@ def main():
                 print("Invalid choice. Please try again.")
                 main()
 
+# Command line subcommands, for maintenance tasks that should not start the menu
+def command_line(args):
+
+    """Run a command line subcommand"""
+
+    global ledger
+    parser = argparse.ArgumentParser(prog="app.py", description="headlessNSPythonRecruiter v" + VERSION)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("compact-history", help="Rewrite the sent history log without expired or duplicate entries")
+    import_parser = subparsers.add_parser("import-nations", help="Add the nations of a file, one or more comma separated per line, to the individual or blocked nations")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--blocked", action="store_true", help="Block the nations instead of messaging them")
+    index_parser = subparsers.add_parser("index-nations", help="Index the daily nations dump for lookups that spend no API requests")
+    index_parser.add_argument("dump", nargs="?", help="Gzipped nations dump, the configured one by default")
+    index_parser.add_argument("--download", action="store_true", help="Download the latest dump first")
+    lookup_parser = subparsers.add_parser("lookup-nation", help="Print what the nation index knows about a nation")
+    lookup_parser.add_argument("nation")
+    stats_parser = subparsers.add_parser("ledger-stats", help="Summarise the candidates, skips and sends recorded in the ledger")
+    stats_parser.add_argument("--days", type=float, default=30, help="Days to look back, 30 by default")
+    stats_parser.add_argument("--by", choices=Ledger.GROUPS, default="source", help="Column to group by, source by default")
+    stats_parser.add_argument("--hourly", action="store_true", help="One row per hour and group instead of totals")
+    arguments = parser.parse_args(args)
+    load_config()
+    match arguments.command:
+        case "compact-history":
+            load_history()
+            tg_sent_history.compact()
+            print(f"Sent history compacted to {len(tg_sent_history)} nations.")
+        case "import-nations":
+            load_history()
+            load_recipients()
+            nations = recipients.blocked if arguments.blocked else recipients.individual
+            with open(arguments.file, 'r', encoding="utf-8") as nations_file:
+                added = nations.add(read_nations(nations_file))
+            print(f"Added {added} nations to {nations.path}, which lists {len(nations)} nations with config.yml.")
+        case "index-nations":
+            index_config = config["recruiting"].get("nation_index", {})
+            dump_path = arguments.dump or index_config.get("dump", NATION_DUMP_FILE)
+            if arguments.download:
+                download_nation_dump(dump_path)
+            records = NationIndex.build(dump_path, index_config.get("file") or NATION_INDEX_FILE)
+            print(f"Indexed {records} nations of {dump_path}.")
+        case "lookup-nation":
+            nation = canonical_nation(arguments.nation)
+            path = config["recruiting"].get("nation_index", {}).get("file") or NATION_INDEX_FILE
+            if not os.path.exists(path):
+                print(f"There is no nation index at {path}, build it with index-nations first.")
+                return
+            facts = NationIndex(path).get(nation)
+            print(f"{nation} is not in the nation index." if facts is None else f"{nation}: {facts}")
+        case "ledger-stats":
+            path = config["recruiting"].get("ledger", {}).get("file") or LEDGER_FILE
+            if not os.path.exists(path):
+                print(f"There is no ledger at {path}, it is written while recruiting.")
+                return
+            ledger = Ledger(path)
+            ledger_stats(arguments.days, arguments.by, arguments.hourly)
+
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        command_line(sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,200 @@
+#!/usr/bin/python3 -u
+#    headlessNSPythonRecruiter
+#    Offline benchmarks of the recruiter against the local NationStates API stand-in, in simulated time.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Imports
+import sys
+import os
+import argparse
+import contextlib
+import random
+import tempfile
+import logging
+import tracemalloc
+import app
+import nsstub
+
+# Global Constants
+START = 1700000000 # Simulated start time, fixed so runs are reproducible
+BENCHMARK_TELEGRAM = {"name": "benchmark", "tgid": "0", "tgsecretkey": "benchmark", "type": "Recruitment"}
+
+# Scenarios, name -> synthetic recording settings
+SCENARIOS = {
+    "steady": {"foundings_per_hour": 60},
+    "quiet": {"foundings_per_hour": 4, "ejections_per_hour": 1},
+    "burst": {"foundings_per_hour": 600},
+    "degraded": {"foundings_per_hour": 60, "faults": {"429": 0.02, "524": 0.05}},
+}
+
+# Raised out of the recruiter once the simulation runs past its end
+class SimulationOver(Exception):
+
+    """The simulated run has reached its deadline"""
+
+# Virtual clock that ends the simulation at a deadline
+class DeadlineClock(app.VirtualClock):
+
+    """VirtualClock that stops the run once simulated time passes the deadline, even mid-search"""
+
+    def __init__(self, start, deadline):
+
+        """Initialize DeadlineClock"""
+
+        super().__init__(start)
+        self.deadline = deadline
+
+    def sleep(self, seconds):
+
+        """Advance simulated time, stopping the run past the deadline"""
+
+        super().sleep(seconds)
+        if self.now >= self.deadline:
+            raise SimulationOver()
+
+# Point the recruiter at a stub and reset its runtime state
+def prepare(stub, virtual_clock, workdir, optimization):
+
+    """Configure the app module for a simulated run"""
+
+    app.clock = virtual_clock
+    app.config = {
+        "clientkey": "benchmark",
+        "clientname": "benchmark",
+        "api": {"base_url": stub.url, "transport": "requests"},
+        "recruiting": {
+            "individual_nations": [],
+            "blocked_nations": [],
+            "recipients": {"individual_file": os.path.join(workdir, "individual_nations.txt"), "blocked_file": os.path.join(workdir, "blocked_nations.txt")},
+            "optimization": optimization,
+            "history": {"file": os.path.join(workdir, "sent_history.log"), "index": os.path.join(workdir, "sent_history.idx")},
+            "eligibility": {"file": os.path.join(workdir, "eligibility_cache.log")},
+            "ratio": {"found": 0.8, "refound": 0.2, "ejected": 0.0},
+        },
+    }
+    app.telegram = BENCHMARK_TELEGRAM
+    app.metrics = app.Metrics()
+    app.tg_target = 0
+    app.tg_amt = 0
+    app.tg_claimed.clear()
+    app.candidate_queue = None
+    app.load_name_filter()
+    app.load_history()
+    app.load_recipients()
+    app.load_eligibility()
+    app.scheduler = app.RateLimitScheduler()
+    app.load_api_client()
+    app.api_client.transport.session.trust_env = False # The stub is local, skip the proxy lookups
+
+# Run one scenario in simulated time
+def run(recording, days, optimization=True, seed=0):
+
+    """Run the serial recruitment loop against a stub for simulated days, returning its measurements"""
+
+    random.seed(seed)
+    virtual_clock = DeadlineClock(START, START + days * 86400)
+    stub = nsstub.StubServer(recording, virtual_clock, seed=seed).start()
+    with tempfile.TemporaryDirectory(dir=os.getcwd()) as workdir:
+        try:
+            prepare(stub, virtual_clock, workdir, optimization)
+            lane = app.SendLane("Lane 1", "benchmark")
+            lane.add_telegram(BENCHMARK_TELEGRAM)
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            first_target = None
+            with open(os.devnull, 'w', encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+                with contextlib.suppress(SimulationOver):
+                    while True:
+                        app.scheduler.wait_ready(lane.bucket)
+                        target = app.find_next_target()
+                        if first_target is None:
+                            first_target = virtual_clock.time() - START
+                        app.send_telegram(target, BENCHMARK_TELEGRAM, lane)
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            app.api_client.close()
+            app.eligibility.executor.shutdown()
+        finally:
+            stub.stop()
+    api_calls = sum(count for key, count in stub.stats.items() if key in ("happenings", "tgcanrecruit", "sendTG"))
+    discovery_calls = stub.stats.get("happenings", 0) + stub.stats.get("tgcanrecruit", 0)
+    ages = [histogram for (name, _), histogram in app.metrics.histograms.items() if name == "recruiter_candidate_age_seconds"]
+    popped = sum(histogram[-2] for histogram in ages)
+    return {
+        "targets": app.tg_target,
+        "sends": app.tg_amt,
+        "api_calls": api_calls,
+        "targets_per_discovery_call": app.tg_target / discovery_calls if discovery_calls else 0,
+        "first_target_seconds": first_target,
+        "mean_candidate_age_seconds": sum(histogram[-1] for histogram in ages) / popped if popped else None,
+        "memory_growth_kib": (current - baseline) / 1024,
+        "memory_peak_kib": peak / 1024,
+        "ratelimit_violations": stub.stats.get("ratelimit_violations", 0),
+        "stub_stats": dict(stub.stats),
+    }
+
+def main(args):
+
+    """Run the benchmark suite and print a table of the measurements"""
+
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Benchmark the recruiter against the local API stand-in")
+    parser.add_argument("--days", type=float, default=1, help="Simulated days per scenario")
+    parser.add_argument("--recording", help="Replay a recording saved by nsstub.py record instead of the synthetic scenarios")
+    parser.add_argument("--no-optimization", action="store_true", help="Benchmark with optimization turned off")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args(args)
+    if arguments.recording:
+        recording = nsstub.Recording.load(arguments.recording)
+        # Replay the recording from the simulated start
+        offset = START - recording.events[0]["timestamp"] if recording.events else 0
+        for event in recording.events:
+            event["timestamp"] += offset
+        recording = nsstub.Recording(recording.events, recording.canrecruit, recording.nonexistent, recording.canrecruit_rate, recording.faults)
+        scenarios = {os.path.basename(arguments.recording): recording}
+    else:
+        scenarios = {
+            name: nsstub.Recording.synthetic(START, arguments.days, seed=arguments.seed, **settings)
+            for name, settings in SCENARIOS.items()
+        }
+    # The log file is opened once per process, keep it and the runtime files out of the working tree
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as logdir:
+        os.chdir(logdir)
+        try:
+            app.logger = app.Logger()
+            report(scenarios, arguments)
+        finally:
+            logging.shutdown()
+            os.chdir(cwd)
+
+# Print one row per scenario
+def report(scenarios, arguments):
+
+    """Run each scenario and print its measurements"""
+
+    print(f"{'scenario':<12}{'targets':>9}{'sends':>8}{'calls':>8}{'tgt/call':>10}{'first s':>9}{'age s':>8}{'mem KiB':>10}{'peak KiB':>10}{'violations':>12}")
+    for name, recording in scenarios.items():
+        result = run(recording, arguments.days, not arguments.no_optimization, arguments.seed)
+        first = "-" if result["first_target_seconds"] is None else f"{result['first_target_seconds']:.0f}"
+        age = "-" if result["mean_candidate_age_seconds"] is None else f"{result['mean_candidate_age_seconds']:.0f}"
+        print(f"{name:<12}{result['targets']:>9}{result['sends']:>8}{result['api_calls']:>8}"
+              f"{result['targets_per_discovery_call']:>10.3f}{first:>9}{age:>8}{result['memory_growth_kib']:>10.1f}"
+              f"{result['memory_peak_kib']:>10.1f}{result['ratelimit_violations']:>12}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
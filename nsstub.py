@@ -0,0 +1,438 @@
+#!/usr/bin/python3 -u
+#    headlessNSPythonRecruiter
+#    A local stand-in for the NationStates API, replaying recorded happenings for offline testing and benchmarks.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Imports
+import sys
+import argparse
+import bisect
+import json
+import random
+import threading
+import time
+import zlib
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote_plus
+import requests
+
+# Global Constants
+API_RATELIMIT_REQUESTS = 50 # The real API allows 50 requests per 30 seconds
+API_RATELIMIT_PERIOD = 30
+RETRY_AFTER = 30 # Seconds asked for in scripted 429 responses
+STREAM_POLL = 0.05 # Seconds between looks for new events to push to the streams
+STREAM_KEEPALIVE = 15 # Seconds between comments sent to idle streams
+SYLLABLES = ["ka", "ren", "to", "sa", "bel", "nor", "qua", "fen", "dal", "mo", "ri", "the", "wyn", "gar", "ul"]
+
+# Recording
+class Recording():
+
+    """Happenings events and API answers replayed by the stub"""
+
+    def __init__(self, events, canrecruit=None, nonexistent=None, canrecruit_rate=0.8, faults=None):
+
+        """Initialize Recording
+
+        events: dicts with id, timestamp and text, as in a happenings response
+        canrecruit: nation -> recorded tgcanrecruit answer
+        nonexistent: nations answered with 404
+        canrecruit_rate: share of other nations that can be recruited
+        faults: response status -> share of requests failing with it, e.g. {"429": 0.01, "524": 0.02}"""
+
+        self.events = sorted(events, key=lambda event: event["timestamp"])
+        self.canrecruit = canrecruit or {}
+        self.nonexistent = set(nonexistent or [])
+        self.canrecruit_rate = canrecruit_rate
+        self.faults = faults or {}
+        self.feeds = {}
+        for event in self.events:
+            self.feeds.setdefault(event_filter(event["text"]), []).append(event)
+        self.timestamps = {feed: [event["timestamp"] for event in events] for feed, events in self.feeds.items()}
+
+    @classmethod
+    def load(cls, path):
+
+        """Load a recording saved as JSON"""
+
+        with open(path, 'r', encoding="utf-8") as recording_file:
+            data = json.load(recording_file)
+        return cls(
+            data["events"],
+            data.get("canrecruit"),
+            data.get("nonexistent"),
+            data.get("canrecruit_rate", 0.8),
+            data.get("faults"))
+
+    @classmethod
+    def synthetic(cls, start, days, foundings_per_hour=60, refound_share=0.2, ejections_per_hour=5, seed=0, **answers):
+
+        """Generate a recording of Poisson distributed foundings, refoundings and ejections"""
+
+        rng = random.Random(seed)
+        events = []
+        for rate, kinds in ((foundings_per_hour, None), (ejections_per_hour, "ejected")):
+            if rate <= 0:
+                continue
+            timestamp = start
+            while True:
+                timestamp += rng.expovariate(rate / 3600)
+                if timestamp > start + days * 86400:
+                    break
+                nation = "_".join(rng.choice(SYLLABLES) + rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2)))
+                if kinds == "ejected":
+                    text = f"@@{nation}@@ was ejected from %%the_pacific%% by @@some_officer@@."
+                elif rng.random() < refound_share:
+                    text = f"@@{nation}@@ was refounded in %%the_north_pacific%%."
+                else:
+                    text = f"@@{nation}@@ was founded in %%the_rejected_realms%%."
+                events.append({"timestamp": int(timestamp), "text": text})
+        events.sort(key=lambda event: event["timestamp"])
+        for event_id, event in enumerate(events, 1):
+            event["id"] = event_id
+        return cls(events, **answers)
+
+    def happenings(self, feed, now, sinceid=0, limit=50):
+
+        """Events of a feed that happened by now and are newer than sinceid, newest first"""
+
+        events = self.feeds.get(feed, [])
+        end = bisect.bisect_right(self.timestamps.get(feed, []), now)
+        page = []
+        for index in range(end - 1, -1, -1):
+            if events[index]["id"] <= sinceid or len(page) >= limit:
+                break
+            page.append(events[index])
+        return page
+
+    def pushed(self, feeds, now, after=0):
+
+        """Events of some feeds that happened by now and are newer than the ID after, oldest first, as a stream pushes them"""
+
+        pushed = []
+        for feed in feeds:
+            events = self.feeds.get(feed, [])
+            end = bisect.bisect_right(self.timestamps.get(feed, []), now)
+            for index in range(end - 1, -1, -1):
+                if events[index]["id"] <= after:
+                    break
+                pushed.append(events[index])
+        return sorted(pushed, key=lambda event: event["id"])
+
+    def latest(self, feeds, now):
+
+        """ID of the last event of some feeds that happened by now, 0 if none"""
+
+        latest = 0
+        for feed in feeds:
+            end = bisect.bisect_right(self.timestamps.get(feed, []), now)
+            if end:
+                latest = max(latest, self.feeds[feed][end - 1]["id"])
+        return latest
+
+    def can_recruit(self, nation):
+
+        """Recorded or deterministic pseudo random tgcanrecruit answer, None for nonexistent nations"""
+
+        if nation in self.nonexistent:
+            return None
+        if nation in self.canrecruit:
+            return bool(self.canrecruit[nation])
+        return zlib.crc32(nation.encode("utf-8")) % 1000 < self.canrecruit_rate * 1000
+
+# Return the happenings filter an event belongs to
+def event_filter(text):
+
+    """Happenings filter of an event text"""
+
+    if " was ejected" in text:
+        return "eject"
+    if " was founded" in text or " was refounded" in text:
+        return "founding"
+    return "other"
+
+# Stub Server
+class StubServer():
+
+    """Local NationStates API stand-in serving a Recording at the time of a clock"""
+
+    def __init__(self, recording, clock=time, host="127.0.0.1", port=0, seed=0):
+
+        """Initialize StubServer, port 0 picks a free port"""
+
+        self.recording = recording
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {} # endpoint or status -> requests
+        self.window = [] # Times of requests in the current rate limit window
+        self.streaming = True # False drops the streams and answers new ones with 503, to exercise polling fallbacks
+        self.stopping = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), StubHandler)
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def url(self):
+
+        """URL of the API endpoint"""
+
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/cgi-bin/api.cgi"
+
+    @property
+    def stream_url(self):
+
+        """URL of the server-sent events endpoint, followed by /filter+filter"""
+
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self):
+
+        """Serve in a background thread"""
+
+        self.thread = threading.Thread(target=self.server.serve_forever, name="StubServer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+
+        """Stop serving"""
+
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key):
+
+        """Count a request in the stats"""
+
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def ratelimit(self):
+
+        """Track the rate limit window, returning the remaining requests and seconds until reset"""
+
+        now = self.clock.time()
+        with self.lock:
+            self.window = [moment for moment in self.window if moment > now - API_RATELIMIT_PERIOD]
+            self.window.append(now)
+            remaining = API_RATELIMIT_REQUESTS - len(self.window)
+            if remaining < 0:
+                self.stats["ratelimit_violations"] = self.stats.get("ratelimit_violations", 0) + 1
+            reset = API_RATELIMIT_PERIOD - (now - self.window[0])
+        return max(remaining, 0), max(int(reset), 0)
+
+    def fault(self, status):
+
+        """Whether this request should fail with a scripted status"""
+
+        rate = self.recording.faults.get(str(status), 0)
+        with self.lock:
+            return rate > 0 and self.random.random() < rate
+
+    def answer(self, query):
+
+        """Status, headers and body answering a query string"""
+
+        params = parse_query(query)
+        remaining, reset = self.ratelimit()
+        headers = {"RateLimit-Limit": str(API_RATELIMIT_REQUESTS), "RateLimit-Remaining": str(remaining), "RateLimit-Reset": str(reset)}
+        if self.fault(429):
+            self.count("429")
+            headers["Retry-After"] = str(RETRY_AFTER)
+            return 429, headers, "<h1>Too Many Requests</h1>"
+        if params.get("a") == "sendtg":
+            self.count("sendTG")
+            if params.get("to") in self.recording.nonexistent:
+                return 404, headers, "<h1>Unknown nation</h1>"
+            return 200, headers, "queued"
+        if "nation" in params:
+            self.count(params.get("q", "nation"))
+            answer = self.recording.can_recruit(params["nation"])
+            if answer is None:
+                return 404, headers, "<h1>Unknown nation</h1>"
+            tag = params.get("q", "tgcanrecruit").upper()
+            return 200, headers, f"<NATION id=\"{params['nation']}\"><{tag}>{int(answer)}</{tag}></NATION>"
+        if params.get("q") == "happenings":
+            self.count("happenings")
+            if self.fault(524):
+                self.count("524")
+                return 524, headers, "<h1>A timeout occurred</h1>"
+            page = self.recording.happenings(
+                params.get("filter", "founding"),
+                self.clock.time(),
+                int(params.get("sinceid", 0)),
+                int(params.get("limit", 50)))
+            events = "".join(
+                f"<EVENT id=\"{event['id']}\"><TIMESTAMP>{event['timestamp']}</TIMESTAMP><TEXT>{xml_escape(event['text'])}</TEXT></EVENT>"
+                for event in page)
+            return 200, headers, f"<WORLD><HAPPENINGS>{events}</HAPPENINGS></WORLD>"
+        self.count("unknown")
+        return 400, headers, "<h1>Bad Request</h1>"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    """Answers API requests from the stub's recording"""
+
+    protocol_version = "HTTP/1.1" # Keep connections alive like the real API
+    disable_nagle_algorithm = True # Headers and body are written separately
+
+    def do_GET(self):
+
+        """Answer a request"""
+
+        path, _, query = self.path.partition("?")
+        if path.startswith("/api/"):
+            self.stream(path[len("/api/"):].split("+"))
+            return
+        status, headers, body = self.server.stub.answer(query)
+        body = body.encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream(self, filters):
+
+        """Push the events of some filters as server-sent events, in the stub's time, until the client or the stub stops.
+        Resumes after the Last-Event-ID header, or starts from the present without it."""
+
+        stub = self.server.stub
+        stub.count("stream")
+        if not stub.streaming:
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        last_event_id = self.headers.get("Last-Event-ID", "")
+        after = int(last_event_id) if last_event_id.isdigit() else stub.recording.latest(filters, stub.clock.time())
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked") # One chunk per event, as streaming servers send them
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        written = time.monotonic()
+        try:
+            while stub.streaming and not stub.stopping.is_set():
+                for event in stub.recording.pushed(filters, stub.clock.time(), after):
+                    data = json.dumps({"str": event["text"], "time": event["timestamp"]})
+                    self.write_chunk(f"id: {event['id']}\ndata: {data}\n\n".encode("utf-8"))
+                    after = event["id"]
+                    written = time.monotonic()
+                if time.monotonic() - written >= STREAM_KEEPALIVE:
+                    self.write_chunk(b": keepalive\n\n")
+                    written = time.monotonic()
+                stub.stopping.wait(STREAM_POLL)
+            self.write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def write_chunk(self, data):
+
+        """Write one chunk of a chunked response, an empty one ending it"""
+
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+
+        """Keep requests out of the console"""
+
+# Parse an API query string, which mixes & and ; separators
+def parse_query(query):
+
+    """Parameters of a query string, with lowercase keys and the action lowercased"""
+
+    params = {}
+    for part in query.replace(";", "&").split("&"):
+        key, _, value = part.partition("=")
+        if key:
+            params[key.lower()] = unquote_plus(value)
+    if "a" in params:
+        params["a"] = params["a"].lower()
+    return params
+
+# Escape text for XML
+def xml_escape(text):
+
+    """Escape &, < and > in text"""
+
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+# Record the live happenings feeds into a recording
+def record(path, minutes, interval=30):
+
+    """Poll the live founding and eject feeds and save the events as a recording"""
+
+    events = {}
+    last_id = {}
+    headers = {"User-Agent": "headlessNSPythonRecruiter stub recorder (by Clarissa Au)"}
+    end = time.time() + minutes * 60
+    while time.time() < end:
+        for feed in ("founding", "eject"):
+            query = f"q=happenings;filter={feed};limit=50"
+            if feed in last_id:
+                query += f";sinceid={last_id[feed]}"
+            response = requests.get(f"https://www.nationstates.net/cgi-bin/api.cgi?{query}", headers=headers, timeout=10)
+            if response.status_code != 200:
+                continue
+            for event in ET.fromstring(response.content).iter("EVENT"):
+                event_id = int(event.get("id"))
+                last_id[feed] = max(last_id.get(feed, 0), event_id)
+                events[event_id] = {"id": event_id, "timestamp": int(event.findtext("TIMESTAMP")), "text": event.findtext("TEXT")}
+        time.sleep(interval)
+    with open(path, 'w', encoding="utf-8") as recording_file:
+        json.dump({"events": sorted(events.values(), key=lambda event: event["id"])}, recording_file)
+    print(f"Recorded {len(events)} events to {path}.")
+
+def main(args):
+
+    """Serve a recording, or record the live feeds"""
+
+    parser = argparse.ArgumentParser(prog="nsstub.py", description="Local NationStates API stand-in")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="Serve a recording, or synthetic happenings without one")
+    serve_parser.add_argument("recording", nargs="?")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--foundings-per-hour", type=float, default=60)
+    record_parser = subparsers.add_parser("record", help="Record the live founding and eject feeds")
+    record_parser.add_argument("recording")
+    record_parser.add_argument("--minutes", type=float, default=60)
+    arguments = parser.parse_args(args)
+    match arguments.command:
+        case "serve":
+            if arguments.recording:
+                recording = Recording.load(arguments.recording)
+            else:
+                recording = Recording.synthetic(time.time(), 1, arguments.foundings_per_hour)
+            stub = StubServer(recording, port=arguments.port)
+            print(f"Serving the NationStates API stand-in at {stub.url} and its happenings stream at {stub.stream_url}")
+            stub.server.serve_forever()
+        case "record":
+            record(arguments.recording, arguments.minutes)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
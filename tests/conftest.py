@@ -0,0 +1,46 @@
+#    headlessNSPythonRecruiter
+#    Shared fixtures of the tests.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+
+@pytest.fixture
+def virtual_clock(monkeypatch):
+
+    """Run the test on a simulated clock"""
+
+    virtual_clock = app.VirtualClock(1700000000)
+    monkeypatch.setattr(app, "clock", virtual_clock)
+    return virtual_clock
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch, virtual_clock):
+
+    """Run the test with the default configuration, logging and metrics, in a temporary directory"""
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "config", {"clientkey": "", "recruiting": {"ratio": {"found": 1, "refound": 1, "ejected": 1}}}, raising=False)
+    monkeypatch.setattr(app, "logger", app.Logger())
+    monkeypatch.setattr(app, "metrics", app.Metrics())
+    return app.config
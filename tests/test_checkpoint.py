@@ -0,0 +1,74 @@
+#    headlessNSPythonRecruiter
+#    Tests of the checkpoints of the runtime state.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import app
+
+@pytest.fixture
+def recruiter(tmp_path, monkeypatch, runtime):
+
+    """Fresh runtime state of a recruiter, as after a restart"""
+
+    def restart():
+        monkeypatch.setattr(app, "tg_sent_history", app.SentHistory(str(tmp_path / "sent_history.log")))
+        monkeypatch.setattr(app, "tg_claimed", set())
+        monkeypatch.setattr(app, "tg_amt", 0)
+        monkeypatch.setattr(app, "tg_target", None)
+        monkeypatch.setattr(app, "scheduler", app.RateLimitScheduler())
+        app.scheduler.add_bucket("telegram:key", 1, 180)
+        monkeypatch.setattr(app, "candidate_queue", app.CandidateQueue())
+        return app.Checkpoint(str(tmp_path / "checkpoint.json")), app.Prefetcher()
+    return restart
+
+def test_restart_resumes_the_saved_state(recruiter, virtual_clock):
+    checkpoint, prefetcher = recruiter()
+    checkpoint.prefetcher = prefetcher
+    app.tg_amt = 7
+    app.scheduler.acquire("telegram:key")
+    app.candidate_queue.push(["filter=founding"], [(1001, virtual_clock.time(), "@@queued_nation@@ was founded in %%the_pacific%%.")])
+    prefetcher.buffer.put_nowait(prefetcher.claim("prefetched_nation"))
+    checkpoint.save()
+    virtual_clock.sleep(60)
+    checkpoint, prefetcher = recruiter()
+    checkpoint.restore(prefetcher)
+    assert app.tg_amt == 7
+    # The telegram cooldown carries on where it was
+    assert app.scheduler.buckets["telegram:key"].ready_in() == pytest.approx(120)
+    assert prefetcher.get() == "prefetched_nation"
+    assert "prefetched_nation" in app.tg_claimed
+    assert app.candidate_queue.pop() == ("founding", "queued_nation")
+    assert app.candidate_queue.query("filter=founding").endswith("sinceid=1001")
+
+def test_targets_sent_since_are_not_prefetched_again(recruiter):
+    checkpoint, prefetcher = recruiter()
+    checkpoint.prefetcher = prefetcher
+    prefetcher.buffer.put_nowait(prefetcher.claim("sent_nation"))
+    checkpoint.save()
+    checkpoint, prefetcher = recruiter()
+    app.tg_sent_history.add("sent_nation")
+    checkpoint.restore(prefetcher)
+    assert prefetcher.buffer.empty()
+
+def test_unreadable_checkpoint_is_ignored(tmp_path, recruiter):
+    (tmp_path / "checkpoint.json").write_text("{", encoding="utf-8")
+    checkpoint, prefetcher = recruiter()
+    checkpoint.restore(prefetcher)
+    assert app.tg_amt == 0
+    assert prefetcher.buffer.empty()
+    assert app.scheduler.buckets["telegram:key"].ready_in() == 0
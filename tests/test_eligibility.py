@@ -0,0 +1,119 @@
+#    headlessNSPythonRecruiter
+#    Tests of the eligibility checks and their cache.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+import pytest
+import app
+
+class CountingTransport(app.FixtureTransport):
+
+    """Fixture transport counting the requests per nation, optionally holding them until released"""
+
+    def __init__(self, path):
+
+        """Initialize CountingTransport"""
+
+        super().__init__(path)
+        self.requests = {}
+        self.released = threading.Event()
+        self.released.set()
+
+    def get(self, url, timeout, stream=False):
+
+        """Count the request before answering it"""
+
+        nation = url.partition("nation=")[2].partition("&")[0]
+        self.requests[nation] = self.requests.get(nation, 0) + 1
+        self.released.wait(5)
+        return super().get(url, timeout, stream)
+
+@pytest.fixture
+def transport(tmp_path, monkeypatch, runtime):
+
+    """API answering that nations whose name starts with "yes" can be recruited"""
+
+    responses = [{"match": f"nation={nation}&q=tgcanrecruit", "body": f"<NATION><TGCANRECRUIT>{int(nation.startswith('yes'))}</TGCANRECRUIT></NATION>"}
+                 for nation in ("yes_a", "yes_b", "no_a", "no_b", "no_c")]
+    (tmp_path / "fixture.json").write_text(json.dumps({"responses": responses}), encoding="utf-8")
+    transport = CountingTransport(str(tmp_path / "fixture.json"))
+    monkeypatch.setattr(app, "scheduler", app.RateLimitScheduler())
+    monkeypatch.setattr(app, "api_client", app.APIClient(app.scheduler, transport))
+    return transport
+
+@pytest.fixture
+def service(tmp_path, transport):
+
+    """Eligibility service with a one minute TTL and a one hour negative TTL"""
+
+    service = app.EligibilityService(str(tmp_path / "eligibility_cache.log"), workers=4, ttl=60, negative_ttl=3600)
+    yield service
+    service.executor.shutdown()
+
+def test_answers_are_cached_until_they_expire(service, transport, virtual_clock):
+    assert service.check("yes_a") is True
+    assert service.check("no_a") is False
+    assert service.check("yes_a") is True
+    assert transport.requests == {"yes_a": 1, "no_a": 1}
+    virtual_clock.sleep(61)
+    assert service.check("yes_a") is True
+    assert service.check("no_a") is False
+    assert transport.requests == {"yes_a": 2, "no_a": 1}
+
+def test_negative_answers_survive_a_restart(tmp_path, service, transport, virtual_clock):
+    service.check_many(["yes_a", "no_a", "no_b"])
+    restarted = app.EligibilityService(str(tmp_path / "eligibility_cache.log"))
+    assert restarted.cached("no_a", "recruit") is False
+    assert restarted.cached("yes_a", "recruit") is None
+    virtual_clock.sleep(3601)
+    assert app.EligibilityService(str(tmp_path / "eligibility_cache.log")).cache == {}
+
+def test_upkeep_drops_expired_answers_and_compacts_the_log(tmp_path, service, virtual_clock):
+    service.check_many(["yes_a", "no_a", "no_b"])
+    virtual_clock.sleep(61)
+    service.upkeep()
+    assert set(service.cache) == {("no_a", "recruit"), ("no_b", "recruit")}
+    virtual_clock.sleep(1800)
+    service.check("no_c")
+    virtual_clock.sleep(1800)
+    service.upkeep()
+    assert set(service.cache) == {("no_c", "recruit")}
+    log = (tmp_path / "eligibility_cache.log").read_text(encoding="utf-8").splitlines()
+    assert [line.split("\t")[2] for line in log] == ["no_c"]
+    service.check("no_a")
+    assert len((tmp_path / "eligibility_cache.log").read_text(encoding="utf-8").splitlines()) == 2
+
+def test_mostly_expired_log_is_compacted_at_startup(tmp_path, service, virtual_clock):
+    service.check_many(["no_a", "no_b"])
+    virtual_clock.sleep(1800)
+    service.check("no_c")
+    virtual_clock.sleep(1801)
+    app.EligibilityService(str(tmp_path / "eligibility_cache.log")).executor.shutdown()
+    assert len((tmp_path / "eligibility_cache.log").read_text(encoding="utf-8").splitlines()) == 1
+
+def test_checks_in_flight_are_not_repeated(service, transport):
+    transport.released.clear()
+    service.submit_many(["yes_a", "yes_b"])
+    service.submit_many(["yes_a"])
+    assert set(service.inflight) == {("yes_a", "recruit"), ("yes_b", "recruit")}
+    transport.released.set()
+    assert service.check("yes_a") is True
+    service.executor.shutdown(wait=True)
+    assert transport.requests == {"yes_a": 1, "yes_b": 1}
+    assert service.inflight == {}
@@ -0,0 +1,52 @@
+#    headlessNSPythonRecruiter
+#    Tests of the incremental parsing of happenings responses.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import xml.etree.ElementTree as ET
+import pytest
+import app
+
+HAPPENINGS = (
+    '<WORLD><HAPPENINGS>'
+    '<EVENT id="1002"><TIMESTAMP>1700000100</TIMESTAMP><TEXT>@@nation_b@@ was founded in %%the_pacific%%.</TEXT></EVENT>'
+    '<EVENT id="1001"><TIMESTAMP>1700000000</TIMESTAMP><TEXT>@@nätion_a@@ was ejected from %%lazarus%%.</TEXT></EVENT>'
+    '<EVENT id="x"><TEXT>@@nation_c@@ was refounded in %%osiris%%.</TEXT></EVENT>'
+    '</HAPPENINGS></WORLD>'
+).encode("utf-8")
+
+EVENTS = [
+    (1002, 1700000100, "@@nation_b@@ was founded in %%the_pacific%%."),
+    (1001, 1700000000, "@@nätion_a@@ was ejected from %%lazarus%%."),
+    (0, None, "@@nation_c@@ was refounded in %%osiris%%."),
+]
+
+@pytest.mark.parametrize("size", [1, 7, 64, len(HAPPENINGS)])
+def test_events_are_parsed_across_chunk_boundaries(size):
+    chunks = [HAPPENINGS[start:start + size] for start in range(0, len(HAPPENINGS), size)]
+    assert list(app.iter_happenings(chunks)) == EVENTS
+
+def test_events_are_yielded_before_the_page_is_complete():
+    events = app.iter_happenings(iter([HAPPENINGS[:HAPPENINGS.index(b"<EVENT id=\"1001\">")]]))
+    assert next(events) == EVENTS[0]
+
+def test_empty_page_has_no_events():
+    assert list(app.iter_happenings([b"<WORLD><HAPPENINGS></HAPPENINGS></WORLD>"])) == []
+
+def test_malformed_page_raises():
+    with pytest.raises(ET.ParseError):
+        list(app.iter_happenings([HAPPENINGS[:-10]]))
@@ -0,0 +1,102 @@
+#    headlessNSPythonRecruiter
+#    Tests of the memory mapped index of the sent history.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pytest
+import app
+
+def open_history(tmp_path, max_age_days=0):
+
+    """Sent history in a temporary directory, with an index"""
+
+    return app.SentHistory(str(tmp_path / "sent_history.log"), max_age_days, str(tmp_path / "sent_history.idx"))
+
+def test_index_header_is_validated(tmp_path, virtual_clock):
+    history = open_history(tmp_path)
+    history.add("nation_a")
+    history.checkpoint(force=True)
+    index_path = tmp_path / "sent_history.idx"
+    data = index_path.read_bytes()
+    index_path.write_bytes(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        app.HistoryIndex(str(index_path))
+    index_path.write_bytes(data[:-1]) # Cut short, so the records do not match the header
+    with pytest.raises(ValueError):
+        app.HistoryIndex(str(index_path))
+    # A damaged index is ignored in favour of the whole log
+    reopened = open_history(tmp_path)
+    assert reopened.index is None
+    assert "nation_a" in reopened
+
+def test_tail_after_the_index_is_replayed(tmp_path, virtual_clock):
+    history = open_history(tmp_path)
+    history.add("nation_a")
+    history.add("nation_b")
+    history.checkpoint(force=True)
+    assert history.entries == {}
+    history.add("nation_c")
+    reopened = open_history(tmp_path)
+    assert reopened.index is not None
+    assert reopened.index.records == 2
+    assert reopened.index.offset < os.path.getsize(tmp_path / "sent_history.log")
+    assert set(reopened.entries) == {"nation_c"}
+    assert all(nation in reopened for nation in ("nation_a", "nation_b", "nation_c"))
+    assert "nation_d" not in reopened
+    assert len(reopened) == 3
+
+def test_replaced_log_does_not_use_the_index(tmp_path, virtual_clock):
+    history = open_history(tmp_path)
+    history.add("nation_a")
+    history.checkpoint(force=True)
+    history.file.close()
+    log_path = tmp_path / "sent_history.log"
+    os.remove(log_path)
+    log_path.write_text(f"{virtual_clock.time()}\tnation_x\n", encoding="utf-8")
+    reopened = open_history(tmp_path)
+    assert reopened.index is None
+    assert "nation_x" in reopened
+    assert "nation_a" not in reopened
+
+def test_rewritten_log_does_not_use_the_index(tmp_path, virtual_clock):
+    history = open_history(tmp_path)
+    history.add("nation_a")
+    history.checkpoint(force=True)
+    history.file.close()
+    # Same file and size, other content before the indexed offset
+    with open(tmp_path / "sent_history.log", 'r+b') as log_file:
+        log_file.seek(-2, os.SEEK_END)
+        log_file.write(b"z\n")
+    reopened = open_history(tmp_path)
+    assert reopened.index is None
+    assert "nation_z" in reopened
+    assert "nation_a" not in reopened
+
+def test_expired_nations_leave_the_index(tmp_path, virtual_clock):
+    history = open_history(tmp_path, max_age_days=1)
+    history.add("nation_old")
+    history.checkpoint(force=True)
+    virtual_clock.sleep(2 * 86400)
+    history.add("nation_new")
+    history.checkpoint(force=True)
+    assert history.index.get("nation_old") is None
+    assert history.index.get("nation_new") is not None
+    reopened = open_history(tmp_path, max_age_days=1)
+    assert "nation_old" not in reopened
+    assert "nation_new" in reopened
+    assert len(reopened) == 1
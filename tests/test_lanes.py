@@ -0,0 +1,111 @@
+#    headlessNSPythonRecruiter
+#    Tests of the sending lanes.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import pytest
+import app
+
+class Stopped(BaseException):
+
+    """Ends a lane's loop once its targets run out"""
+
+class StubPrefetcher():
+
+    """Prefetcher handing out a fixed list of targets and recording the released ones"""
+
+    def __init__(self, targets):
+
+        """Initialize StubPrefetcher"""
+
+        self.targets = list(targets)
+        self.released = []
+
+    def get(self):
+
+        """Next target, stopping the lane when there are none left"""
+
+        if not self.targets:
+            raise Stopped()
+        return self.targets.pop(0)
+
+    def release(self, target):
+
+        """Record a released target"""
+
+        self.released.append(target)
+
+class AsyncStubPrefetcher(StubPrefetcher):
+
+    """StubPrefetcher for the asyncio runtime"""
+
+    async def get(self):
+
+        """Next target, stopping the lane when there are none left"""
+
+        return StubPrefetcher.get(self)
+
+TELEGRAM = {"name": "A", "tgid": "1", "tgsecretkey": "secret", "type": "Recruitment"}
+
+@pytest.fixture
+def lane(monkeypatch, runtime):
+
+    """Sending lane whose first telegram fails with an unexpected error"""
+
+    monkeypatch.setitem(app.config["recruiting"], "optimization", False)
+    monkeypatch.setattr(app, "scheduler", app.RateLimitScheduler())
+    monkeypatch.setattr(app, "checkpoint", None)
+    lane = app.SendLane("Lane 1", "key")
+    lane.add_telegram(TELEGRAM)
+    lane.sent = []
+
+    def send_telegram(target, tg, lane):
+        if target == "nation_a":
+            raise RuntimeError("unexpected")
+        lane.sent.append(target)
+        return "queued"
+
+    async def send_telegram_async(target, tg, lane):
+        return send_telegram(target, tg, lane)
+
+    monkeypatch.setattr(app, "send_telegram", send_telegram)
+    monkeypatch.setattr(app, "send_telegram_async", send_telegram_async)
+    return lane
+
+def test_lane_survives_an_unexpected_error(lane, virtual_clock):
+    prefetcher = StubPrefetcher(["nation_a", "nation_b"])
+    started = virtual_clock.time()
+    with pytest.raises(Stopped):
+        lane.run(prefetcher)
+    assert lane.sent == ["nation_b"]
+    assert prefetcher.released == ["nation_a", "nation_b"]
+    assert virtual_clock.time() - started >= app.SEND_RETRY_DELAY
+
+def test_async_lane_survives_an_unexpected_error(lane, monkeypatch, virtual_clock):
+
+    async def sleep(seconds):
+        virtual_clock.sleep(seconds)
+
+    monkeypatch.setattr(asyncio, "sleep", sleep)
+    prefetcher = AsyncStubPrefetcher(["nation_a", "nation_b"])
+    started = virtual_clock.time()
+    with pytest.raises(Stopped):
+        asyncio.run(lane.run_async(prefetcher))
+    assert lane.sent == ["nation_b"]
+    assert prefetcher.released == ["nation_a", "nation_b"]
+    assert virtual_clock.time() - started >= app.SEND_RETRY_DELAY
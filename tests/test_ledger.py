@@ -0,0 +1,88 @@
+#    headlessNSPythonRecruiter
+#    Tests of the ledger of candidates, skips and sends.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sqlite3
+import pytest
+import app
+
+@pytest.fixture
+def ledger(tmp_path, runtime):
+
+    """Ledger in a temporary directory, written in batches of three"""
+
+    ledger = app.Ledger(str(tmp_path / "ledger.sqlite"), batch=3)
+    yield ledger
+    ledger.connection.close()
+
+def rows(ledger):
+
+    """Entries written to the database"""
+
+    with sqlite3.connect(ledger.path) as connection:
+        return connection.execute("SELECT kind, nation, source, outcome FROM ledger ORDER BY rowid").fetchall()
+
+def test_entries_are_written_in_batches(ledger):
+    ledger.record("candidate", "nation_a", source="founding")
+    ledger.record("skipped", "nation_a", outcome="puppet")
+    assert rows(ledger) == []
+    ledger.record("candidate", "nation_b", source="ejected")
+    assert len(rows(ledger)) == 3
+    ledger.record("send", "nation_b", outcome="queued")
+    ledger.flush()
+    assert len(rows(ledger)) == 4
+
+def test_skips_and_sends_are_attributed_to_the_source(ledger):
+    ledger.record("candidate", "nation_a", source="founding")
+    ledger.record("skipped", "nation_a", outcome="puppet")
+    ledger.record("send", "nation_b", outcome="queued")
+    assert rows(ledger) == [
+        ("candidate", "nation_a", "founding", None),
+        ("skipped", "nation_a", "founding", "puppet"),
+        ("send", "nation_b", None, "queued"),
+    ]
+
+def test_stats_by_group_and_hour(ledger, virtual_clock):
+    start = virtual_clock.time()
+    for nation, source, outcome in (("nation_a", "founding", "queued"), ("nation_b", "founding", "rejected"), ("nation_c", "ejected", None)):
+        ledger.record("candidate", nation, source=source)
+        if outcome is None:
+            ledger.record("skipped", nation, outcome="ineligible")
+        else:
+            ledger.record("send", nation, outcome=outcome, latency=0.5)
+        virtual_clock.sleep(3600)
+    assert list(ledger.stats(start)) == [
+        (None, "ejected", 1, 1, 0, 0, None),
+        (None, "founding", 2, 0, 2, 1, 0.5),
+    ]
+    assert list(ledger.stats(start, by="outcome")) == [
+        (None, "-", 3, 0, 0, 0, None),
+        (None, "ineligible", 0, 1, 0, 0, None),
+        (None, "queued", 0, 0, 1, 1, 0.5),
+        (None, "rejected", 0, 0, 1, 0, 0.5),
+    ]
+    hourly = list(ledger.stats(start, hourly=True))
+    assert len(hourly) == 3
+    assert [row[0] % 3600 for row in hourly] == [0, 0, 0]
+    assert list(ledger.stats(start + 3600)) == [(None, "ejected", 1, 1, 0, 0, None), (None, "founding", 1, 0, 1, 0, 0.5)]
+    assert list(ledger.skips(start)) == [("ineligible", 1)]
+    assert ledger.first(start + 1) == start + 3600
+
+def test_stats_cannot_be_grouped_by_other_columns(ledger):
+    with pytest.raises(ValueError):
+        ledger.stats(0, by="nation; DROP TABLE ledger")
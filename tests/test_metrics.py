@@ -0,0 +1,53 @@
+#    headlessNSPythonRecruiter
+#    Tests of the metrics registry and the /metrics endpoint.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import urllib.request
+import app
+
+def test_metrics_endpoint_is_off_by_default(runtime):
+    runtime["metrics"] = {"snapshot_interval": 0}
+    assert app.start_metrics() is None
+
+def test_recruiters_on_one_host_pick_their_own_ports(runtime, capsys):
+    runtime["metrics"] = {"port": 0, "snapshot_interval": 0}
+    servers = [app.start_metrics(), app.start_metrics()]
+    try:
+        ports = [server.server_address[1] for server in servers]
+        assert ports[0] != ports[1]
+        printed = capsys.readouterr().out
+        assert all(f":{port}/metrics" in printed for port in ports)
+        app.metrics.inc("recruiter_telegrams_total", lane="Lane 1")
+        for port in ports:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                assert 'recruiter_telegrams_total{lane="Lane 1"} 1' in response.read().decode("utf-8")
+    finally:
+        for server in servers:
+            server.shutdown()
+            server.server_close()
+
+def test_port_in_use_is_reported(runtime, capsys):
+    runtime["metrics"] = {"port": 0, "snapshot_interval": 0}
+    server = app.start_metrics()
+    try:
+        runtime["metrics"]["port"] = server.server_address[1]
+        assert app.start_metrics() is None
+        assert f"Unable to serve metrics on port {server.server_address[1]}" in capsys.readouterr().out
+    finally:
+        server.shutdown()
+        server.server_close()
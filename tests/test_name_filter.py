@@ -0,0 +1,66 @@
+#    headlessNSPythonRecruiter
+#    Tests of the nation name filter and its configuration.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import app
+
+def test_names_are_classified_by_rule():
+    name_filter = app.NameFilter(app.NAME_FILTERS)
+    assert name_filter.classify("puppet_storage_keeper") == ("puppet", "puppet")
+    assert name_filter.classify("Nation_42")[0] == "number"
+    assert name_filter.classify("greater_reichsland")[0] == "bad_name"
+    assert name_filter.classify("dominion_of_peace") is None
+    assert name_filter.classify_many(["card_farm_3", "free_lands", "moderator_x"]) == {
+        "card_farm_3": ("puppet", "card"),
+        "moderator_x": ("bad_name", "moderator"),
+    }
+
+def test_names_are_matched_ignoring_case():
+    assert app.NameFilter({"puppet": ["puppet"]}).classify("PUPPET_land") == ("puppet", "PUPPET")
+
+def test_without_rules_every_name_passes():
+    for rules in ({}, {"puppet": [], "number": []}):
+        name_filter = app.NameFilter(rules)
+        assert name_filter.classify("puppet_1") is None
+        assert name_filter.classify_many(["puppet_1", "nation"]) == {}
+
+@pytest.mark.parametrize("patterns", ["moderator", [""], [3], {"moderator": True}, ["(unclosed"]])
+def test_rules_have_to_be_lists_of_patterns(patterns):
+    with pytest.raises(ValueError):
+        app.NameFilter({"bad_name": patterns})
+
+def test_misconfigured_rules_are_ignored(runtime):
+    runtime["recruiting"]["filters"] = {"bad_name": "moderator", "puppet": ["puppet"], "number": []}
+    app.load_name_filter()
+    # The string is not split into a character class, which would catch "dom"
+    assert app.name_filter.classify("dominion") is None
+    assert app.name_filter.classify("moderator") is None
+    assert app.name_filter.classify("puppet_a")[0] == "puppet"
+    assert app.name_filter.rules == ["puppet"]
+
+@pytest.mark.parametrize("filters", [{}, None])
+def test_empty_filters_turn_the_filter_off(runtime, filters):
+    runtime["recruiting"]["filters"] = filters
+    app.load_name_filter()
+    assert app.name_filter.classify("puppet_1") is None
+
+def test_filters_that_are_not_a_mapping_fall_back_to_the_built_in_rules(runtime):
+    runtime["recruiting"]["filters"] = ["puppet"]
+    app.load_name_filter()
+    assert app.name_filter.rules == list(app.NAME_FILTERS)
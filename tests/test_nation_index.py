@@ -0,0 +1,139 @@
+#    headlessNSPythonRecruiter
+#    Tests of the memory mapped index of the daily nations dump.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import gzip
+import os
+import pytest
+import app
+
+def write_dump(path, nations):
+
+    """Write a gzipped nations dump of (name, region, unstatus, founded, last login)"""
+
+    with gzip.open(path, 'wt', encoding="utf-8") as dump_file:
+        dump_file.write('<NATIONS api_version="12">\n')
+        for name, region, unstatus, founded, last_login in nations:
+            dump_file.write(
+                f"<NATION><NAME>{name}</NAME><REGION>{region}</REGION><UNSTATUS>{unstatus}</UNSTATUS>"
+                f"<FOUNDEDTIME>{founded}</FOUNDEDTIME><LASTLOGIN>{last_login}</LASTLOGIN></NATION>\n")
+        dump_file.write("</NATIONS>\n")
+
+def nations(count):
+
+    """Synthetic nations of a dump"""
+
+    return [(f"Nation {number}", "Puppet Storage" if number % 5 == 0 else "The Pacific", "WA Member" if number % 3 == 0 else "Non-member", 1000 + number, 5000 + number) for number in range(count)]
+
+@pytest.fixture
+def index(tmp_path, virtual_clock):
+
+    """Index of a dump large enough to be sorted in several runs"""
+
+    write_dump(tmp_path / "nations.xml.gz", nations(500))
+    assert app.NationIndex.build(str(tmp_path / "nations.xml.gz"), str(tmp_path / "nations.idx"), run_size=64) == 500
+    return app.NationIndex(str(tmp_path / "nations.idx"))
+
+def test_lookups(index):
+    assert len(index) == 500
+    for number in range(500):
+        facts = index.get(f"nation_{number}")
+        assert facts == {
+            "founded": 1000 + number,
+            "last_login": 5000 + number,
+            "region": "puppet_storage" if number % 5 == 0 else "the_pacific",
+            "wa": number % 3 == 0,
+        }
+    assert index.get("nation_500") is None
+
+def test_header_is_validated(tmp_path, index):
+    data = (tmp_path / "nations.idx").read_bytes()
+    (tmp_path / "bad_magic.idx").write_bytes(b"XXXX" + data[4:])
+    with pytest.raises(ValueError):
+        app.NationIndex(str(tmp_path / "bad_magic.idx"))
+    records = app.NationIndex.HEADER.unpack_from(data, 0)[1]
+    (tmp_path / "bad_records.idx").write_bytes(app.NationIndex.HEADER.pack(app.NationIndex.MAGIC, records + 1, *app.NationIndex.HEADER.unpack_from(data, 0)[2:]) + data[app.NationIndex.HEADER.size:])
+    with pytest.raises(ValueError):
+        app.NationIndex(str(tmp_path / "bad_records.idx"))
+
+def test_newer_dump_is_noticed_and_swapped_in(tmp_path, index):
+    dump_path = str(tmp_path / "nations.xml.gz")
+    assert index.built_from(dump_path)
+    write_dump(dump_path, nations(10) + [("Fresh Nation", "Osiris", "Non-member", 9000, 9001)])
+    assert not index.built_from(dump_path)
+    app.NationIndex.build(dump_path, str(tmp_path / "nations.idx"))
+    index.reopen(force=True)
+    assert len(index) == 11
+    assert index.get("fresh_nation")["region"] == "osiris"
+    assert index.get("nation_400") is None
+    assert index.built_from(dump_path)
+    assert not os.path.exists(str(tmp_path / "nations.idx.tmp"))
+
+def test_replaced_dump_is_indexed_again_in_the_background(tmp_path, monkeypatch, virtual_clock):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(app, "logger", app.Logger())
+    monkeypatch.setattr(app, "nation_index_attempted", None)
+    dump_path = str(tmp_path / "nations.xml.gz")
+    write_dump(dump_path, nations(10))
+    app.NationIndex.build(dump_path, str(tmp_path / "nations.idx"))
+    index = app.NationIndex(str(tmp_path / "nations.idx"), dump_path)
+    monkeypatch.setattr(app, "nation_index", index)
+    write_dump(dump_path, nations(10) + [("Fresh Nation", "Osiris", "Non-member", 9000, 9001)])
+    assert index.get("fresh_nation") is None # Not checked again before the interval
+    virtual_clock.sleep(app.NATION_INDEX_RELOAD_INTERVAL)
+    index.get("nation_1")
+    # A second check while the first build runs or after it finished does not start another one
+    app.start_nation_index_rebuild(dump_path, str(tmp_path / "nations.idx"))
+    with app.nation_index_lock:
+        pass
+    assert index.get("fresh_nation")["region"] == "osiris"
+    assert index.built_from(dump_path)
+    assert not os.path.exists(str(tmp_path / "nations.idx.tmp"))
+
+def test_index_rules(tmp_path, monkeypatch, virtual_clock):
+    dumped = virtual_clock.time()
+    dump_path = str(tmp_path / "nations.xml.gz")
+    write_dump(dump_path, [
+        ("Active Nation", "The Pacific", "Non-member", dumped - 10 * 86400, dumped - 86400),
+        ("Idle Nation", "The Pacific", "Non-member", dumped - 10 * 86400, dumped - 20 * 86400),
+        ("Ancient Nation", "The Pacific", "Non-member", dumped - 1000 * 86400, dumped - 86400),
+        ("Stored Nation", "Puppet Storage", "Non-member", dumped - 10 * 86400, dumped - 86400),
+    ])
+    os.utime(dump_path, (dumped, dumped))
+    app.NationIndex.build(dump_path, str(tmp_path / "nations.idx"))
+    index = app.NationIndex(str(tmp_path / "nations.idx"))
+    assert index.dumped == dumped
+    monkeypatch.setattr(app, "nation_index", index)
+    rules = {}
+    monkeypatch.setattr(app, "config", {"recruiting": {"nation_index": rules}}, raising=False)
+    # Nothing is skipped by default
+    assert all(app.index_rule(nation) is None for nation in ("active_nation", "idle_nation", "ancient_nation", "stored_nation"))
+    rules.update(skip_regions=["Puppet Storage"], max_inactive_days=14, max_age_days=365)
+    assert app.index_rule("stored_nation") == "puppet_region"
+    assert app.index_rule("idle_nation") == "inactive"
+    assert app.index_rule("ancient_nation") == "founded_long_ago"
+    assert app.index_rule("active_nation") is None
+    assert app.index_rule("new_nation") is None # Founded after the dump
+    # Ages are measured as of the dump, however old it gets
+    virtual_clock.sleep(100 * 86400)
+    assert app.index_rule("active_nation") is None
+    # The dump describes the previous life of a refounded nation
+    assert app.index_rule("idle_nation", "refounding") is None
+    assert app.index_rule("ancient_nation", "refounding") is None
+    assert app.index_rule("stored_nation", "refounding") == "puppet_region"
+    assert app.index_rule("idle_nation", "ejected") == "inactive"
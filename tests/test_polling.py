@@ -0,0 +1,70 @@
+#    headlessNSPythonRecruiter
+#    Tests of the polling intervals the candidate queue picks for each feed.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import app
+
+@pytest.fixture
+def queue(runtime):
+
+    """Candidate queue of a busy and a quiet feed, sharing 6 polls a minute"""
+
+    runtime["recruiting"]["polling"] = {"budget": 6, "min_interval": 1, "max_interval": 900}
+    return app.CandidateQueue([app.TargetSource("busy", "busy", r"@@(.+?)@@"), app.TargetSource("quiet", "quiet", r"@@(.+?)@@")])
+
+def observe(queue, source, every, now):
+
+    """Observe an hour of events of a source, one every so many seconds"""
+
+    for age in range(3600, 0, -every):
+        queue.rates[source].observe(now - age)
+
+def test_feeds_without_an_estimate_share_the_budget(queue):
+    assert queue.intervals(["filter=busy", "filter=quiet"]) == {"filter=busy": 20, "filter=quiet": 20}
+    assert queue.intervals(["filter=busy"]) == {"filter=busy": 10}
+
+def test_busier_feeds_are_polled_more_often(queue, virtual_clock):
+    observe(queue, "busy", 2, virtual_clock.time())
+    observe(queue, "quiet", 8, virtual_clock.time())
+    intervals = queue.intervals(["filter=busy", "filter=quiet"])
+    # In proportion to one over the square root of the rate, spending the whole budget
+    assert intervals["filter=quiet"] / intervals["filter=busy"] == pytest.approx(2, rel=0.05)
+    assert sum(1 / interval for interval in intervals.values()) == pytest.approx(0.1, rel=0.01)
+
+def test_quiet_feeds_are_not_polled_more_often_than_they_produce(queue, virtual_clock):
+    observe(queue, "busy", 2, virtual_clock.time())
+    observe(queue, "quiet", 600, virtual_clock.time())
+    intervals = queue.intervals(["filter=busy", "filter=quiet"])
+    assert intervals["filter=quiet"] >= 1 / queue.rates["quiet"].rate(virtual_clock.time())
+    assert intervals["filter=quiet"] > 300
+
+def test_intervals_stay_within_the_bounds(queue, virtual_clock):
+    observe(queue, "busy", 1, virtual_clock.time())
+    assert queue.intervals(["filter=busy"])["filter=busy"] == pytest.approx(10)
+    queue.budget = 100
+    queue.min_interval = 5
+    assert queue.intervals(["filter=busy"])["filter=busy"] == 5
+    queue.budget = 0
+    assert queue.intervals(["filter=busy", "filter=quiet"]) == {"filter=busy": 900, "filter=quiet": 900}
+
+def test_polled_feeds_are_due_after_their_interval(queue, virtual_clock):
+    queue.enqueue(["filter=busy"], [(1, virtual_clock.time(), "@@nation_a@@")])
+    assert queue.stale_feeds() == ["filter=quiet"]
+    virtual_clock.sleep(queue.intervals(queue.polled_feeds())["filter=busy"])
+    assert set(queue.stale_feeds()) == {"filter=busy", "filter=quiet"}
@@ -0,0 +1,91 @@
+#    headlessNSPythonRecruiter
+#    Tests of the sliding window rate limits and the scheduler routing requests through them.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import pytest
+import app
+
+def test_no_more_than_capacity_in_any_window(virtual_clock):
+    window = app.SlidingWindow(3, 30)
+    made = []
+    for _ in range(10):
+        window.acquire()
+        made.append(virtual_clock.monotonic())
+    for start in made:
+        assert sum(start <= time < start + 30 for time in made) <= 3
+    # Three in a burst, then each waits for the request three places before it to leave the window
+    assert [time - made[0] for time in made[:6]] == [0, 0, 0, 30, 30, 30]
+
+def test_block_from_the_headers(virtual_clock):
+    window = app.SlidingWindow(5, 30)
+    window.observe(retry_after=10)
+    assert window.ready_in() == 10
+    assert window.acquire() == 10
+    window.observe(remaining=0, reset=45)
+    assert window.ready_in() == 45
+
+def test_requests_counted_elsewhere_take_slots(virtual_clock):
+    window = app.SlidingWindow(5, 30)
+    window.observe(remaining=2)
+    assert window.acquire() == 0
+    assert window.acquire() == 0
+    assert window.acquire() == 30
+
+def test_reserved_slot_moves_past_a_later_block(virtual_clock):
+    window = app.SlidingWindow(5, 30)
+    slot = window.reserve()
+    window.observe(retry_after=8)
+    assert window.recheck(slot) == slot + 8
+
+def test_refund_gives_the_slot_back(virtual_clock):
+    window = app.SlidingWindow(1, 180)
+    window.acquire()
+    assert window.ready_in() == 180
+    window.refund()
+    assert window.ready_in() == 0
+
+def test_state_survives_a_restart(virtual_clock):
+    window = app.SlidingWindow(1, 180)
+    window.acquire()
+    window.observe(retry_after=300)
+    state = window.state()
+    restored = app.SlidingWindow(1, 180)
+    restored.restore(state, 60)
+    assert restored.ready_in() == 240
+    # Checkpoints of the token buckets held the tokens left
+    restored = app.SlidingWindow(1, 180)
+    restored.restore({"tokens": 0, "blocked_for": 0}, 60)
+    assert restored.ready_in() == 120
+
+def test_telegrams_count_against_the_general_limit(runtime, virtual_clock):
+    scheduler = app.RateLimitScheduler()
+    scheduler.add_bucket("telegram:key", 1, 180)
+    scheduler.acquire("telegram:key")
+    assert len(scheduler.buckets["api"].slots) == 1
+    assert scheduler.buckets["telegram:key"].ready_in() == 180
+    # A refused telegram gives its slot back and only waits out Retry-After
+    scheduler.observe("telegram:key", app.BufferedResponse(429, {"Retry-After": "7"}, b""))
+    assert scheduler.buckets["telegram:key"].ready_in() == 7
+    scheduler.refund("api")
+    assert len(scheduler.buckets["api"].slots) == 1
+
+def test_period_changes_keep_the_requests_made(virtual_clock):
+    window = app.SlidingWindow(1, 180)
+    window.acquire()
+    window.set_period(30)
+    assert window.ready_in() == pytest.approx(30)
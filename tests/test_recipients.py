@@ -0,0 +1,94 @@
+#    headlessNSPythonRecruiter
+#    Tests of the individual and blocked nation lists and their hot reload.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import pytest
+import yaml
+import app
+
+@pytest.fixture
+def recipients(tmp_path, monkeypatch, runtime):
+
+    """Recipients listed in config.yml and in the nation files"""
+
+    runtime["recruiting"].update(individual_nations=["Nation A", "nation_b"], blocked_nations=["Nation C"])
+    (tmp_path / "config.yml").write_text(yaml.dump(runtime), encoding="utf-8")
+    (tmp_path / "individual_nations.txt").write_text("nation_c\nNation D, nation_e # bulk list\n", encoding="utf-8")
+    monkeypatch.setattr(app, "tg_sent_history", app.SentHistory(str(tmp_path / "sent_history.log")))
+    monkeypatch.setattr(app, "tg_claimed", set())
+    monkeypatch.setattr(app, "tg_skipped", app.RecentSkips())
+    return app.Recipients(str(tmp_path / "individual_nations.txt"), str(tmp_path / "blocked_nations.txt"), interval=10)
+
+def touch(path, seconds):
+
+    """Move the modification time of a file, so a rewrite within one timestamp tick is noticed"""
+
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + int(seconds * 1e9)))
+
+def test_bulk_lists_are_read_as_canonical_names():
+    nations_file = io.StringIO("Nation A, nation_b\n# a comment\n\n  Nation C  # trailing\n")
+    assert list(app.read_nations(nations_file)) == ["nation_a", "nation_b", "nation_c"]
+
+def test_lists_merge_config_and_file_in_order(recipients):
+    assert list(recipients.individual) == ["nation_a", "nation_b", "nation_c", "nation_d", "nation_e"]
+    assert "nation_c" in recipients.blocked
+    assert "Nation A" not in recipients.individual # Lookups take canonical names
+
+def test_individual_nations_are_messaged_in_order_once(recipients):
+    assert recipients.next_individual() == "nation_a"
+    app.tg_claimed.add("nation_a")
+    assert recipients.next_individual() == "nation_b"
+    app.tg_sent_history.add("nation_a")
+    app.tg_claimed.discard("nation_a")
+    app.tg_skipped.add("nation_b")
+    # Blocked nations are never messaged, even when listed individually
+    assert recipients.next_individual() == "nation_d"
+
+def test_add_and_block_move_nations_between_the_lists(tmp_path, recipients):
+    assert recipients.add("Nation C") is True # Listed in config.yml, which the caller rewrites
+    assert "nation_c" not in recipients.blocked
+    assert recipients.block("nation_d") is False
+    assert "nation_d" in recipients.blocked
+    assert "nation_d" not in recipients.individual
+    assert "nation_d" not in (tmp_path / "individual_nations.txt").read_text(encoding="utf-8")
+    assert (tmp_path / "blocked_nations.txt").read_text(encoding="utf-8") == "nation_d\n"
+    assert recipients.individual.add(["nation_e", "Nation F", "nation_f"]) == 1
+
+def test_edited_files_are_reloaded_after_the_interval(tmp_path, recipients, virtual_clock):
+    blocked_path = tmp_path / "blocked_nations.txt"
+    blocked_path.write_text("nation_a\n", encoding="utf-8")
+    assert recipients.next_individual() == "nation_a" # Not checked again within the interval
+    virtual_clock.sleep(10)
+    assert recipients.next_individual() == "nation_b"
+    config = yaml.safe_load((tmp_path / "config.yml").read_text(encoding="utf-8"))
+    config["recruiting"]["individual_nations"] = ["Nation Z"]
+    (tmp_path / "config.yml").write_text(yaml.dump(config), encoding="utf-8")
+    touch(tmp_path / "config.yml", 1)
+    virtual_clock.sleep(10)
+    assert recipients.next_individual() == "nation_z"
+    assert list(recipients.individual) == ["nation_z", "nation_c", "nation_d", "nation_e"]
+
+def test_unreadable_config_keeps_the_lists(tmp_path, recipients, virtual_clock):
+    (tmp_path / "config.yml").write_text("recruiting: [", encoding="utf-8")
+    touch(tmp_path / "config.yml", 1)
+    virtual_clock.sleep(10)
+    recipients.watch()
+    assert "nation_a" in recipients.individual
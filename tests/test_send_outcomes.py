@@ -0,0 +1,104 @@
+#    headlessNSPythonRecruiter
+#    Tests of the outcomes of sendTG requests and how they are accounted for.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import pytest
+import requests
+import app
+
+@pytest.fixture
+def lane(tmp_path, monkeypatch, runtime):
+
+    """Sending lane of a recruiter whose API answers from a fixture"""
+
+    monkeypatch.setattr(app, "tg_sent_history", app.SentHistory(str(tmp_path / "sent_history.log")))
+    monkeypatch.setattr(app, "tg_skipped", app.RecentSkips())
+    monkeypatch.setattr(app, "scheduler", app.RateLimitScheduler())
+    monkeypatch.setattr(app, "eligibility", app.EligibilityService(str(tmp_path / "eligibility_cache.log")))
+    return app.SendLane("Lane 1", "key")
+
+def answer(tmp_path, monkeypatch, status, body=""):
+
+    """Answer sendTG requests with a status and body"""
+
+    fixture_path = tmp_path / "fixture.json"
+    fixture_path.write_text(json.dumps({"responses": [{"match": "sendTG", "status": status, "body": body}]}), encoding="utf-8")
+    monkeypatch.setattr(app, "api_client", app.APIClient(app.scheduler, app.FixtureTransport(str(fixture_path))))
+
+TELEGRAM = {"name": "A", "tgid": "1", "tgsecretkey": "secret", "type": "Recruitment"}
+
+@pytest.mark.parametrize("status, body, outcome", [
+    (200, "queued", "queued"),
+    (429, "", "rate_limited"),
+    (503, "", "transport_error"),
+    (404, "", "nonexistent"),
+    (200, "Unknown nation", "nonexistent"),
+    (403, "", "rejected"),
+    (200, "The nation has blocked telegrams", "rejected"),
+])
+def test_outcome_of_a_response(status, body, outcome):
+    assert app.telegram_outcome(app.BufferedResponse(status, {}, body.encode("utf-8"))) == outcome
+
+def test_only_failed_connections_are_connect_errors():
+    assert app.connect_failed(requests.ConnectTimeout())
+    assert not app.connect_failed(requests.ReadTimeout())
+    assert not app.connect_failed(requests.ConnectionError("Connection aborted."))
+    assert not app.connect_failed(ValueError())
+    try:
+        app.RequestsTransport(retries=0).get("http://127.0.0.1:1/", timeout=5)
+    except requests.ConnectionError as e:
+        assert app.connect_failed(e)
+
+def test_sent_telegram_keeps_the_cooldown(tmp_path, monkeypatch, lane):
+    answer(tmp_path, monkeypatch, 200, "queued")
+    assert app.send_telegram("nation_a", TELEGRAM, lane) == "queued"
+    assert app.tg_amt == 1
+    assert "nation_a" in app.tg_sent_history
+    assert app.scheduler.buckets[lane.bucket].ready_in() == app.RECRUITMENT_TELEGRAM_RATELIMIT
+
+def test_ambiguous_failure_keeps_the_cooldown(tmp_path, monkeypatch, lane):
+    answer(tmp_path, monkeypatch, 503)
+    assert app.send_telegram("nation_a", TELEGRAM, lane) == "transport_error"
+    # It may have been sent, so it is not sent again
+    assert "nation_a" in app.tg_sent_history
+    assert app.scheduler.buckets[lane.bucket].ready_in() > 0
+
+@pytest.mark.parametrize("status, body", [(404, ""), (200, "The nation has blocked telegrams")])
+def test_unsent_telegram_gives_the_cooldown_back(tmp_path, monkeypatch, lane, status, body):
+    answer(tmp_path, monkeypatch, status, body)
+    app.send_telegram("nation_a", TELEGRAM, lane)
+    assert app.scheduler.buckets[lane.bucket].ready_in() == 0
+    assert "nation_a" not in app.tg_sent_history
+    assert "nation_a" in app.tg_skipped
+    assert app.eligibility.cached("nation_a", "recruit") is False
+
+def test_refused_credentials_keep_the_cooldown(tmp_path, monkeypatch, lane):
+    answer(tmp_path, monkeypatch, 403)
+    assert app.send_telegram("nation_a", TELEGRAM, lane) == "rejected"
+    assert app.scheduler.buckets[lane.bucket].ready_in() > 0
+    # The nation is not to blame
+    assert "nation_a" not in app.tg_sent_history
+    assert app.eligibility.cached("nation_a", "recruit") is None
+
+def test_failed_connection_gives_the_cooldown_back(monkeypatch, lane):
+    monkeypatch.setattr(app, "api_client", app.APIClient(app.scheduler, app.RequestsTransport(retries=0), base_url="http://127.0.0.1:1/"))
+    assert app.send_telegram("nation_a", TELEGRAM, lane) == "connect_error"
+    assert app.scheduler.buckets[lane.bucket].ready_in() == 0
+    assert "nation_a" not in app.tg_sent_history
+    assert "nation_a" in app.tg_skipped
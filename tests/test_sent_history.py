@@ -0,0 +1,99 @@
+#    headlessNSPythonRecruiter
+#    Tests of the sent history log and the candidates skipped recently.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import app
+
+def open_history(tmp_path, max_age_days=0):
+
+    """Sent history in a temporary directory, without an index"""
+
+    return app.SentHistory(str(tmp_path / "sent_history.log"), max_age_days)
+
+def test_nations_are_kept_across_restarts(tmp_path, virtual_clock):
+    history = open_history(tmp_path)
+    assert "nation_a" not in history
+    history.add("nation_a")
+    history.add("nation_b")
+    assert "nation_a" in history
+    history.file.close()
+    reopened = open_history(tmp_path)
+    assert "nation_a" in reopened and "nation_b" in reopened
+    assert "nation_c" not in reopened
+    assert len(reopened) == 2
+
+def test_nations_expire_after_the_maximum_age(tmp_path, virtual_clock):
+    history = open_history(tmp_path, max_age_days=1)
+    history.add("nation_old")
+    virtual_clock.sleep(86400 / 2)
+    history.add("nation_new")
+    virtual_clock.sleep(86400 / 2 + 1)
+    assert "nation_old" not in history
+    assert "nation_new" in history
+    history.file.close()
+    reopened = open_history(tmp_path, max_age_days=1)
+    assert "nation_old" not in reopened
+    assert len(reopened) == 1
+
+def test_damaged_lines_are_skipped(tmp_path, virtual_clock):
+    (tmp_path / "sent_history.log").write_text(f"{virtual_clock.time()}\tnation_a\nnot a line\n", encoding="utf-8")
+    history = open_history(tmp_path)
+    assert "nation_a" in history
+    assert len(history) == 1
+    assert history.dead == 1
+
+def test_compaction_keeps_the_live_nations(tmp_path, virtual_clock):
+    history = app.SentHistory(str(tmp_path / "sent_history.log"), 0, str(tmp_path / "sent_history.idx"))
+    for nation in ("nation_a", "nation_b", "nation_a"):
+        history.add(nation)
+    assert history.dead == 1
+    history.compact()
+    assert history.dead == 0
+    assert len((tmp_path / "sent_history.log").read_text(encoding="utf-8").splitlines()) == 2
+    reopened = app.SentHistory(str(tmp_path / "sent_history.log"), 0, str(tmp_path / "sent_history.idx"))
+    assert reopened.index is not None
+    assert reopened.entries == {}
+    assert "nation_a" in reopened and "nation_b" in reopened
+
+def test_skips_expire(virtual_clock):
+    skipped = app.RecentSkips(ttl=60)
+    skipped.add("nation_a")
+    assert "nation_a" in skipped
+    virtual_clock.sleep(30)
+    skipped.add("nation_b")
+    virtual_clock.sleep(31)
+    assert "nation_a" not in skipped
+    assert "nation_b" in skipped
+    # Expired skips are forgotten as new ones come in
+    skipped.add("nation_c")
+    assert len(skipped) == 2
+
+def test_upkeep_compacts_a_mostly_dead_log(tmp_path, virtual_clock):
+    history = open_history(tmp_path)
+    history.add("nation_a")
+    history.upkeep()
+    assert len((tmp_path / "sent_history.log").read_text(encoding="utf-8").splitlines()) == 1
+    for _ in range(3):
+        history.add("nation_b")
+    history.upkeep()
+    assert history.dead == 2 # Not compacted while most of the log is live
+    history.add("nation_b")
+    history.upkeep()
+    assert history.dead == 0
+    assert len((tmp_path / "sent_history.log").read_text(encoding="utf-8").splitlines()) == 2
+    assert "nation_a" in history and "nation_b" in history
@@ -0,0 +1,96 @@
+#    headlessNSPythonRecruiter
+#    Tests of the happenings server-sent events stream.
+#    By Clarissa Au @ clarissayuenyee@gmail.com
+#    Under GNU GPL v3.0 License
+#    Copyright (C) 2023 Clarissa Au
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import app
+
+def events(text):
+
+    """Parse a stream given as text"""
+
+    return list(app.iter_server_sent_events(text.encode("utf-8").splitlines()))
+
+def test_blank_line_dispatches_an_event():
+    assert events('data: {"str": "a"}\n\ndata: {"str": "b"}\n') == [(0, '{"str": "a"}')]
+
+def test_comments_and_unknown_fields_are_ignored():
+    assert events(': keepalive\nevent: happening\nretry: 1000\ndata: a\n\n:\n\n') == [(0, "a")]
+
+def test_data_lines_are_joined():
+    assert events("data: first\ndata:second\ndata\n\n") == [(0, "first\nsecond\n")]
+
+def test_last_event_id_carries_over():
+    assert events("id: 5\ndata: a\n\ndata: b\n\nid: x\ndata: c\n\n") == [(5, "a"), (5, "b"), (0, "c")]
+
+def test_lines_are_decoded_as_utf8():
+    assert events('data: {"str": "@@nätion_ä@@ was founded"}\n\n') == [(0, '{"str": "@@nätion_ä@@ was founded"}')]
+    assert list(app.iter_server_sent_events([b"data: \xff", b""])) == [(0, "\ufffd")]
+
+class Candidates():
+
+    """Candidate queue without sources, resuming after event 1001"""
+
+    sources = []
+
+    def last_seen(self, feeds):
+
+        """ID of the last event seen"""
+
+        return 1001
+
+class StreamHandler(BaseHTTPRequestHandler):
+
+    """Serves two events as a text/event-stream without a charset"""
+
+    def do_GET(self):
+
+        """Answer a subscription"""
+
+        self.server.last_event_id = self.headers.get("Last-Event-ID")
+        body = 'id: 1002\ndata: {"str": "@@nätion_a@@ was founded in %%the_pacific%%."}\n\n'.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        """Keep requests out of the test output"""
+
+@pytest.fixture
+def server():
+
+    """Local server of the happenings stream"""
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_stream_resumes_and_decodes_names_as_utf8(runtime, server):
+    stream = app.HappeningsStream(Candidates(), url=f"http://127.0.0.1:{server.server_address[1]}")
+    pushed = []
+    stream.push = lambda event_id, data: pushed.append((event_id, data))
+    stream.listen(app.Backoff(1, 2))
+    assert server.last_event_id == "1001"
+    assert pushed == [(1002, '{"str": "@@nätion_a@@ was founded in %%the_pacific%%."}')]